@@ -0,0 +1,328 @@
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+from backend import sensors_manager
+
+# Line terminator used by the Arduino's Serial.println()
+EOL = b"\r\n"
+
+
+class VirtualArduino(object):
+    """
+    Software stand-in for the Arduino that drives the sensor ring. It speaks the same START/STARTREC/STOP/STOPREC
+    protocol and emits ";"-separated frames: one reading per IR sensor followed by the ultrasonic Z reading.
+
+    It implements the subset of the serial.Serial API used by sensors_manager (write, readline, close,
+    reset_input_buffer, is_open), so it can be plugged in with install(), or exposed as a pseudo-terminal with
+    open_pty() for code that opens a real port.
+
+    :param sensors: number of IR sensors driven by this board
+    :param first_sensor: position in the ring of this board's first sensor, when several boards share the ring
+    :param ring_sensors: number of IR sensors in the whole ring; defaults to sensors
+    :param rate: frames per second; None streams as fast as frames are read
+    :param noise: standard deviation (cm) of the gaussian noise added to each reading
+    :param spike_rate: probability of a single reading being replaced by an outlier
+    :param spike_size: maximum size (cm) of an outlier
+    :param dropout: probability of a whole frame being lost on the wire
+    :param ring_diameter: diameter (cm) of the ring structure the sensors are mounted on
+    :param pole_radius: radius (cm) of the simulated pole or calibration object
+    :param pole_center: (x, y) position (cm) of the pole's center, relative to the ring's center
+    :param z: ultrasonic reading (cm) of the carriage position
+    :param z_speed: carriage speed (cm/s); z changes while streaming
+    :param max_range: reading reported by a sensor that sees nothing
+    :param seed: seed for the random generators, for repeatable scenarios
+    """
+
+    def __init__(self, sensors=12, first_sensor=0, ring_sensors=None, rate=20.0, noise=0.05, spike_rate=0.0, spike_size=5.0, dropout=0.0,
+                 ring_diameter=32.0, pole_radius=5.0, pole_center=(0.0, 0.0), z=10.0, z_speed=0.0,
+                 max_range=30.0, seed=None):
+        self.sensors = sensors
+        self.first_sensor = first_sensor
+        self.ring_sensors = sensors if ring_sensors is None else ring_sensors
+        self.rate = rate
+        self.noise = noise
+        self.spike_rate = spike_rate
+        self.spike_size = spike_size
+        self.dropout = dropout
+        self.ring_diameter = ring_diameter
+        self.pole_radius = pole_radius
+        self.pole_center = pole_center
+        self.z = z
+        self.z_speed = z_speed
+        self.max_range = max_range
+
+        self.random = random.Random(seed)
+        self.np_random = np.random.RandomState(seed)
+
+        self.is_open = False
+        self.streaming = False
+
+        # control replies waiting to be read, and unprocessed command bytes
+        self.pending = []
+        self.command_buffer = b""
+
+        # time at which the next frame is due
+        self.next_frame_time = 0.0
+        self.last_z_update = 0.0
+
+        # stats
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+        self.lock = threading.Lock()
+
+    def open(self):
+        self.is_open = True
+        return self
+
+    def close(self):
+        with self.lock:
+            self.is_open = False
+            self.streaming = False
+            self.pending = []
+            self.command_buffer = b""
+
+    def reset_input_buffer(self):
+        with self.lock:
+            # skip the frames that would have piled up in the OS buffer
+            self.next_frame_time = time.perf_counter()
+
+    def write(self, data):
+        with self.lock:
+            self.command_buffer += bytes(data)
+
+            # Process every complete command in the buffer
+            while True:
+                start = self.command_buffer.find(b"START")
+                stop = self.command_buffer.find(b"STOP")
+                found = [i for i in (start, stop) if i >= 0]
+                if not found:
+                    break
+
+                if min(found) == start:
+                    self.command_buffer = self.command_buffer[start + len(b"START"):]
+                    self.pending.append(b"STARTREC" + EOL)
+                    self.streaming = True
+                    self.next_frame_time = time.perf_counter()
+                    self.last_z_update = self.next_frame_time
+                else:
+                    self.command_buffer = self.command_buffer[stop + len(b"STOP"):]
+                    self.pending.append(b"STOPREC" + EOL)
+                    self.streaming = False
+
+        return len(data)
+
+    def readline(self):
+        """
+        Blocks until the next frame is due, like a port with no timeout. Returns an empty line when the device is
+        not streaming and has nothing else to say, like a port that timed out.
+        """
+        while True:
+            with self.lock:
+                if self.pending:
+                    return self.pending.pop(0)
+
+                if not self.is_open or not self.streaming:
+                    return b""
+
+                now = time.perf_counter()
+                wait = self.next_frame_time - now if self.rate else 0.0
+
+                if wait <= 0.0:
+                    if self.rate:
+                        # a real serial buffer doesn't hold more than about a second of data
+                        self.next_frame_time = max(self.next_frame_time, now - 1.0) + 1.0 / self.rate
+
+                    # move the carriage
+                    self.z += self.z_speed * (now - self.last_z_update)
+                    self.last_z_update = now
+
+                    # frame lost on the wire
+                    if self.dropout and self.random.random() < self.dropout:
+                        self.frames_dropped += 1
+                        continue
+
+                    self.frames_sent += 1
+                    return self.format_frame(self.generate_frame())
+
+            time.sleep(wait)
+
+    def expected_readings(self):
+        """
+        Noise-free IR readings for the current geometry: the distance from each sensor, pointing at the center of
+        the ring, to the surface of the pole.
+
+        :return: numpy array with one reading per IR sensor
+        """
+        ring_radius = self.ring_diameter * 0.5
+        angles = 2.0 * np.pi * (self.first_sensor + np.arange(self.sensors)) / self.ring_sensors
+
+        # sensor positions, same layout as SensorBank.place_on_ring()
+        sx = np.cos(angles) * ring_radius
+        sy = np.sin(angles) * ring_radius
+        # unit vectors pointing at the center of the ring
+        ux = -np.cos(angles)
+        uy = -np.sin(angles)
+
+        # ray-circle intersection: |s + t*u - c| = pole_radius
+        dx = sx - self.pole_center[0]
+        dy = sy - self.pole_center[1]
+        b = dx * ux + dy * uy
+        c = dx * dx + dy * dy - self.pole_radius ** 2
+        discriminant = b * b - c
+
+        readings = np.full(self.sensors, self.max_range, dtype=float)
+        hit = discriminant >= 0
+        readings[hit] = -b[hit] - np.sqrt(discriminant[hit])
+
+        return np.clip(readings, 0.0, self.max_range)
+
+    def generate_frame(self):
+        readings = self.expected_readings()
+
+        if self.noise:
+            readings = readings + self.np_random.normal(0.0, self.noise, self.sensors)
+
+        if self.spike_rate:
+            spikes = self.np_random.random_sample(self.sensors) < self.spike_rate
+            readings[spikes] += self.np_random.uniform(-self.spike_size, self.spike_size, np.count_nonzero(spikes))
+
+        readings = np.clip(readings, 0.0, self.max_range)
+        z = self.z + (self.np_random.normal(0.0, self.noise) if self.noise else 0.0)
+
+        return np.append(readings, z)
+
+    @staticmethod
+    def format_frame(frame):
+        return (";".join("%.2f" % value for value in frame)).encode() + EOL
+
+    def open_pty(self):
+        """
+        Expose the simulator as a pseudo-terminal (POSIX only), so it can be opened as a regular serial port.
+
+        :return: path of the pseudo-terminal device
+        """
+        import pty
+        import select
+        import tty
+
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.open()
+
+        def serve():
+            try:
+                while self.is_open:
+                    # forward commands from the port to the simulator
+                    readable, _, _ = select.select([master], [], [], 0.0 if self.streaming else 0.1)
+                    if readable:
+                        self.write(os.read(master, 1024))
+
+                    line = self.readline()
+                    if line:
+                        os.write(master, line)
+            except OSError:
+                # the other side closed the port
+                pass
+
+        threading.Thread(target=serve, daemon=True).start()
+
+        return os.ttyname(slave)
+
+
+def install(**kwargs):
+    """
+    Replace the real Arduino with a VirtualArduino in sensors_manager.
+
+    :param kwargs: VirtualArduino settings
+    :return: the simulator, to change its geometry while it runs
+    """
+    device = VirtualArduino(**kwargs)
+    sensors_manager.setSerialBackend(lambda port: device.open(), ports=["VIRTUAL0"])
+
+    return device
+
+
+def install_many(boards, sensors=12, **kwargs):
+    """
+    Replace the real Arduinos with several VirtualArduinos that share the sensor ring, each one driving a
+    consecutive group of sensors and reporting its own Z reading.
+
+    :param boards: number of simulated Arduinos
+    :param sensors: number of IR sensors in the whole ring
+    :param kwargs: VirtualArduino settings
+    :return: the simulators
+    """
+    devices = []
+    for board in range(boards):
+        first = board * sensors // boards
+        last = (board + 1) * sensors // boards
+        devices.append(VirtualArduino(sensors=last - first, first_sensor=first, ring_sensors=sensors, **kwargs))
+
+    ports = ["VIRTUAL%s" % board for board in range(boards)]
+    sensors_manager.setSerialBackend(lambda port: devices[ports.index(port)].open(), ports=ports)
+
+    return devices
+
+
+def benchmark(multipliers=(1, 10, 100), base_rate=20.0, duration=2.0, sensors=12):
+    """
+    Measure live feed throughput and capture latency of the sensor stack at multiples of the real frame rate.
+
+    :return: list of dicts with the results for each rate
+    """
+    results = []
+
+    for multiplier in multipliers:
+        rate = base_rate * multiplier
+        device = install(sensors=sensors, rate=rate, seed=0)
+
+        try:
+            sensors_manager.openArduinoSerial()
+
+            # live feed
+            frames = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < duration:
+                sensors_manager.readSensorFrame()
+                frames += 1
+            throughput = frames / (time.perf_counter() - start)
+
+            # captures
+            latencies = []
+            for i in range(5):
+                device.reset_input_buffer()
+                start = time.perf_counter()
+                sensors_manager.getCleanSensorData()
+                latencies.append(time.perf_counter() - start)
+
+            sensors_manager.closeArduinoSerial()
+        finally:
+            sensors_manager.resetSerialBackend()
+
+        results.append({
+            "rate": rate,
+            "throughput": round(throughput, 1),
+            "capture_latency_ms": round(1000.0 * sum(latencies) / len(latencies), 2),
+            "frames_dropped": device.frames_dropped,
+        })
+
+    return results
+
+
+if __name__ == "__main__":
+    for result in benchmark():
+        print("%(rate)8.0f Hz: %(throughput)10.1f frames/s, capture %(capture_latency_ms)8.2f ms" % result)
+
+    # calibration scenario with known geometry: 5 cm calibration rod, centered
+    install(ring_diameter=32.0, pole_radius=5.0, noise=0.02, seed=1)
+    sensors_manager.openArduinoSerial()
+    sensors_manager.initSensors(structureRadius=16.0)
+    sensors_manager.calibrateAllSensors(testRadius=5.0, testDistance=10)
+    sensors_manager.closeArduinoSerial()
+    sensors_manager.resetSerialBackend()
+    print(sensors_manager.sensorBank.r.round(2).tolist())
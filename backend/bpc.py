@@ -1,19 +1,36 @@
+import logging
 import math
+import os
 
 import numpy as np
 
+from backend.capture_journal import CaptureJournal, journal_summary, replay_journal
+from backend.measurement_store import MeasurementStore
 from backend.utils import get_timestamp
 
+logger = logging.getLogger(__name__)
+
 sample_description = ""
-saved_measurement = []
+# captured measurements, sorted by Z
+saved_measurement = MeasurementStore()
 finalArray2 = []
-sensor_qty = 4
+
+# Every capture is journaled here until the session is saved, to restore it after a crash
+JOURNAL_PATH = os.path.join("sessions", "bpc_session.journal")
+journal = None
+# cleared if the journal can't be written; captures go on without it
+journaling = True
 
 # calibration settings
 ring_diameter = 0.0
 calibration_obj_radius = 0.0
 rail_z_distance = 0.0
 
+# temporal filter of the sensor frames, a name from sensor_filters.FILTERS
+frame_filter = "none"
+# captures sample each sensor until its reading is precise enough, instead of a fixed number of times
+adaptive_capture = False
+
 
 def get_calibration_settings():
     return ring_diameter, calibration_obj_radius, rail_z_distance
@@ -27,15 +44,44 @@ def set_calibration_settings(ringDiameter, obj_radius, distance_z):
     rail_z_distance = distance_z
 
 
+def get_filter_settings():
+    return frame_filter
+
+
+def set_filter_settings(name):
+    global frame_filter
+
+    frame_filter = name
+
+
+def get_capture_settings():
+    return adaptive_capture
+
+
+def set_capture_settings(adaptive):
+    global adaptive_capture
+
+    adaptive_capture = adaptive
+
+
 # Resets all global variables in case of a discard or return home
 def reset_bpc_backend():
     global sample_description, saved_measurement, sortedArray, finalArray, ring_diameter, calibration_obj_radius, rail_z_distance
+    global journal, journaling, frame_filter, adaptive_capture
     sample_description = ""
     saved_measurement.clear()
 
+    # close the journal but keep the file; discard_journal() deletes it when the user throws the session away
+    if journal is not None:
+        journal.close()
+    journal = None
+    journaling = True
+
     ring_diameter = 0.0
     calibration_obj_radius = 0.0
     rail_z_distance = 0.0
+    frame_filter = "none"
+    adaptive_capture = False
     # finalArray.clear()
     # sortedArray.clear()
 
@@ -50,16 +96,99 @@ def set_sampleDescription(description):
 def save_measurements(array):
     global saved_measurement
 
-    saved_measurement.append(array)
+    # journal first, so the capture is on disk before anyone sees it
+    write_journal(lambda j: j.append_add(array), width=len(array))
+
+    saved_measurement.add(array)
+
+
+# Session metadata saved in the journal
+def get_session_metadata():
+    return {
+        "sample_description": sample_description,
+        "ring_diameter": ring_diameter,
+        "calibration_obj_radius": calibration_obj_radius,
+        "rail_z_distance": rail_z_distance,
+        "frame_filter": frame_filter,
+        "adaptive_capture": adaptive_capture,
+        "created": get_timestamp().strip(),
+    }
+
+
+# Applies an operation to the journal, starting a new one with the first capture of a session.
+def write_journal(operation, width=None):
+    global journal, journaling
+
+    if not journaling:
+        return
+
+    try:
+        if journal is None:
+            if width is None:
+                return
+            journal = CaptureJournal.create(JOURNAL_PATH, width, get_session_metadata())
+        operation(journal)
+
+    except (IOError, OSError) as e:
+        # losing the journal shouldn't stop the captures
+        logger.warning("Capture journal disabled: %s", e)
+        journaling = False
+
+
+# Number of captures of a session that was not saved, or 0 if there's none to restore
+def find_unsaved_session():
+    if not os.path.isfile(JOURNAL_PATH):
+        return 0
+
+    try:
+        (metadata, captures) = journal_summary(JOURNAL_PATH)
+        return captures
+    except (IOError, OSError, ValueError) as e:
+        logger.warning("Can't read the capture journal: %s", e)
+        return 0
+
 
+# Rebuilds the unsaved session from the journal, and keeps journaling to it
+def restore_session():
+    global journal, sample_description, ring_diameter, calibration_obj_radius, rail_z_distance, frame_filter
+    global adaptive_capture
 
-# Sorts the measurements list for preview display and text file generation.
+    reset_bpc_backend()
+
+    metadata = replay_journal(JOURNAL_PATH, saved_measurement)
+    sample_description = metadata.get("sample_description", "")
+    ring_diameter = metadata.get("ring_diameter", 0.0)
+    calibration_obj_radius = metadata.get("calibration_obj_radius", 0.0)
+    rail_z_distance = metadata.get("rail_z_distance", 0.0)
+    frame_filter = metadata.get("frame_filter", "none")
+    adaptive_capture = metadata.get("adaptive_capture", False)
+
+    journal = CaptureJournal.resume(JOURNAL_PATH)
+
+    return len(saved_measurement)
+
+
+# Deletes the journal once the session is safely saved, or when the user throws it away
+def discard_journal():
+    global journal
+
+    if journal is not None:
+        journal.discard()
+        journal = None
+    elif os.path.isfile(JOURNAL_PATH):
+        try:
+            os.remove(JOURNAL_PATH)
+        except OSError as e:
+            logger.warning("Can't delete the capture journal: %s", e)
+
+
+# Sorts a list of measurements by Z, their last element. The measurement store is always sorted.
 def sort_ByZeta(array):
+    if isinstance(array, MeasurementStore):
+        return array
     if not array:
-        print("Array must not be empty")
-    array.sort(key=lambda x: x[len(array) - 1])
-    # print("SORTED BY ZETA")
-    # print(array)
+        logger.warning("Array must not be empty")
+    array.sort(key=lambda x: x[-1])
     return array
 
 
@@ -67,140 +196,137 @@ def sort_ByZeta(array):
 # the result is average diameter
 def average_diameter(index, array):
     if index < 0:
-        print("Index must not be negative or out of index of slice ")
+        logger.warning("Index must not be negative or out of index of slice")
     if not array:
-        print("Array must not be empty.")
-    avg_d = 0
-    for i in range(0, len(array[index]) - 1):
-        print(array[index][i])
-        avg_d += (array[index][i]) * 2
-    avg_d = round((avg_d / (len(array[index]) - 1)), 2)
-    # print("AVERAGE DIAMETER")
-    # print(avg_d)
-    return avg_d
+        logger.warning("Array must not be empty")
+
+    return round(float(slices_geometry([array[index]])["average_diameters"][0]), 2)
 
 
 # Reads the Z-axis value for a determined index, used for preview and generate text file
 def read_ultrasonic(index, array):
     if index < 0:
-        print("Index must not be negative or out of index of slice ")
+        logger.warning("Index must not be negative or out of index of slice")
     if not array:
-        print("Array must not be empty ")
+        logger.warning("Array must not be empty")
     zeta = array[index][len(array[index]) - 1]
-    print("READ ZETA")
-    print(zeta)
     return zeta
 
 
-# Deletes the element 'index' at the given array
+# Deletes the measurements at the given indices
 def delete_measurement(array):
     global saved_measurement
-    if not array:
-        return saved_measurement
-    adjust = 0
-    for i in range(0, len(array)):
-        del saved_measurement[array[i]-adjust]
-        adjust += 1
+
+    write_journal(lambda j: j.append_delete(array))
+
+    saved_measurement.delete(array)
     return saved_measurement
 
 
+# Geometry of every captured slice in one vectorized pass. Each row of the array is a slice: the radius measured by
+# each IR sensor, respect to the ring's center, followed by Z. Sensors are evenly spread around the ring, starting at
+# 0 degrees. Nothing is rounded; see round_geometry().
+def slices_geometry(array):
+    data = np.asarray(array, dtype=float)
+    if data.ndim != 2 or data.shape[1] < 2:
+        raise ValueError("Expected one row per slice, with a reading per sensor followed by Z")
+
+    radii = data[:, :-1]
+    z = data[:, -1]
+    sensors = radii.shape[1]
+
+    # sensor directions, from the actual number of sensors
+    angles = 2.0 * np.pi * np.arange(sensors) / sensors
+
+    # slices x sensors x (x, y), with the ring's center at (0, 0)
+    xy = np.stack((radii * np.cos(angles), radii * np.sin(angles)), axis=-1)
+
+    # slices x (x, y)
+    centroids = xy.mean(axis=1)
+
+    # slices x sensors x (r, theta in degrees), respect to each slice's centroid
+    relative = xy - centroids[:, np.newaxis, :]
+    polar = np.stack((np.hypot(relative[..., 0], relative[..., 1]),
+                      np.degrees(np.arctan2(relative[..., 1], relative[..., 0]))), axis=-1)
+
+    average_diameters = 2.0 * radii.mean(axis=1)
+
+    return {"z": z, "xy": xy, "centroids": centroids, "polar": polar, "average_diameters": average_diameters}
+
+
+# Rounds every array of a slices_geometry() result, for display or text files
+def round_geometry(geometry, decimals=2):
+    return {key: np.round(values, decimals) for (key, values) in geometry.items()}
+
+
 # Calulates te X and Y coordinates of the array of radius given by the Arduino respect to ring
 # where centroid is (0,0)
 def calculate_xy(index, array):
     if index < 0:
-        print("Index must not be negative or out of index of slice ")
+        logger.warning("Index must not be negative or out of index of slice")
     if not array:
-        print("Array must not be empty ")
-    data = array
-    angle = 0
-    increment = 360 / (sensor_qty - 1)
-    result_XY_coords = []
-    # print("SENSOR DATA")
-    # print(finalArray)
-    for j in range(0, len(data[index]) - 1):
-        x = round(data[index][j] * (math.cos(math.radians(angle))), 2)
-        y = round(data[index][j] * (math.sin(math.radians(angle))), 2)
-        angle += increment
-        result_XY_coords.append([x, y])
-    # print("XY COORDINATES REPECT TO CENTROIDE [0,0]")
-    # print(result_XY_coords)
-    return result_XY_coords
+        logger.warning("Array must not be empty")
+
+    return np.round(slices_geometry([array[index]])["xy"][0], 2).tolist()
 
 
 # Calculates the centroid of the object based an the X and Y coordinates
 # Where index is the slice of mesures and array the data from the sensors.
 def centroide_object(index, array):
     if index < 0:
-        print("Index must not be negative or out of index of slice ")
+        logger.warning("Index must not be negative or out of index of slice")
     if not array:
-        print("Array must not be empty ")
-    XY_from_zerozero = calculate_xy(index, array)
-    print("ARREGLO DE XY")
-    print(XY_from_zerozero)
-    x_T = []
-    y_T = []
-    for i in range(0, len(XY_from_zerozero)):
-        x_coord = XY_from_zerozero[i][0]
-        x_T.append(x_coord)
-    for j in range(0, len(XY_from_zerozero)):
-        y_coord = XY_from_zerozero[j][1]
-        y_T.append(y_coord)
-
-    object_centroid = [round(sum(x_T) / len(x_T), 2), round(sum(y_T) / len(y_T), 2)]
-    # print("CENTROIDE RESPECTO AL SLICE")
-    # print(object_centroid)
-    # plt.scatter(x_T, y_T)
-    # plt.show()
-    return object_centroid
+        logger.warning("Array must not be empty")
+
+    return np.round(slices_geometry([array[index]])["centroids"][0], 2).tolist()
 
 
 # This function calculates the polar coordinates with r in cm and theta in degrees.
 # It receives the X and Y coordinates of an object and its center respect to the ring
 def rect_to_polar(xy_array, center):
     if center[0] < -30 or center[0] > 30 or center[1] < -30 or center[1] > 30:
-        print("Center is out of bounds ")
+        logger.warning("Center is out of bounds")
     if not xy_array:
-        print("XY Array must not be empty ")
-
-    polar_coords = []
-    x_c = center[0]
-    y_c = center[1]
-    for i in range(0, len(xy_array)):
-        x_o = xy_array[i][0]
-        y_o = xy_array[i][1]
-        x_total = x_o - x_c
-        y_total = y_o - y_c
-        r = math.sqrt(float(np.square(x_total)) + float(np.square(y_total)))
-        r = round(r, 2)
-        theta = math.atan2(y_total, x_total)
-        theta = round(math.degrees(theta), 2)
-        polar_coords.append([r, theta])
-    print("COORDENADAS POLARES [RADIO, ANGULO] RESPECTO AL CENTRO DEL OBJETO")
-    print(polar_coords)
-    return polar_coords
-
-
-# Generates a text file in the proyect folder. It receives as a parameter the data from the sensors.
-# Then proceeds to call previous funcions for generating the zeta, polar coordinates, average diameter and centroide
-# of the object being measured.
-def generate_textfile(array):
-    # TODO update this
-    if not array:
-        print("XY Array must not be empty ")
-    array = sort_ByZeta(array)
-    f = open("Samples.txt", "w+")
-    f.write(sample_description)
-    f.write(get_timestamp())
-    f.write("Samples take %s \n" % (len(array)))
-    f.write(" ")
-    for i in range(0, len(array)):
-        center = centroide_object(i, array)
-        xy = calculate_xy(i, array)
-        polar = rect_to_polar(xy, center)
-        f.write(" |%s|  " % read_ultrasonic(i, array))
-        for j in range(0, len(polar)):
-            f.write("  %s  " % (polar[j]))
-        f.write("  Average Diameter |%s|" % average_diameter(i, array))
-        f.write("  Centroide del objeto [ %s , %s ] " % (center[0], center[1]))
-        f.write("\n ")
-    return
+        logger.warning("XY Array must not be empty")
+
+    relative = np.asarray(xy_array, dtype=float) - np.asarray(center, dtype=float)
+    r = np.hypot(relative[:, 0], relative[:, 1])
+    theta = np.degrees(np.arctan2(relative[:, 1], relative[:, 0]))
+
+    return np.round(np.column_stack((r, theta)), 2).tolist()
+
+
+# Generates a text file at the given path with the captured measurements, sorted by Z: for each one, the polar
+# coordinates, average diameter and centroid of the object being measured.
+# Returns True if the file was written.
+def generate_textfile(file_path):
+    if not saved_measurement:
+        logger.warning("There are no measurements to save")
+        return False
+
+    # geometry of all the slices at once
+    geometry = round_geometry(slices_geometry(saved_measurement.rows()))
+
+    try:
+        f = open(file_path, "w+")
+        f.write(sample_description)
+        f.write(get_timestamp())
+        f.write("Samples take %s \n" % (len(saved_measurement)))
+        f.write(" ")
+
+        for i in range(0, len(saved_measurement)):
+            center = geometry["centroids"][i].tolist()
+            polar = geometry["polar"][i].tolist()
+            f.write(" |%s|  " % geometry["z"][i])
+            for j in range(0, len(polar)):
+                f.write("  %s  " % (polar[j]))
+            f.write("  Average Diameter |%s|" % geometry["average_diameters"][i])
+            f.write("  Centroide del objeto [ %s , %s ] " % (center[0], center[1]))
+            f.write("\n ")
+
+        f.close()
+        return True
+
+    except IOError as e:
+        logger.error("I/O error(%s): %s", e.errno, e.strerror)
+        return False
@@ -1,10 +1,17 @@
+import logging
+import queue
 import threading
+import time
+
+import numpy as np
 
 from serial import SerialException
 
-from backend.bpc import save_measurements, get_calibration_settings
+from backend.bpc import save_measurements, get_calibration_settings, get_filter_settings, get_capture_settings
 from backend.sensors_manager import *
 
+logger = logging.getLogger(__name__)
+
 # Semaphore lock to guarantee only 1 thread at a time
 port_lock = threading.Semaphore()
 
@@ -15,107 +22,445 @@ disconnected = threading.Event()
 # Main program was closed
 main_quit = threading.Event()
 
+# Live feed thread states
+IDLE = "idle"                # port open (or opening), not reading
+LIVE = "live"                # reading sensors and publishing live frames
+CAPTURING = "capturing"      # capturing a measurement
+CALIBRATING = "calibrating"  # calibrating the sensors
+SCANNING = "scanning"        # live, and capturing whenever the carriage stops at a new Z
+CLOSING = "closing"          # closing the port; the thread is about to finish
+
+# Allowed state transitions
+TRANSITIONS = {
+    IDLE: (LIVE, CAPTURING, CALIBRATING, SCANNING, CLOSING),
+    LIVE: (IDLE, CAPTURING, CALIBRATING, SCANNING, CLOSING),
+    CAPTURING: (IDLE, LIVE, CLOSING),
+    CALIBRATING: (IDLE, LIVE, CLOSING),
+    SCANNING: (IDLE, LIVE, CLOSING),
+    CLOSING: (),
+}
+
+# Results the thread hands to the GUI
+CAPTURED = "captured"
+CALIBRATED = "calibrated"
+PROFILE_LOADED = "profile loaded"
+
+
+class LatestValueMailbox(object):
+    """
+    A single-slot channel for values of which only the newest matters, like live sensor frames. put() overwrites
+    the value waiting in the slot, so the consumer never falls behind and memory stays bounded. Values overwritten
+    before being taken are counted as dropped.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = None
+        self.full = False
+
+        # diagnostics
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def put(self, value):
+        with self.lock:
+            if self.full:
+                self.dropped += 1
+
+            self.value = value
+            self.full = True
+            self.published += 1
+
+    def take(self):
+        """
+        :return: the newest value, or None if there's nothing new since the last call
+        """
+        with self.lock:
+            if not self.full:
+                return None
+
+            value = self.value
+            self.value = None
+            self.full = False
+            self.delivered += 1
+
+            return value
+
+    def clear(self):
+        with self.lock:
+            self.value = None
+            self.full = False
+
+    def get_stats(self):
+        with self.lock:
+            return {"published": self.published, "delivered": self.delivered, "dropped": self.dropped}
+
+
+class CoalescedNotifier(object):
+    """
+    Wakes up a consumer from a worker thread without flooding it. notify() only calls wake() if the consumer has
+    acknowledged the previous wakeup, so any number of notifications in between collapse into one.
+
+    :param wake: function that wakes the consumer up; called from the worker thread
+    """
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.lock = threading.Lock()
+        self.pending = False
+
+    def notify(self):
+        with self.lock:
+            if self.pending:
+                return
+            self.pending = True
+
+        self.wake()
+
+    def acknowledge(self):
+        # called by the consumer before it looks for new data
+        with self.lock:
+            self.pending = False
+
+
+class ZStepTrigger(object):
+    """
+    Decides when a continuous scan captures: once the Z reading has moved at least step away from the last capture,
+    and has held still for the last window frames. The trigger hands over those frames, which are all taken at the
+    same height, to be cleaned into a capture.
+
+    Distances are compared in cm: the raw Z readings are converted with the calibration of the sensor ring.
+
+    :param step: distance (cm) along Z between captures
+    :param tolerance: largest change (cm) of Z within the window for the carriage to count as stopped
+    :param window: number of frames the carriage must stay still for; they make up the capture
+    :param calibrate_z: converts raw Z readings to cm; sensorBank.z() by default
+    """
+
+    def __init__(self, step=1.0, tolerance=0.2, window=8, calibrate_z=None):
+        self.step = step
+        self.tolerance = tolerance
+        self.window = window
+        self.calibrate_z = calibrate_z or sensorBank.z
+        self.reset()
+
+    def reset(self):
+        # Z (cm) of the last capture; the first capture is taken wherever the carriage first stops
+        self.last_z = None
+        # ring buffer of the last frames, created with the first one
+        self.frames = None
+        self.count = 0
+
+    def update(self, frame):
+        """
+        :param frame: a reading per sensor, the last one being Z
+        :return: window x sensors array of the frames to capture, or None if it isn't time to capture
+        """
+        if self.frames is None or self.frames.shape[1] != len(frame):
+            self.frames = np.empty((self.window, len(frame)))
+            self.count = 0
+
+        self.frames[self.count % self.window] = frame
+        self.count += 1
+
+        if self.count < self.window:
+            return None
+
+        z = self.calibrate_z(self.frames[:, -1])
+        if z.max() - z.min() > self.tolerance:
+            return None
+
+        mean_z = z.mean()
+        if self.last_z is not None and abs(mean_z - self.last_z) < self.step:
+            return None
+
+        self.last_z = mean_z
+        # the next capture needs a whole new window of frames
+        self.count = 0
+
+        return self.frames.copy()
+
+
+class ScanCaptureWorker(threading.Thread):
+    """
+    Cleans and saves the frames handed over by a ZStepTrigger, so the live feed thread keeps reading while the
+    carriage moves on.
+
+    :param feed: the LiveFeedThread; captures are handed to the GUI through its results
+    """
+
+    def __init__(self, feed):
+        threading.Thread.__init__(self, daemon=True)
+        self.feed = feed
+        # blocks of frames to capture; None stops the worker
+        self.blocks = queue.Queue()
+
+    def put(self, frames):
+        self.blocks.put(frames)
+
+    def stop(self):
+        self.blocks.put(None)
+        self.join()
+
+    def run(self):
+        while True:
+            frames = self.blocks.get()
+            if frames is None:
+                break
+
+            data = cleanSensorFrames(frames)
+
+            # don't save if the user has already left the tool
+            if self.feed.is_closing():
+                logger.info("Scan capture aborted")
+                continue
+
+            save_measurements(data)
+            self.feed.results.put((CAPTURED, data))
+            self.feed.widget.wake()
+
 
 class LiveFeedThread(threading.Thread):
     """
     A thread to display live sensor data, capture it, or calibrate sensors.
+
+    It is a state machine driven by a command queue: capture(), calibrate(), start_scan(), stop_scan() and close()
+    queue the target state, and the thread moves there when it is done with the current one. It is idle while the port
+    opens, then goes live: it publishes at most live_rate frames per second to the widget, which only needs the latest
+    one.
+
+    When the port opens, the saved calibration profile of the ring is loaded. calibrate() then only checks it against
+    a reading of the calibration object, and recalibrates the sensors if they drifted.
+
+    While scanning, the feed stays live and a ZStepTrigger watches the Z reading; the frames of each stop are cleaned
+    and saved by a ScanCaptureWorker, in the background.
+
+    :param widget: the widget who creates this thread; live frames are handed to its put_live_frame(), and its
+    wake() is called when there are results or errors
+    :param live_rate: maximum number of live frames per second handed to the widget
     """
 
-    def __init__(self, widget):
+    def __init__(self, widget, live_rate=10.0):
         threading.Thread.__init__(self)
 
-        # the widget who creates this thread; for writing data to its queue
         self.widget = widget
+        self.publish_interval = 1.0 / live_rate
+
+        self.state = IDLE
+        # state to go back to after a capture or calibration
+        self.resume_state = LIVE
 
-        # an event to kill this thread
-        self.kill_thread = threading.Event()
+        # target states requested by the GUI
+        self.commands = queue.Queue()
+        # (CAPTURED | CALIBRATED | PROFILE_LOADED, data) tuples for the GUI
+        self.results = queue.Queue()
+
+        # Continuous scan
+        self.scan_trigger = ZStepTrigger()
+        self.scan_worker = None
 
         # Signals port is open
         self.reading_sensors = threading.Event()
 
-        # Tells the thread to capture data; cleared when data is ready
-        self.capture_now = threading.Event()
-        # Tell the gui to grab the captured data
-        self.capture_done = threading.Event()
+        # The tool was left; results are no longer wanted
+        self.close_requested = threading.Event()
+
+    def capture(self):
+        self.commands.put(CAPTURING)
+
+    def calibrate(self):
+        self.commands.put(CALIBRATING)
 
-        # Tells the thread to calibrate sensors; cleared when done
-        self.calibrate_now = threading.Event()
-        # Tell the gui to grab the calibration data
-        self.calibration_done = threading.Event()
+    def start_scan(self, step=None):
+        """
+        :param step: distance (cm) along Z between captures; the trigger's default when None
+        """
+        if step is not None:
+            self.scan_trigger.step = step
+        self.commands.put(SCANNING)
+
+    def stop_scan(self):
+        self.commands.put(LIVE)
+
+    def close(self):
+        self.close_requested.set()
+        self.commands.put(CLOSING)
+
+    def is_closing(self):
+        return main_quit.is_set() or self.close_requested.is_set()
+
+    def set_state(self, state):
+        if state not in TRANSITIONS[self.state]:
+            logger.debug("Ignoring transition from %s to %s", self.state, state)
+            return
+
+        # Frames that piled up while not reading are stale, and those read before a capture, calibration or scan was
+        # requested may be from somewhere else
+        if state in (CAPTURING, CALIBRATING, SCANNING) or (state == LIVE and self.state == IDLE):
+            resetInputBuffer()
+
+        # a scan starts from scratch
+        if state == SCANNING:
+            self.scan_trigger.reset()
+            if self.scan_worker is None:
+                self.scan_worker = ScanCaptureWorker(self)
+                self.scan_worker.start()
+
+        self.state = state
+
+    def next_command(self, block):
+        # Wait for a command while idle; the timeout catches the main program quitting
+        try:
+            if block:
+                return self.commands.get(timeout=1.0)
+            return self.commands.get_nowait()
+        except queue.Empty:
+            return None
 
     def run(self):
         # Semaphore lock to guarantee only 1 thread at a time
         with port_lock:
 
             # don't bother if the user has already left the tool
-            if not main_quit.is_set() and not self.kill_thread.is_set():
+            if not self.is_closing():
                 # open serial port
                 try:
                     openArduinoSerial()
                 except IOError:
                     no_arduino.set()
-                    print("no arduino found")
+                    logger.warning("No Arduino found")
+                    self.state = CLOSING
+                    self.widget.wake()
                     return
 
+                # Filter the frames as configured
+                setFrameFilter(get_filter_settings())
+                setAdaptiveCapture(get_capture_settings())
+
+                # Calibrate the sensors with the profile of this ring, if any
+                self.load_calibration_profile()
+
                 # Notify we are reading
                 self.reading_sensors.set()
+                self.widget.wake()
+                self.set_state(LIVE)
+
+                self.last_published = 0.0
 
-                # Keep reading sensors
-                while not main_quit.is_set() and not self.kill_thread.is_set():
-                    try:
-                        # User wants to capture data
-                        if self.capture_now.is_set() and not self.capture_done.is_set():
-                            # do not use cache
-                            clearCache()
-
-                            # Get sensor data
-                            data = getCleanSensorData()
-
-                            # don't save if the user has already left the tool
-                            if not main_quit.is_set() and not self.kill_thread.is_set():
-                                # Save data in backend
-                                save_measurements(data)
-
-                                # signal data has been captured
-                                self.capture_done.set()
-                            else:
-                                print("capture aborted")
-
-                        # User wants to calibrate sensors
-                        elif self.calibrate_now.is_set() and not self.calibration_done.is_set():
-                            # do not use cache
-                            clearCache()
-
-                            # fetch calibration settings
-                            ring_diameter, calibration_obj_radius, rail_z_distance = get_calibration_settings()
-
-                            # init sensors
-                            initSensors(structureRadius=ring_diameter * 0.5)
-
-                            # clear cache again
-                            clearCache()
-
-                            # run calibration
-                            calibrateAllSensors(testRadius=calibration_obj_radius, testDistance=rail_z_distance)
-                            print(sensorArray)
-
-                            # don't give the signal if the user has already left the tool
-                            if not main_quit.is_set() and not self.kill_thread.is_set():
-                                # signal calibration is done
-                                self.calibration_done.set()
-
-                        # Show live feed
-                        else:
-                            data = getInstantRawSensorData()
-                            # Place data in queue so widget can access it in a non-blocking way
-                            self.widget.add_to_queue(data)
-
-                    except SerialException:
-                        disconnected.set()
-                        print("arduino disconnected")
-                        return
+                try:
+                    while self.state != CLOSING:
+                        if self.is_closing():
+                            self.set_state(CLOSING)
+                            break
+
+                        command = self.next_command(block=self.state == IDLE)
+                        if command is not None:
+                            if command in (CAPTURING, CALIBRATING) and self.state in (IDLE, LIVE):
+                                self.resume_state = self.state
+                            self.set_state(command)
+
+                        if self.state == LIVE:
+                            self.publish_frame(readFilteredFrame())
+
+                        elif self.state == SCANNING:
+                            frame = readSensorFrame()
+                            self.publish_frame(filterFrame(frame))
+
+                            # the carriage stopped at a new Z; the captures are cleaned from raw frames
+                            frames = self.scan_trigger.update(frame)
+                            if frames is not None:
+                                self.scan_worker.put(frames)
+
+                        elif self.state == CAPTURING:
+                            self.run_capture()
+                            self.set_state(self.resume_state)
+
+                        elif self.state == CALIBRATING:
+                            self.run_calibration()
+                            self.set_state(self.resume_state)
+
+                except SerialException:
+                    disconnected.set()
+                    logger.warning("Arduino disconnected")
+                    abandonArduinoSerial()
+                    self.state = CLOSING
+                    self.widget.wake()
+                    return
+
+                finally:
+                    # captures already triggered are still saved
+                    if self.scan_worker is not None:
+                        self.scan_worker.stop()
 
                 # close serial port
                 closeArduinoSerial()
 
-            print("thread finished")
+            self.state = CLOSING
+            logger.debug("Live feed thread finished")
+
+    def publish_frame(self, frame):
+        # Only hand the widget as many frames as it can use
+        now = time.perf_counter()
+        if now - self.last_published >= self.publish_interval:
+            self.last_published = now
+            self.widget.put_live_frame(["%.2f" % value for value in frame])
+
+    def run_capture(self):
+        # Get sensor data
+        data = getCleanSensorData()
+
+        # don't save if the user has already left the tool
+        if not self.is_closing():
+            # Save data in backend
+            save_measurements(data)
+
+            # hand the data to the GUI
+            self.results.put((CAPTURED, data))
+            self.widget.wake()
+        else:
+            logger.info("Capture aborted")
+
+    def load_calibration_profile(self):
+        ring_diameter = get_calibration_settings()[0]
+        profile = loadCalibrationProfile(ring_diameter)
+
+        if profile is not None:
+            self.results.put((PROFILE_LOADED, {"revision": profile["revision"], "created": profile["created"]}))
+
+    def run_calibration(self):
+        # fetch calibration settings
+        ring_diameter, calibration_obj_radius, rail_z_distance = get_calibration_settings()
+
+        # reading of the calibration object
+        measured_distances = getCleanSensorData()
+
+        # a loaded profile only needs to be redone if the sensors drifted
+        report = validateCalibration(measured_distances, calibration_obj_radius, rail_z_distance)
+        report["recalibrated"] = report["drift"]
+
+        if report["drift"]:
+            if report["max_ir_error"] is not None:
+                logger.info("Calibration drifted (IR error %.3f cm, Z error %.1f%%), recalibrating",
+                            report["max_ir_error"], 100.0 * report["z_error"])
+
+            # init sensors
+            initSensors(structureRadius=ring_diameter * 0.5)
+
+            # run calibration
+            calibrateAllSensors(testRadius=calibration_obj_radius, testDistance=rail_z_distance,
+                                measuredDistances=measured_distances)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Calibrated sensors: %s", sensorBank.to_profile())
+
+            profile = saveCalibrationProfile(ring_diameter, calibration_obj_radius, rail_z_distance)
+            report["revision"] = profile["revision"] if profile is not None else None
+
+        else:
+            logger.info("Calibration profile still valid (IR error %.3f cm, Z error %.1f%%)",
+                        report["max_ir_error"], 100.0 * report["z_error"])
+
+        # don't give the signal if the user has already left the tool
+        if not self.is_closing():
+            self.results.put((CALIBRATED, report))
+            self.widget.wake()
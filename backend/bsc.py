@@ -1,24 +1,33 @@
-import copy
+import logging
 import math
 
 import cv2
 import numpy as np
 from PIL import Image
 from imutils import perspective
-from scipy.spatial import distance as dist
+from scipy.spatial import cKDTree, distance as dist
 
-from backend.utils import rect_to_polar, get_timestamp, midpoint
+from backend import instrumentation
+from backend.utils import get_timestamp, midpoint
+
+logger = logging.getLogger(__name__)
 
 __image_path = None
 __original_image = None
 __config_image = None
 __contour_boxes = []
 __original_circumferences = []  # keeps all the circumferences originally found
-__circumferences = []  # list of tuples: (contour, (centroidX, centroidY))
+__slices = []  # one list per slice: [outer, inner], each a tuple (contour, (centroidX, centroidY))
+__slices_detected = False  # the slices were found by process_image(), not picked by the user
 __pixels_per_metric = None
-__circumferences_data = []  # list of tuples: (rs, thetas, avg_diameter)
+__circumferences_data = []  # one list per slice: [outer, inner], each a tuple (rs, thetas, avg_diameter)
+__thickness_data = []  # one dict per slice, as given by wall_thickness()
 __output_image = None
 
+# An inner circumference encloses at most this fraction of the area of its outer one; closer than that, they are
+# the two sides of the same edge
+MAX_INNER_AREA_RATIO = 0.9
+
 
 def get_image_path():
     return __image_path
@@ -32,6 +41,14 @@ def get_number_original_circumferences():
     return len(__original_circumferences)
 
 
+def get_number_slices():
+    return len(__slices)
+
+
+def were_slices_detected():
+    return __slices_detected
+
+
 def do_pre_processing(image):
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     # OPTION 1
@@ -49,6 +66,7 @@ def do_pre_processing(image):
     return edged
 
 
+@instrumentation.timed("bsc.process_image")
 def process_image(image_path):
     """
     Retrieves contours of circumferences and other (reference) objects.
@@ -56,7 +74,8 @@ def process_image(image_path):
     :param image_path: path to source image in filesystem.
     :return: number of circumferences found
     """
-    global __image_path, __original_image, __config_image, __contour_boxes, __original_circumferences, __circumferences
+    global __image_path, __original_image, __config_image, __contour_boxes, __original_circumferences, __slices, \
+        __slices_detected
 
     # load the image
     __original_image = cv2.imread(image_path)
@@ -69,18 +88,20 @@ def process_image(image_path):
     # the image we'll display in the configuration screen, with all the detected circumferences
     __config_image = __original_image.copy()
 
-    # reset boxes and circumferences
+    # reset boxes, circumferences and slices
     __contour_boxes.clear()
-    __original_circumferences.clear()
-    __circumferences.clear()
+    __original_circumferences = []
+    __slices = []
+    # index in cnts of each circumference
+    indices = []
 
     # Reduce background noise and apply canny edge detection
     temp_image = do_pre_processing(__original_image)
 
     # find contours
-    _, cnts, _ = cv2.findContours(image=temp_image, mode=cv2.RETR_CCOMP, method=cv2.CHAIN_APPROX_NONE)
+    _, cnts, hierarchy = cv2.findContours(image=temp_image, mode=cv2.RETR_CCOMP, method=cv2.CHAIN_APPROX_NONE)
 
-    for c in cnts:
+    for (i, c) in enumerate(cnts):
         area = cv2.contourArea(c)
 
         # ignore small contours
@@ -131,19 +152,94 @@ def process_image(image_path):
 
                 # Save circumference and centroid
                 circumference = (c, (cx, cy))
-                __circumferences.append(circumference)
+                __original_circumferences.append(circumference)
+                indices.append(i)
 
                 # Draw circumferences to display all of them in the configuration screen
                 cv2.drawContours(__config_image, [c], 0, color=(0, 255, 0), thickness=5)
 
+    # pair nested circumferences into slices
+    parents = hierarchy[0][:, 3] if hierarchy is not None else []
+    __slices = find_slices(__original_circumferences, indices, parents)
+    __slices_detected = bool(__slices)
+
+    # number the slices
+    for (n, ((contour, (cx, cy)), _)) in enumerate(__slices):
+        cv2.putText(__config_image, str(n + 1), (cx - 20, cy + 20), cv2.FONT_HERSHEY_SIMPLEX, 2.0, (0, 0, 255),
+                    thickness=5)
+
     # convert config image to pil
     __config_image = convert_cv_to_pil(__config_image)
 
-    # keep a copy of the originals before selecting finals
-    if len(__circumferences) > 2:
-        __original_circumferences = copy.copy(__circumferences)
+    return len(__original_circumferences)
 
-    return len(__circumferences)
+
+def find_slices(circumferences, indices, parents):
+    """
+    Pair nested circumferences into slices. Every circumference is grouped under the outermost one that contains it:
+    the RETR_CCOMP hierarchy says so for holes, and a point-in-contour test does for the rest. The biggest of each
+    group is the outer circumference of a slice, and the biggest one clearly smaller than it is the inner one. Groups
+    without an inner circumference are not slices; e.g. the reference object.
+
+    :param circumferences: list of (contour, centroid) tuples
+    :param indices: index in the contours of findContours() of each circumference
+    :param parents: parent of each contour of findContours(), from the hierarchy; -1 for none
+    :return: list of slices, [outer, inner] each, in reading order: by rows, then left to right
+    """
+    areas = [cv2.contourArea(contour) for (contour, _) in circumferences]
+    order = sorted(range(len(circumferences)), key=lambda k: areas[k], reverse=True)
+
+    # group of each circumference, by its index in the contours
+    group_of = {}
+    groups = []
+
+    # biggest first, so every group starts with its outermost circumference
+    for k in order:
+        (contour, centroid) = circumferences[k]
+        parent = parents[indices[k]] if len(parents) else -1
+
+        if parent in group_of:
+            # a hole of a circumference we have
+            group = group_of[parent]
+        else:
+            group = None
+            for (g, members) in enumerate(groups):
+                outer_contour = circumferences[members[0]][0]
+                if cv2.pointPolygonTest(outer_contour, (float(centroid[0]), float(centroid[1])), False) > 0:
+                    group = g
+                    break
+
+            if group is None:
+                group = len(groups)
+                groups.append([])
+
+        groups[group].append(k)
+        group_of[indices[k]] = group
+
+    slices = []
+    for members in groups:
+        outer = members[0]
+        inners = [k for k in members[1:] if areas[k] <= MAX_INNER_AREA_RATIO * areas[outer]]
+        if inners:
+            slices.append([circumferences[outer], circumferences[inners[0]]])
+
+    return sort_reading_order(slices)
+
+
+def sort_reading_order(slices):
+    # rows from top to bottom: a slice whose center is less than a radius below the first one of a row is on that row
+    slices = sorted(slices, key=lambda sl: sl[0][1][1])
+    radius = np.median([math.sqrt(cv2.contourArea(sl[0][0]) / math.pi) for sl in slices]) if slices else 0.0
+
+    rows = []
+    for sl in slices:
+        if rows and sl[0][1][1] - rows[-1][0][0][1][1] < radius:
+            rows[-1].append(sl)
+        else:
+            rows.append([sl])
+
+    # then left to right
+    return [sl for row in rows for sl in sorted(row, key=lambda sl: sl[0][1][0])]
 
 
 def render_all_circumferences():
@@ -162,7 +258,16 @@ def render_all_circumferences():
 
 
 def set_final_circumferences(selected):
-    global __circumferences
+    """
+    Use the selected circumferences as the only slice, for images where no slice was found automatically.
+
+    :param selected: indices of the outer and inner circumferences, in any order
+    """
+    global __slices, __slices_detected
+
+    selected = set(selected)
+    if len(selected) != 2 or not all(0 <= i < len(__original_circumferences) for i in selected):
+        raise ValueError("A slice needs 2 circumferences, got %s" % sorted(selected))
 
     final_circumferences = []
 
@@ -170,9 +275,12 @@ def set_final_circumferences(selected):
         if i in selected:
             final_circumferences.append(circumference)
 
-    __circumferences = final_circumferences
+    __slices = [final_circumferences]
+    __slices_detected = False
+    sort_circumferences()
 
 
+@instrumentation.timed("bsc.render_boxes")
 def render_boxes():
     """
     Generates images of each contour's bounding box (with horizontal and vertical bisections)
@@ -252,18 +360,11 @@ def set_pixels_per_metric(value):
 
 
 def sort_circumferences():
-    # get a reference of each circumference tuple (contour, centroid, hull)
-    circumference_1 = __circumferences[0]
-    circumference_2 = __circumferences[1]
-
-    # find out which contour is bigger
-    area_1 = len(circumference_1[0])
-    area_2 = len(circumference_2[0])
-
-    # outer circumference should come first
-    if area_2 > area_1:
-        __circumferences.reverse()
-        print("circumferences order reversed")
+    # outer circumference of each slice should come first
+    for circumferences in __slices:
+        if cv2.contourArea(circumferences[1][0]) > cv2.contourArea(circumferences[0][0]):
+            circumferences.reverse()
+            logger.debug("Circumferences order reversed")
 
 
 # TODO finish this test
@@ -272,68 +373,238 @@ def contour_to_approx(contour):
     return cv2.approxPolyDP(contour, epsilon=0.0001 * perimeter, closed=True)
 
 
+def contour_to_polar(contour, centroid):
+    """
+    Polar coordinates of every point of a contour around a centroid, y axis pointing up, scaled with the
+    pixels-per-metric.
+
+    :return: (rs, thetas, avg_diameter): rs and thetas (degrees) are lists rounded to 2 decimals
+    """
+    points = contour.reshape(-1, 2).astype(float)
+    dx = points[:, 0] - centroid[0]
+    # the y axis of images points down
+    dy = centroid[1] - points[:, 1]
+
+    rs = np.hypot(dx, dy) / __pixels_per_metric
+    thetas = np.degrees(np.arctan2(dy, dx))
+
+    return np.round(rs, 2).tolist(), np.round(thetas, 2).tolist(), np.round(np.mean(rs * 2.0), 2)
+
+
+@instrumentation.timed("bsc.circumferences_to_polar_and_avg_diameter")
 def circumferences_to_polar_and_avg_diameter():
+    """
+    :return: one list per slice with (rs, thetas, avg diameter) of its outer and inner circumferences
+    """
     global __pixels_per_metric, __circumferences_data
 
     # sort circumferences; Outer always first
     sort_circumferences()
 
-    # 2 rows for each circumference: contains (rs, thetas, avg diameter)
-    __circumferences_data.clear()
+    __circumferences_data = [[contour_to_polar(contour, centroid) for (contour, centroid) in circumferences]
+                             for circumferences in __slices]
 
-    for circumference in __circumferences:
-        (contour, centroid) = circumference
-        temp_r = []
-        temp_theta = []
-        temp_diameters = []
+    return __circumferences_data
 
-        # temp_contour = cv2.convexHull(contour)
-        temp_contour = contour_to_approx(contour)
 
-        for points in contour:
-        # for points in temp_contour:
-            for inner in points:
-                (r, theta) = rect_to_polar(point=inner, center=centroid, inverted_y=True)
-                scaled_r = r / __pixels_per_metric
+def wall_thickness(circumferences, bins=360):
+    """
+    Wall thickness around a slice: for every point of the outer circumference, the distance to the nearest point of
+    the inner one, found for all the points at once with a KD-tree of the inner circumference.
+
+    :param circumferences: [outer, inner], each a tuple (contour, centroid)
+    :param bins: number of angular bins of the profile, in a full turn
+    :return: dict with the "min", "max" and "mean" thickness, and the angular profile: "thetas" (degrees, around the
+    centroid of the outer circumference, y axis pointing up) and the mean "thickness" in each of them; bins with no
+    points are left out
+    """
+    ((outer, centroid), (inner, _)) = circumferences
+    outer_points = outer.reshape(-1, 2).astype(float)
+    inner_points = inner.reshape(-1, 2).astype(float)
 
-                # save diameter for average
-                temp_diameters.append(scaled_r * 2.0)
+    thickness, _ = cKDTree(inner_points).query(outer_points)
+    thickness /= __pixels_per_metric
 
-                # save radius
-                temp_r.append(round(scaled_r, 2))
-                # save theta
-                temp_theta.append(round(math.degrees(theta), 2))
+    # angle of each outer point; the y axis of images points down
+    thetas = np.arctan2(centroid[1] - outer_points[:, 1], outer_points[:, 0] - centroid[0])
+    index = np.floor((thetas + np.pi) * bins / (2.0 * np.pi)).astype(int) % bins
 
-        # calculate average diameter
-        temp_average_diameter = np.round(np.mean(temp_diameters), 2)
+    counts = np.bincount(index, minlength=bins)
+    used = counts > 0
+    profile = np.bincount(index, weights=thickness, minlength=bins)[used] / counts[used]
+    centers = (np.arange(bins)[used] + 0.5) * 360.0 / bins - 180.0
 
-        # save
-        __circumferences_data.append((temp_r, temp_theta, temp_average_diameter))
+    return {
+        "min": round(float(thickness.min()), 2),
+        "max": round(float(thickness.max()), 2),
+        "mean": round(float(thickness.mean()), 2),
+        "thetas": np.round(centers, 2).tolist(),
+        "thickness": np.round(profile, 2).tolist(),
+    }
 
-    return __circumferences_data
 
+@instrumentation.timed("bsc.slices_wall_thickness")
+def slices_wall_thickness():
+    """
+    :return: wall thickness of every slice, as given by wall_thickness()
+    """
+    global __thickness_data
+
+    # sort circumferences; Outer always first
+    sort_circumferences()
+
+    __thickness_data = [wall_thickness(circumferences) for circumferences in __slices]
+
+    return __thickness_data
+
+
+def decimate_polar(rs, thetas, bins=360):
+    """
+    Reduce a circumference to one point per angular bin, for display: a contour has far more points than a plot
+    has pixels along it. Each bin keeps the mean radius and the circular mean angle of its points, so a bin that
+    straddles +-180 degrees doesn't average to the opposite side.
+
+    :param rs: radii
+    :param thetas: angles in degrees, as given by circumferences_to_polar_and_avg_diameter()
+    :param bins: number of angular bins in a full turn
+    :return: (rs, thetas) numpy arrays sorted by angle, thetas in radians, with the first point repeated at the end
+    to close the curve
+    """
+    rs = np.asarray(rs, dtype=float)
+    thetas = np.radians(np.asarray(thetas, dtype=float))
+    if not len(rs):
+        return rs, thetas
+
+    # bin index of each point
+    index = np.floor((thetas + np.pi) * bins / (2.0 * np.pi)).astype(int) % bins
+
+    counts = np.bincount(index, minlength=bins)
+    used = counts > 0
+    binned_rs = np.bincount(index, weights=rs, minlength=bins)[used] / counts[used]
+    binned_thetas = np.arctan2(np.bincount(index, weights=np.sin(thetas), minlength=bins)[used],
+                               np.bincount(index, weights=np.cos(thetas), minlength=bins)[used])
+
+    return np.append(binned_rs, binned_rs[0]), np.append(binned_thetas, binned_thetas[0])
+
+
+def thickness_heatmap(circumferences, origin, shape, bins=360):
+    """
+    Local wall thickness over the ring of a slice, from a single distance transform of the ring mask: the distance
+    from each pixel of the wall to its nearest edge. Each pixel gets the diameter of the widest circle that fits in
+    the wall at its angle, i.e. twice the largest distance found in its angular bin.
+
+    :param circumferences: [outer, inner], each a tuple (contour, centroid)
+    :param origin: (x, y) of the top-left corner of the region in the image
+    :param shape: (height, width) of the region
+    :param bins: number of angular bins in a full turn
+    :return: (thickness, mask): thickness of every pixel of the region, 0 outside the wall, and the ring mask
+    """
+    ((outer, centroid), (inner, _)) = circumferences
+    offset = (-origin[0], -origin[1])
+
+    # the wall: inside the outer circumference and outside the inner one. With a 1 pixel border: the region is
+    # usually the bounding box of the outer circumference, and beyond the edges of the image there's no background
+    # for the distance transform to measure to
+    padded = np.zeros((shape[0] + 2, shape[1] + 2), dtype=np.uint8)
+    cv2.drawContours(padded, [outer], 0, color=255, thickness=cv2.FILLED, offset=(offset[0] + 1, offset[1] + 1))
+    cv2.drawContours(padded, [inner], 0, color=0, thickness=cv2.FILLED, offset=(offset[0] + 1, offset[1] + 1))
+
+    distances = cv2.distanceTransform(padded, cv2.DIST_L2, 5)[1:-1, 1:-1]
+    mask = padded[1:-1, 1:-1]
+
+    ys, xs = np.nonzero(mask)
+    thetas = np.arctan2(centroid[1] + offset[1] - ys, xs - centroid[0] - offset[0])
+    index = np.floor((thetas + np.pi) * bins / (2.0 * np.pi)).astype(int) % bins
+
+    widest = np.zeros(bins, dtype=np.float32)
+    np.maximum.at(widest, index, distances[ys, xs])
+
+    thickness = np.zeros(shape, dtype=np.float32)
+    thickness[ys, xs] = 2.0 * widest[index] / __pixels_per_metric
 
-def get_slice_roi():
+    return thickness, mask > 0
+
+
+def draw_thickness_heatmap(image, circumferences, origin, alpha=0.6):
+    """
+    Blend a heatmap of the wall thickness of a slice over a region of an image, with a color scale in its top-left
+    corner: blue is the thinnest part of the wall, red the thickest. The region is left as it is if the wall doesn't
+    show in it, e.g. for a degenerate slice.
+
+    :param image: BGR region, modified in place
+    :param origin: (x, y) of the top-left corner of the region in the image
+    :param alpha: opacity of the heatmap
+    """
+    thickness, mask = thickness_heatmap(circumferences, origin, image.shape[:2])
+    if not mask.any():
+        logger.warning("No wall to draw the thickness heatmap on")
+        return
+
+    low = float(thickness[mask].min())
+    high = float(thickness[mask].max())
+    if high - low > 1e-6:
+        scaled = (thickness - low) * (255.0 / (high - low))
+    else:
+        # even wall: the middle of the scale
+        scaled = np.full(thickness.shape, 127.0)
+    colors = cv2.applyColorMap(np.clip(scaled, 0, 255).astype(np.uint8), cv2.COLORMAP_JET)
+
+    blended = cv2.addWeighted(colors, alpha, image, 1.0 - alpha, 0)
+    image[mask] = blended[mask]
+
+    # color scale, sized to the region, with the thinnest and thickest wall below its ends
+    height, width = image.shape[:2]
+    margin = max(height // 40, 6)
+    font_scale = margin / 20.0
+    labels = ("%.2f" % low, "%.2f" % high)
+    (text_width, text_height), _ = cv2.getTextSize(labels[1], cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+
+    bar_width = max(width // 4, 3 * text_width)
+    if margin + bar_width > width or 3 * margin + text_height > height:
+        # no room for it
+        return
+
+    gradient = np.tile(np.linspace(0, 255, bar_width).astype(np.uint8), (margin, 1))
+    image[margin:2 * margin, margin:margin + bar_width] = cv2.applyColorMap(gradient, cv2.COLORMAP_JET)
+
+    for (label, x) in zip(labels, (margin, margin + bar_width - text_width)):
+        cv2.putText(image, label, (x, 3 * margin + text_height), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0),
+                    1, cv2.LINE_AA)
+
+
+@instrumentation.timed("bsc.get_slice_roi")
+def get_slice_roi(index=0, heatmap=False):
+    """
+    :param index: slice to show
+    :param heatmap: overlay the wall thickness of the slice
+    :return: PIL image of the region of the slice, with its circumferences outlined
+    """
     global __output_image
 
     # make sure outer is first
     sort_circumferences()
+    circumferences = __slices[index]
 
     # a copy of the original image
     temp = __original_image.copy()
 
+    contour, centroid = circumferences[0]  # outer circumference
+
+    # region of interest in the original image
+    x, y, w, h = cv2.boundingRect(contour)
+
+    if heatmap:
+        # drawn through a view of the copy, below the outlines
+        draw_thickness_heatmap(temp[y:y+h, x:x+w], circumferences, (x, y))
+
     # red and blue to match matplotlib
     # colors = ((179, 115, 24), (15, 132, 255))
     colors = ((0, 0, 255), (179, 115, 24))
 
     # outline the circumferences
-    for ((contour, centroid), color) in zip(__circumferences, colors):
+    for ((contour, centroid), color) in zip(circumferences, colors):
         temp = cv2.drawContours(temp, [contour], 0, color=color, thickness=5)
 
-    contour, centroid = __circumferences[0]  # outer circumference
-
-    # extract region of interest from original image
-    x, y, w, h = cv2.boundingRect(contour)
     roi = temp[y:y+h, x:x+w]
 
     __output_image = convert_cv_to_pil(roi)
@@ -341,11 +612,59 @@ def get_slice_roi():
     return __output_image
 
 
+def save_slice_image(file_path, index=0, heatmap=True):
+    """
+    Save the region of a slice, as shown by get_slice_roi(); the format is given by the extension of the path.
+
+    :return: True if the image was written
+    """
+    image = get_slice_roi(index, heatmap)
+
+    try:
+        image.save(file_path)
+
+    except (IOError, ValueError) as e:
+        logger.error("Can't save slice image %s: %s", file_path, e)
+        return False
+
+    logger.info("Slice image saved to %s", file_path)
+    return True
+
+
 def generate_text_file(file_path):
-    global __circumferences, __circumferences_data
+    global __slices, __circumferences_data, __thickness_data
 
+    # cheap, and always up to date with the slices and the scale
+    slices_wall_thickness()
+
+    try:
+        f = open(file_path, "w+")
+        f.write("Image processed: %s\n" % __image_path)
+        f.write("\n")
+        f.write(get_timestamp())
+        f.write("\n")
+
+        for (n, (circumferences, data, thickness)) in enumerate(zip(__slices, __circumferences_data,
+                                                                     __thickness_data)):
+            # images with several slices have a section per slice
+            if len(__slices) > 1:
+                f.write("**Slice %s of %s**\n" % (n + 1, len(__slices)))
+                f.write("\n")
+
+            write_slice(f, circumferences, data)
+            write_wall_thickness(f, thickness)
+
+        f.close()
+        return True
+
+    except IOError as e:
+        logger.error("I/O error(%s): %s", e.errno, e.strerror)
+        return False
+
+
+def write_slice(f, circumferences, data):
     # get point of reference to express centroid as a rectangular coordinate
-    contour, _ = __circumferences[0]  # outer
+    contour, _ = circumferences[0]  # outer
 
     # leftmost point gives x0
     leftmost = tuple(contour[contour[:, :, 0].argmin()][0])
@@ -355,62 +674,63 @@ def generate_text_file(file_path):
     # origin
     (x0, y0) = leftmost[0], bottommost[1]
 
-    try:
-        f = open(file_path, "w+")
-        f.write("Image processed: %s\n" % __image_path)
-        f.write("\n")
-        f.write(get_timestamp())
-        f.write("\n")
+    tags = ("Outer Circumference", "Inner Circumference")
+    for ((rs, thetas, avg_diameter), (contour, centroid), tag) in zip(data, circumferences, tags):
 
-        tags = ("Outer Circumference", "Inner Circumference")
-        for ((rs, thetas, avg_diameter), (contour, centroid), tag) in zip(__circumferences_data, __circumferences, tags):
+        # Write circumference tag
+        f.write("*%s*\n" % tag)
 
-            # Write circumference tag
-            f.write("*%s*\n" % tag)
+        # write polar coords
+        f.write("Polar coordinates:\n")
+        for (r, theta) in zip(rs, thetas):
+            f.write(" (%s, %s) " % (r, theta))
+        f.write("\n")
 
-            # write polar coords
-            f.write("Polar coordinates:\n")
-            for (r, theta) in zip(rs, thetas):
-                f.write(" (%s, %s) " % (r, theta))
-            f.write("\n")
+        # write centroid
+        # coordinates in original image
+        (cx, cy) = centroid
 
-            # write centroid
-            # coordinates in original image
-            (cx, cy) = centroid
+        # translate in relation to calculated origin, and scaled with pixels-per-metric
+        cx_final = round(abs(cx - x0) / __pixels_per_metric, 2)
+        cy_final = round(abs(cy - y0) / __pixels_per_metric, 2)
 
-            # translate in relation to calculated origin, and scaled with pixels-per-metric
-            cx_final = round(abs(cx - x0) / __pixels_per_metric, 2)
-            cy_final = round(abs(cy - y0) / __pixels_per_metric, 2)
+        f.write("Centroid: (%s, %s)" % (cx_final, cy_final))
+        f.write("\n")
 
-            f.write("Centroid: (%s, %s)" % (cx_final, cy_final))
-            f.write("\n")
+        # write average diameter
+        f.write("Average Diameter: %s" % avg_diameter)
+        f.write("\n")
 
-            # write average diameter
-            f.write("Average Diameter: %s" % avg_diameter)
-            f.write("\n")
+        f.write("\n")
 
-            f.write("\n")
 
-        f.close()
-        return True
+def write_wall_thickness(f, thickness):
+    f.write("*Wall Thickness*\n")
+    f.write("Min: %(min)s  Max: %(max)s  Mean: %(mean)s\n" % thickness)
 
-    except IOError as e:
-        print("I/O error({0}): {1}".format(e.errno, e.strerror))
-        return False
+    # thickness by angle, like the polar coordinates: (theta, thickness)
+    f.write("Angular profile:\n")
+    for (theta, value) in zip(thickness["thetas"], thickness["thickness"]):
+        f.write(" (%s, %s) " % (theta, value))
+    f.write("\n")
+
+    f.write("\n")
 
 
 def reset_bsc_backend():
     global __image_path, __original_image, __config_image, __pixels_per_metric, __contour_boxes,\
-        __original_circumferences, __circumferences, __circumferences_data, __output_image
+        __original_circumferences, __slices, __slices_detected, __circumferences_data, __thickness_data, __output_image
 
     __image_path = None
     __original_image = None
     __config_image = None
     __contour_boxes.clear()
-    __original_circumferences.clear()
-    __circumferences.clear()
+    __original_circumferences = []
+    __slices = []
+    __slices_detected = False
     __pixels_per_metric = None
-    __circumferences_data.clear()
+    __circumferences_data = []
+    __thickness_data = []
     __output_image = None
 
 
@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# One JSON file per ring diameter and device, in this directory
+PROFILES_DIR = "calibration"
+
+# Layout of the profile files; files with another format are ignored
+FORMAT_VERSION = 1
+
+# Previous revisions kept in each profile, to follow the drift of the sensors
+HISTORY_LENGTH = 10
+
+
+def profile_path(ring_diameter, device_id, directory=PROFILES_DIR):
+    """
+    :return: path of the profile of a ring diameter (cm) and device
+    """
+    device = re.sub(r"[^A-Za-z0-9_.-]+", "_", device_id) or "unknown"
+    return os.path.join(directory, "ring_%.2f_%s.json" % (ring_diameter, device))
+
+
+def load_profile(ring_diameter, device_id, directory=PROFILES_DIR):
+    """
+    :return: the profile of a ring diameter and device, or None if there isn't a usable one
+    """
+    path = profile_path(ring_diameter, device_id, directory)
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path) as f:
+            profile = json.load(f)
+
+    except (IOError, ValueError) as e:
+        logger.warning("Can't read calibration profile %s: %s", path, e)
+        return None
+
+    if profile.get("format") != FORMAT_VERSION:
+        logger.warning("Ignoring calibration profile %s: unknown format %s", path, profile.get("format"))
+        return None
+
+    if profile.get("device_id") != device_id or abs(profile.get("ring_diameter", 0.0) - ring_diameter) > 0.005:
+        logger.warning("Ignoring calibration profile %s: made for another ring", path)
+        return None
+
+    return profile
+
+
+def save_profile(ring_diameter, device_id, sensors, settings=None, directory=PROFILES_DIR):
+    """
+    Save a new revision of the profile of a ring diameter and device. The previous revision is moved to the history.
+
+    :param sensors: calibration of the sensors, as given by sensors_manager.getCalibrationProfile()
+    :param settings: dict with the settings of the calibration, e.g. the radius of the calibration object
+    :return: the saved profile, or None if it couldn't be written
+    """
+    path = profile_path(ring_diameter, device_id, directory)
+    previous = load_profile(ring_diameter, device_id, directory)
+
+    history = []
+    revision = 1
+    if previous is not None:
+        history = previous.pop("history", [])
+        history.insert(0, previous)
+        revision = previous.get("revision", 0) + 1
+
+    profile = {
+        "format": FORMAT_VERSION,
+        "revision": revision,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "ring_diameter": ring_diameter,
+        "device_id": device_id,
+        "settings": settings or {},
+    }
+    profile.update(sensors)
+    profile["history"] = history[:HISTORY_LENGTH]
+
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # replace the file at once, so a crash can't leave half a profile
+        temporary = path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(profile, f, indent=2)
+        os.replace(temporary, path)
+
+    except (IOError, OSError) as e:
+        logger.error("Can't write calibration profile %s: %s", path, e)
+        return None
+
+    logger.info("Calibration profile %s saved (revision %s)", path, revision)
+    return profile
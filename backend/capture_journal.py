@@ -0,0 +1,223 @@
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# File layout: header, then fixed-size records. Everything little-endian.
+#   header: MAGIC, version (u16), values per capture (u16), metadata length (u32), metadata (UTF-8 JSON)
+#   record: operation (u8), index (u32), values (f64 x width), CRC32 of the previous fields (u32)
+MAGIC = b"BPCJ"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+
+# Operations
+ADD = 1     # a capture was added; values holds it
+DELETE = 2  # the capture at index was deleted; deletions of one call are written in descending index order
+
+
+def record_dtype(width):
+    return np.dtype([("operation", "<u1"), ("index", "<u4"), ("values", "<f8", (width,)), ("crc", "<u4")])
+
+
+class CaptureJournal(object):
+    """
+    Append-only file with every change made to the captured measurements of a BPC session, so the session can be
+    rebuilt after a crash. Records are written through to the OS on every append, which survives the program dying;
+    fsync, which also survives the computer dying, is batched to keep it off the capture path.
+
+    Use create() for a new session and resume() to keep appending to a replayed one.
+
+    :param sync_every: number of records written between fsyncs
+    :param sync_interval: maximum number of seconds between fsyncs, checked on append
+    """
+
+    def __init__(self, path, f, width, sync_every=16, sync_interval=2.0):
+        self.path = path
+        self.file = f
+        self.width = width
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+
+        self.record = struct.Struct("<BI%sd" % width)
+        self.unsynced = 0
+        self.last_sync = time.perf_counter()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path, width, metadata=None, **kwargs):
+        """
+        Start a new journal, replacing any journal at path.
+
+        :param width: number of values per capture
+        :param metadata: dict saved in the header, e.g. the session settings
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        encoded = json.dumps(metadata or {}).encode("utf-8")
+
+        f = open(path, "wb")
+        f.write(HEADER.pack(MAGIC, VERSION, width, len(encoded)))
+        f.write(encoded)
+        f.flush()
+        os.fsync(f.fileno())
+
+        return cls(path, f, width, **kwargs)
+
+    @classmethod
+    def resume(cls, path, **kwargs):
+        """
+        Keep appending to an existing journal. A torn record at the end, left by a crash, is cut off first.
+        """
+        (metadata, width, records, end) = read_journal(path)
+
+        f = open(path, "r+b")
+        f.truncate(end)
+        f.seek(end)
+
+        return cls(path, f, width, **kwargs)
+
+    def append(self, operation, index, values):
+        packed = self.record.pack(operation, index, *values)
+
+        with self.lock:
+            self.file.write(packed)
+            self.file.write(struct.pack("<I", zlib.crc32(packed) & 0xffffffff))
+            # hand it to the OS right away; a crash of the program can't lose it anymore
+            self.file.flush()
+
+            self.unsynced += 1
+            if self.unsynced >= self.sync_every or time.perf_counter() - self.last_sync >= self.sync_interval:
+                self.sync_locked()
+
+    def append_add(self, row):
+        self.append(ADD, 0, row)
+
+    def append_delete(self, indices):
+        # descending, so replaying them one by one deletes the same captures
+        zeros = [0.0] * self.width
+        for index in sorted(indices, reverse=True):
+            self.append(DELETE, index, zeros)
+
+    def sync(self):
+        with self.lock:
+            self.sync_locked()
+
+    def sync_locked(self):
+        if self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+        self.last_sync = time.perf_counter()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.sync_locked()
+                self.file.close()
+
+    def discard(self):
+        """
+        Close and delete the journal; the session it recorded is safely stored somewhere else.
+        """
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def read_header(f, path):
+    """
+    :return: (metadata, width, start): start is the byte offset of the first record
+    """
+    header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError("Not a capture journal: %s" % path)
+
+    (magic, version, width, metadata_length) = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a capture journal: %s" % path)
+
+    metadata = json.loads(f.read(metadata_length).decode("utf-8"))
+
+    return metadata, width, HEADER.size + metadata_length
+
+
+def journal_summary(path):
+    """
+    Number of captures recorded in a journal, without replaying it: only the header and the operation of each record
+    are read, and checksums are not checked, so a journal with a corrupted record may replay fewer captures.
+
+    :return: (metadata, captures)
+    """
+    with open(path, "rb") as f:
+        (metadata, width, start) = read_header(f, path)
+        records = np.fromfile(f, dtype=record_dtype(width))
+
+    operations = records["operation"]
+    captures = int(np.count_nonzero(operations == ADD)) - int(np.count_nonzero(operations == DELETE))
+
+    return metadata, max(captures, 0)
+
+
+def read_journal(path):
+    """
+    Read a journal, up to its first incomplete or corrupted record.
+
+    :return: (metadata, width, records, end): records is a numpy structured array with the valid records, and end
+    the byte offset right after the last one
+    """
+    with open(path, "rb") as f:
+        (metadata, width, start) = read_header(f, path)
+        f.seek(0)
+        data = f.read()
+
+    dtype = record_dtype(width)
+    count = (len(data) - start) // dtype.itemsize
+    records = np.frombuffer(data, dtype=dtype, count=count, offset=start)
+
+    # stop at the first record that doesn't match its checksum: everything after it is a torn write
+    size = dtype.itemsize - 4
+    for i in range(count):
+        offset = start + i * dtype.itemsize
+        if zlib.crc32(data[offset:offset + size]) & 0xffffffff != records["crc"][i]:
+            count = i
+            break
+
+    return metadata, width, records[:count], start + count * dtype.itemsize
+
+
+def replay_journal(path, store):
+    """
+    Rebuild the captured measurements recorded in a journal.
+
+    :param store: an empty MeasurementStore
+    :return: the metadata of the journal
+    """
+    (metadata, width, records, end) = read_journal(path)
+    operations = records["operation"]
+
+    i = 0
+    while i < len(records):
+        j = i + 1
+
+        if operations[i] == ADD:
+            # a run of adds is loaded at once
+            while j < len(records) and operations[j] == ADD:
+                j += 1
+            store.extend(records["values"][i:j])
+
+        else:
+            # a run of strictly descending deletions removes the same captures as a single masked deletion
+            while j < len(records) and operations[j] == DELETE and records["index"][j] < records["index"][j - 1]:
+                j += 1
+            store.delete(records["index"][i:j])
+
+        i = j
+
+    return metadata
@@ -0,0 +1,236 @@
+import functools
+import json
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Nothing is recorded unless this is set; see enable()
+enabled = False
+
+# Histogram buckets: upper bounds in seconds, growing by a factor of 2 from 1 microsecond to about 1 minute
+BUCKET_BOUNDS = [1e-6 * 2 ** i for i in range(27)]
+
+__lock = threading.Lock()
+__timers = {}
+__counters = {}
+
+
+class Histogram(object):
+    """
+    Latency histogram with logarithmic buckets. Keeps count, total, min and max exactly; percentiles are estimated
+    from the buckets.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        # the last bucket takes everything above the last bound
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def add(self, seconds):
+        # index of the first bound >= seconds
+        if seconds <= BUCKET_BOUNDS[0]:
+            index = 0
+        else:
+            index = min(int(math.ceil(math.log(seconds / BUCKET_BOUNDS[0], 2))), len(BUCKET_BOUNDS))
+
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.min = min(self.min, seconds)
+            self.max = max(self.max, seconds)
+            self.buckets[index] += 1
+
+    def percentile(self, fraction):
+        """
+        :return: upper bound of the bucket holding the given fraction of the samples, capped by the max
+        """
+        if not self.count:
+            return 0.0
+
+        target = fraction * self.count
+        seen = 0
+        for (bound, count) in zip(BUCKET_BOUNDS + [self.max], self.buckets):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+
+        return self.max
+
+    def snapshot(self):
+        with self.lock:
+            if not self.count:
+                return {"count": 0}
+
+            return {
+                "count": self.count,
+                "total_ms": round(self.total * 1000.0, 3),
+                "mean_ms": round(self.total * 1000.0 / self.count, 3),
+                "min_ms": round(self.min * 1000.0, 3),
+                "max_ms": round(self.max * 1000.0, 3),
+                "p50_ms": round(self.percentile(0.5) * 1000.0, 3),
+                "p90_ms": round(self.percentile(0.9) * 1000.0, 3),
+                "p99_ms": round(self.percentile(0.99) * 1000.0, 3),
+            }
+
+
+class Span(object):
+    """
+    Context manager that records the time spent inside it.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class NoSpan(object):
+    # What span() returns while disabled: does nothing, and is shared so nothing is allocated
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+__no_span = NoSpan()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def is_enabled():
+    return enabled
+
+
+def get_histogram(name):
+    histogram = __timers.get(name)
+    if histogram is None:
+        with __lock:
+            histogram = __timers.setdefault(name, Histogram())
+
+    return histogram
+
+
+def record(name, seconds):
+    """
+    Add a duration to a timer.
+
+    :param name: timer name
+    :param seconds: duration
+    """
+    if enabled:
+        get_histogram(name).add(seconds)
+
+
+def count(name, n=1):
+    """
+    Increase a counter.
+
+    :param name: counter name
+    :param n: increment
+    """
+    if enabled:
+        with __lock:
+            __counters[name] = __counters.get(name, 0) + n
+
+
+def span(name):
+    """
+    Time a block of code:
+
+        with span("bsc.render"):
+            ...
+
+    :param name: timer name
+    :return: a context manager
+    """
+    if not enabled:
+        return __no_span
+
+    return Span(name)
+
+
+def timed(name=None):
+    """
+    Decorator that times every call of a function. While disabled, the only overhead is checking a flag.
+
+    :param name: timer name; defaults to module.function
+    """
+    def decorator(func):
+        timer_name = name or "%s.%s" % (func.__module__, func.__name__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                get_histogram(timer_name).add(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def snapshot():
+    """
+    :return: dict with every timer and counter recorded so far
+    """
+    with __lock:
+        timers = list(__timers.items())
+        counters = dict(__counters)
+
+    return {
+        "enabled": enabled,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "timers": {name: histogram.snapshot() for (name, histogram) in sorted(timers)},
+        "counters": counters,
+    }
+
+
+def export_json(file_path):
+    """
+    Write a snapshot to a JSON file.
+
+    :return: True if the file was written
+    """
+    try:
+        with open(file_path, "w") as f:
+            json.dump(snapshot(), f, indent=2, sort_keys=True)
+        return True
+
+    except IOError as e:
+        logger.error("I/O error(%s): %s", e.errno, e.strerror)
+        return False
+
+
+def reset():
+    with __lock:
+        __timers.clear()
+        __counters.clear()
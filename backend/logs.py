@@ -0,0 +1,88 @@
+import logging
+import logging.handlers
+import os
+
+# Backend modules log through logging.getLogger(__name__), so they all live under this logger
+ROOT_LOGGER = "backend"
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(threadName)s %(name)s: %(message)s"
+
+# Rotating log file
+LOG_DIR = "logs"
+LOG_FILE = "bamboo_scanner.log"
+MAX_BYTES = 1024 * 1024
+BACKUP_COUNT = 3
+
+
+def parse_levels(text):
+    """
+    Parse per-module levels, e.g. "backend.sensors_manager=DEBUG,backend.bsc=INFO".
+
+    :return: dict of logger name to level name
+    """
+    levels = {}
+    for item in text.split(","):
+        if "=" in item:
+            (name, level) = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+
+    return levels
+
+
+def configure(level="WARNING", levels=None, log_file=None, console_level="WARNING"):
+    """
+    Set up the backend loggers. Messages below a logger's level are dropped before they are formatted, so debug
+    logging costs nothing while it's off.
+
+    :param level: level of the backend loggers
+    :param levels: dict of logger name to level, for modules that need a different one
+    :param log_file: path of the rotating log file; defaults to LOG_DIR/LOG_FILE. None disables the file.
+    :param console_level: level of the messages also shown on the console
+    """
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level)
+
+    for (name, module_level) in (levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    # replace handlers from a previous call
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    console = logging.StreamHandler()
+    console.setLevel(console_level)
+    console.setFormatter(formatter)
+    root.addHandler(console)
+
+    if log_file:
+        directory = os.path.dirname(log_file)
+        try:
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=MAX_BYTES,
+                                                                backupCount=BACKUP_COUNT)
+            file_handler.setFormatter(formatter)
+            root.addHandler(file_handler)
+
+        except (IOError, OSError) as e:
+            root.warning("Can't write the log file %s: %s", log_file, e)
+
+    # the root logger of the program doesn't print these again
+    root.propagate = False
+
+
+def configure_from_env(level=None):
+    """
+    configure() from environment variables:
+
+    * BAMBOO_LOG_LEVEL: level of the backend loggers (WARNING by default, or the given level)
+    * BAMBOO_LOG_LEVELS: per-module levels, e.g. "backend.sensors_manager=DEBUG"
+    * BAMBOO_LOG_FILE: path of the log file; empty to disable it
+    """
+    configure(level=os.environ.get("BAMBOO_LOG_LEVEL", level or "WARNING").upper(),
+              levels=parse_levels(os.environ.get("BAMBOO_LOG_LEVELS", "")),
+              log_file=os.environ.get("BAMBOO_LOG_FILE", os.path.join(LOG_DIR, LOG_FILE)) or None)
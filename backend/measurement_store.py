@@ -0,0 +1,177 @@
+import threading
+
+import numpy as np
+
+
+class MeasurementStore(object):
+    """
+    Captured BPC measurements in a growable NumPy array, one row per capture: a reading per IR sensor followed by Z.
+    Rows are kept sorted by Z as they are added, so the store never needs sorting and Z lookups are binary searches.
+
+    Captures may be added from another thread (see ScanCaptureWorker) while the GUI reads the store, so every access
+    takes the lock, and readers get snapshots: arrays of their own that later changes to the store don't touch.
+
+    :param capacity: number of rows allocated up front; doubles whenever it runs out
+    """
+
+    def __init__(self, capacity=64):
+        self.initial_capacity = capacity
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            # the width is set by the first capture
+            self.data = None
+            self.count = 0
+
+    def __len__(self):
+        with self.lock:
+            return self.count
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def width(self):
+        """
+        :return: number of values per capture (sensors + Z), or 0 if the store is empty
+        """
+        with self.lock:
+            return 0 if self.data is None else self.data.shape[1]
+
+    def add(self, row):
+        """
+        Insert a capture in its place by Z; captures with the same Z keep their capture order.
+
+        :param row: a reading per IR sensor, then Z
+        :return: the index of the new row
+        """
+        row = np.asarray(row, dtype=float)
+
+        with self.lock:
+            if self.data is None:
+                self.data = np.empty((self.initial_capacity, len(row)))
+            elif len(row) != self.data.shape[1]:
+                raise ValueError("Expected %s values per capture, got %s" % (self.data.shape[1], len(row)))
+
+            # grow
+            if self.count == len(self.data):
+                grown = np.empty((2 * len(self.data), self.data.shape[1]))
+                grown[:self.count] = self.data[:self.count]
+                self.data = grown
+
+            index = int(np.searchsorted(self.data[:self.count, -1], row[-1], side="right"))
+
+            # make room
+            self.data[index + 1:self.count + 1] = self.data[index:self.count]
+            self.data[index] = row
+            self.count += 1
+
+            return index
+
+    def extend(self, rows):
+        """
+        Insert many captures at once; same result as adding them one by one.
+
+        :param rows: 2D array, one capture per row
+        """
+        rows = np.asarray(rows, dtype=float)
+        if not len(rows):
+            return
+
+        with self.lock:
+            if self.data is None:
+                self.data = np.empty((max(self.initial_capacity, len(rows)), rows.shape[1]))
+            elif rows.shape[1] != self.data.shape[1]:
+                raise ValueError("Expected %s values per capture, got %s" % (self.data.shape[1], rows.shape[1]))
+
+            merged = np.concatenate((self.data[:self.count], rows))
+            # stable, so captures with the same Z keep their capture order
+            merged = merged[np.argsort(merged[:, -1], kind="mergesort")]
+
+            capacity = len(self.data)
+            while capacity < len(merged):
+                capacity *= 2
+            if capacity != len(self.data):
+                self.data = np.empty((capacity, merged.shape[1]))
+
+            self.data[:len(merged)] = merged
+            self.count = len(merged)
+
+    def delete(self, indices):
+        """
+        Delete many captures at once.
+
+        :param indices: indices of the rows to delete
+        """
+        if len(indices) == 0:
+            return
+
+        with self.lock:
+            keep = np.ones(self.count, dtype=bool)
+            keep[np.asarray(indices, dtype=int)] = False
+
+            kept = int(np.count_nonzero(keep))
+            self.data[:kept] = self.data[:self.count][keep]
+            self.count = kept
+
+    def rows(self):
+        """
+        :return: snapshot of the captures, sorted by Z
+        """
+        with self.lock:
+            if self.data is None:
+                return np.empty((0, 0))
+
+            return self.data[:self.count].copy()
+
+    def readings(self):
+        """
+        :return: snapshot of the IR readings of every capture
+        """
+        with self.lock:
+            if self.data is None:
+                return np.empty((0, 0))
+
+            return self.data[:self.count, :-1].copy()
+
+    def z(self):
+        """
+        :return: snapshot of the Z of every capture, sorted
+        """
+        with self.lock:
+            if self.data is None:
+                return np.empty(0)
+
+            return self.data[:self.count, -1].copy()
+
+    def find_z(self, z):
+        """
+        :return: index of the capture closest to z, or None if the store is empty
+        """
+        with self.lock:
+            if not self.count:
+                return None
+
+            zs = self.data[:self.count, -1]
+            index = int(np.searchsorted(zs, z))
+
+            # closest of both neighbours
+            if index == self.count or (index > 0 and z - zs[index - 1] <= zs[index] - z):
+                index -= 1
+
+            return index
+
+    def range_z(self, low, high):
+        """
+        :return: snapshot of the captures with low <= Z <= high
+        """
+        rows = self.rows()
+        if not len(rows):
+            return rows
+
+        zs = rows[:, -1]
+        return rows[np.searchsorted(zs, low, side="left"):np.searchsorted(zs, high, side="right")]
+
+    def tolist(self):
+        return self.rows().tolist()
@@ -0,0 +1,261 @@
+import logging
+import os
+
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+from backend.sensors_manager import sensorBank, frameToPoints
+
+logger = logging.getLogger(__name__)
+
+# Cross-sections with a smaller area (cm^2) are degenerate: their points are collinear, or all in the same place
+MIN_AREA = 1e-6
+
+
+def fit_slice_contours(xy, harmonics=3):
+    """
+    Fit a smooth closed contour to each slice: x and y of the surface as Fourier series of the sensor angle. All the
+    slices share the sensor angles, so a single least-squares solution fits every slice at once.
+
+    :param xy: slices x sensors x 2 array of surface points, in the order of the sensors around the ring
+    :param harmonics: number of harmonics; limited to what the number of sensors can resolve
+    :return: slices x (2 * harmonics + 1) x 2 array of coefficients, in the order of fourier_basis()
+    """
+    sensors = xy.shape[1]
+    harmonics = min(harmonics, (sensors - 1) // 2)
+
+    # 2 * harmonics + 1 unknowns; below one harmonic, the contour is a single point
+    if harmonics < 1:
+        raise ValueError("At least 3 readings per slice are needed, got %s" % sensors)
+
+    angles = 2.0 * np.pi * np.arange(sensors) / sensors
+    basis = fourier_basis(angles, harmonics)
+
+    # (terms x sensors) @ (slices x sensors x 2) -> slices x terms x 2
+    return np.einsum("ts,nsk->ntk", np.linalg.pinv(basis), xy)
+
+
+def fourier_basis(angles, harmonics):
+    """
+    :return: len(angles) x (2 * harmonics + 1) matrix with columns 1, cos(a), sin(a), cos(2a), sin(2a), ...
+    """
+    columns = [np.ones(len(angles))]
+    for h in range(1, harmonics + 1):
+        columns.append(np.cos(h * angles))
+        columns.append(np.sin(h * angles))
+
+    return np.column_stack(columns)
+
+
+def shoelace(x, y):
+    """
+    Signed area and centroid of closed polygons, for many at once.
+
+    :param x: polygons x points array; y likewise
+    :return: (signed areas, polygons x 2 centroids); the centroid of a degenerate polygon is the mean of its points
+    """
+    next_x, next_y = np.roll(x, -1, axis=1), np.roll(y, -1, axis=1)
+    cross = x * next_y - next_x * y
+    signed_areas = 0.5 * np.sum(cross, axis=1)
+
+    degenerate = np.abs(signed_areas) < MIN_AREA
+    divisor = 6.0 * np.where(degenerate, 1.0, signed_areas)[:, np.newaxis]
+    centers = np.column_stack((np.sum((x + next_x) * cross, axis=1), np.sum((y + next_y) * cross, axis=1))) / divisor
+    centers[degenerate] = np.column_stack((x[degenerate].mean(axis=1), y[degenerate].mean(axis=1)))
+
+    return signed_areas, centers
+
+
+def reconstruct_pole(rows, harmonics=3, points_per_ring=64, z_step=0.5, z_factor=None, structure_radius=16.0):
+    """
+    Rebuild the surface of a pole from its captured slices: a Fourier contour is fitted to each slice, and the
+    contour coefficients are interpolated along Z with a cubic spline.
+
+    :param rows: captured measurements, one row per slice: the distance from each IR sensor to the pole, then Z
+    :param harmonics: harmonics of the fitted contours
+    :param points_per_ring: points on each ring of the reconstructed surface
+    :param z_step: distance between rings along Z
+    :param z_factor: scale of the raw Z readings; the calibration of the sensor ring (sensors_manager.sensorBank)
+    when None
+    :param structure_radius: radius of the ring the sensors are mounted on, used when the sensors aren't calibrated
+    :return: dict with "z" (levels), "rings" (levels x points x 2), "centers" (levels x 2), "areas" (levels),
+    "vertices" (n x 3) and "faces" (m x 3 indices into vertices, outward normals)
+    """
+    data = np.asarray(rows, dtype=float)
+    if data.ndim != 2 or data.shape[1] < 2:
+        raise ValueError("Expected one row per slice, with a reading per sensor followed by Z")
+
+    # surface points of every slice at once, with the ring's center at (0, 0)
+    x, y, valid = frameToPoints(data[:, :-1], structureRadius=structure_radius)
+    xy = np.stack((x, y), axis=-1)
+    slice_z = sensorBank.z(data[:, -1]) if z_factor is None else z_factor * data[:, -1]
+
+    # slices where a sensor saw nothing, or whose points don't enclose anything, can't be fitted
+    slice_areas, _ = shoelace(x, y)
+    usable = valid.all(axis=1) & (np.abs(slice_areas) >= MIN_AREA)
+    if not usable.all():
+        logger.warning("Skipping %s incomplete or degenerate slices", np.count_nonzero(~usable))
+        xy = xy[usable]
+        slice_z = slice_z[usable]
+
+    coefficients = fit_slice_contours(xy, harmonics)
+
+    # slices at the same height are averaged; the spline needs strictly increasing Z
+    z, inverse = np.unique(slice_z, return_inverse=True)
+    if len(z) < 2:
+        raise ValueError("At least 2 slices at different heights are needed")
+
+    terms = coefficients.shape[1]
+    flat = coefficients.reshape(len(coefficients), -1)
+    summed = np.zeros((len(z), flat.shape[1]))
+    np.add.at(summed, inverse, flat)
+    averaged = summed / np.bincount(inverse)[:, np.newaxis]
+
+    # one spline through every coefficient of every slice
+    spline = CubicSpline(z, averaged, axis=0)
+    levels = max(2, int(np.ceil((z[-1] - z[0]) / z_step)) + 1)
+    level_z = np.linspace(z[0], z[-1], levels)
+    level_coefficients = spline(level_z).reshape(levels, terms, 2)
+
+    # sample the contours
+    angles = 2.0 * np.pi * np.arange(points_per_ring) / points_per_ring
+    basis = fourier_basis(angles, (terms - 1) // 2)
+    rings = np.einsum("pt,ltk->lpk", basis, level_coefficients)
+
+    # area and centroid of each cross-section; the mean of the points is biased, they are not evenly spread on the
+    # surface
+    signed_areas, centers = shoelace(rings[..., 0], rings[..., 1])
+    areas = np.abs(signed_areas)
+
+    vertices, faces = build_mesh(rings, level_z, centers)
+
+    return {"z": level_z, "rings": rings, "centers": centers, "areas": areas, "vertices": vertices, "faces": faces}
+
+
+def build_mesh(rings, level_z, centers):
+    """
+    Closed triangle mesh of the rings: the side of the pole plus a cap on each end.
+
+    :return: vertices (n x 3), faces (m x 3)
+    """
+    (levels, points) = rings.shape[:2]
+
+    side = np.concatenate((rings, np.repeat(level_z[:, np.newaxis, np.newaxis], points, axis=1)), axis=2)
+    caps = np.column_stack((centers[[0, -1]], level_z[[0, -1]]))
+    vertices = np.concatenate((side.reshape(-1, 3), caps))
+
+    # two triangles per quad between consecutive rings
+    i = np.arange(levels - 1)[:, np.newaxis] * points
+    j = np.arange(points)[np.newaxis, :]
+    v00 = (i + j).ravel()
+    v01 = (i + (j + 1) % points).ravel()
+    v10 = v00 + points
+    v11 = v01 + points
+    side_faces = np.concatenate((np.column_stack((v00, v01, v11)), np.column_stack((v00, v11, v10))))
+
+    # fans to the center of each end; the bottom one faces down
+    j = np.arange(points)
+    bottom_center = levels * points
+    bottom = np.column_stack((np.full(points, bottom_center), (j + 1) % points, j))
+    top = np.column_stack((np.full(points, bottom_center + 1), (levels - 1) * points + j,
+                           (levels - 1) * points + (j + 1) % points))
+
+    return vertices, np.concatenate((side_faces, bottom, top))
+
+
+def pole_metrics(model):
+    """
+    :param model: result of reconstruct_pole()
+    :return: dict with the length, volume, diameter at each end and mean diameter (equivalent circles), taper (change
+    in diameter per unit of length), and straightness (largest distance of the centers to their best-fit line, and
+    that distance relative to the length)
+    """
+    z = model["z"]
+    areas = model["areas"]
+    centers = model["centers"]
+    length = z[-1] - z[0]
+
+    # trapezoidal integration of the cross-section areas
+    volume = np.sum(0.5 * (areas[1:] + areas[:-1]) * np.diff(z))
+
+    diameters = 2.0 * np.sqrt(areas / np.pi)
+    taper = np.polyfit(z, diameters, 1)[0]
+
+    # best-fit line of the centers, against Z
+    a = np.column_stack((z, np.ones(len(z))))
+    fit, _, _, _ = np.linalg.lstsq(a, centers, rcond=-1)
+    deviation = np.hypot(*(centers - a.dot(fit)).T).max()
+
+    return {
+        "length": round(float(length), 2),
+        "volume": round(float(volume), 2),
+        "bottom_diameter": round(float(diameters[0]), 2),
+        "top_diameter": round(float(diameters[-1]), 2),
+        "mean_diameter": round(float(diameters.mean()), 2),
+        "taper": round(float(taper), 4),
+        "max_centerline_deviation": round(float(deviation), 2),
+        "straightness": round(float(deviation / length), 4) if length else 0.0,
+    }
+
+
+def write_ply(model, file_path, faces=True):
+    """
+    Binary PLY file with the vertices, and the faces unless only the point cloud is wanted.
+    """
+    vertices = model["vertices"].astype("<f4")
+    triangles = model["faces"]
+
+    header = ["ply", "format binary_little_endian 1.0", "comment Bamboo Scanner pole reconstruction",
+              "element vertex %s" % len(vertices), "property float x", "property float y", "property float z"]
+    if faces:
+        header += ["element face %s" % len(triangles), "property list uchar int vertex_indices"]
+    header.append("end_header\n")
+
+    with open(file_path, "wb") as f:
+        f.write("\n".join(header).encode("ascii"))
+        f.write(vertices.tobytes())
+
+        if faces:
+            records = np.empty(len(triangles), dtype=[("count", "u1"), ("indices", "<i4", (3,))])
+            records["count"] = 3
+            records["indices"] = triangles
+            f.write(records.tobytes())
+
+
+def write_stl(model, file_path):
+    """
+    Binary STL file of the mesh.
+    """
+    triangles = model["vertices"][model["faces"]]
+
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)[:, np.newaxis]
+    normals = normals / np.where(lengths > 0, lengths, 1.0)
+
+    records = np.zeros(len(triangles), dtype=[("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)),
+                                              ("attribute", "<u2")])
+    records["normal"] = normals
+    records["vertices"] = triangles
+
+    with open(file_path, "wb") as f:
+        f.write(b"Bamboo Scanner pole reconstruction".ljust(80, b" "))
+        f.write(np.array([len(records)], dtype="<u4").tobytes())
+        f.write(records.tobytes())
+
+
+def export_mesh(model, file_path):
+    """
+    Write the mesh as STL or PLY, chosen by the file extension.
+
+    :return: True if the file was written
+    """
+    try:
+        if os.path.splitext(file_path)[1].lower() == ".stl":
+            write_stl(model, file_path)
+        else:
+            write_ply(model, file_path)
+        return True
+
+    except IOError as e:
+        logger.error("I/O error(%s): %s", e.errno, e.strerror)
+        return False
@@ -0,0 +1,116 @@
+import numpy as np
+
+
+class SensorBank(object):
+    """
+    Geometry and calibration of the sensor ring, one array per property with a row per IR sensor, so readings are
+    converted to points for every sensor, and for many frames, in one go.
+
+    Each IR sensor measures along the segment from its position on the ring (start) to the point it hits on the
+    calibration object (end), which is r away from it. The ultrasonic Z reading is scaled by z_factor.
+
+    :param ir_sensors: number of IR sensors
+    """
+
+    def __init__(self, ir_sensors=0):
+        self.reset(ir_sensors)
+
+    def reset(self, ir_sensors=0):
+        self.start = np.zeros((ir_sensors, 2))
+        self.end = np.zeros((ir_sensors, 2))
+        self.r = np.zeros(ir_sensors)
+        # angle (degrees) between where each sensor points and the center of the ring
+        self.dev_angle = np.zeros(ir_sensors)
+        self.z_factor = 1.0
+
+    def __len__(self):
+        return len(self.r)
+
+    def place_on_ring(self, structure_radius, ir_sensors):
+        """
+        Start over with the sensors evenly spread on a ring, uncalibrated.
+        """
+        self.reset(ir_sensors)
+
+        angles = 2.0 * np.pi * np.arange(ir_sensors) / max(ir_sensors, 1)
+        self.start = structure_radius * np.column_stack((np.cos(angles), np.sin(angles)))
+
+    def is_calibrated(self):
+        return len(self) > 0 and bool(np.all(self.r > 0))
+
+    def calibrate(self, measured_distances, test_radius, test_distance, test_points=10000):
+        """
+        Calibrate against a reading of the calibration object, a cylinder of test_radius centered in the ring with
+        the end of the rail test_distance away: each sensor is aimed at the point of the object whose distance
+        matches its reading.
+
+        :param measured_distances: a reading per IR sensor, then the ultrasonic one
+        :param test_points: points of the object's outline that are tried
+        """
+        measured = np.asarray(measured_distances, dtype=float)
+
+        angles = 2.0 * np.pi * np.arange(test_points) / test_points
+        outline = test_radius * np.column_stack((np.cos(angles), np.sin(angles)))
+
+        # sensors x test points
+        distances = np.hypot(outline[:, 0] - self.start[:, 0, np.newaxis], outline[:, 1] - self.start[:, 1, np.newaxis])
+        closest = np.argmin(np.abs(distances - measured[:len(self), np.newaxis]), axis=1)
+
+        self.end = outline[closest]
+        self.r = distances[np.arange(len(self)), closest]
+        self.dev_angle = self.deviation_angles()
+        self.z_factor = test_distance / measured[-1]
+
+    def deviation_angles(self):
+        # angle at the start of each sensor between its end and the center of the ring
+        aim = self.end - self.start
+        center = -self.start
+        norms = np.linalg.norm(aim, axis=1) * np.linalg.norm(center, axis=1)
+        cosines = np.sum(aim * center, axis=1) / np.where(norms > 0, norms, 1.0)
+
+        return np.degrees(np.arccos(np.clip(cosines, -1.0, 1.0)))
+
+    def to_points(self, distances):
+        """
+        Convert IR readings to points.
+
+        :param distances: a reading per IR sensor; or a 2D array, a row per frame
+        :return: array of the same shape plus a last axis with x and y
+        """
+        t = np.asarray(distances, dtype=float) / self.r
+        t = t[..., np.newaxis]
+
+        return (1.0 - t) * self.start + t * self.end
+
+    def z(self, readings):
+        """
+        :return: calibrated ultrasonic readings
+        """
+        return self.z_factor * np.asarray(readings, dtype=float)
+
+    def deviations(self):
+        """
+        :return: deviation angle of each IR sensor, then the Z factor
+        """
+        return self.dev_angle.tolist() + [self.z_factor]
+
+    def to_profile(self):
+        """
+        :return: the calibration, in the layout of calibration profiles
+        """
+        return {
+            "ir_sensors": [{"xi": start[0], "yi": start[1], "xf": end[0], "yf": end[1], "r": r, "devAngle": angle}
+                           for (start, end, r, angle) in zip(self.start.tolist(), self.end.tolist(), self.r.tolist(),
+                                                            self.dev_angle.tolist())],
+            "ultrasonic": {"factor": self.z_factor},
+        }
+
+    def load_profile(self, profile):
+        sensors = profile["ir_sensors"]
+        self.reset(len(sensors))
+
+        self.start = np.array([[s["xi"], s["yi"]] for s in sensors], dtype=float).reshape(-1, 2)
+        self.end = np.array([[s["xf"], s["yf"]] for s in sensors], dtype=float).reshape(-1, 2)
+        self.r = np.array([s["r"] for s in sensors], dtype=float)
+        self.dev_angle = np.array([s["devAngle"] for s in sensors], dtype=float)
+        self.z_factor = profile["ultrasonic"]["factor"]
@@ -0,0 +1,141 @@
+import numpy as np
+
+
+class FrameFilter(object):
+    """
+    Temporal filter for the frames of the sensor ring: each call to update() takes a frame (a reading per sensor)
+    and returns the filtered frame. Every sensor has its own state, and all of them are updated at once with
+    vectorized operations.
+
+    This base class passes the frames through unchanged.
+
+    :param sensors: number of readings per frame
+    """
+
+    def __init__(self, sensors):
+        self.sensors = sensors
+        self.reset()
+
+    def reset(self):
+        # frames seen since the last reset
+        self.frames = 0
+
+    def update(self, frame):
+        x = np.asarray(frame, dtype=float)
+        self.frames += 1
+
+        return x
+
+
+class EmaFilter(FrameFilter):
+    """
+    Exponential moving average: each reading moves the output a fraction alpha of the way towards it.
+
+    :param alpha: weight of the newest reading, between 0 (frozen) and 1 (no filtering)
+    """
+
+    def __init__(self, sensors, alpha=0.3):
+        self.alpha = alpha
+        FrameFilter.__init__(self, sensors)
+
+    def reset(self):
+        FrameFilter.reset(self)
+        self.value = np.zeros(self.sensors)
+
+    def update(self, frame):
+        x = FrameFilter.update(self, frame)
+
+        # seeded with the first frame
+        if self.frames == 1:
+            self.value[:] = x
+        else:
+            self.value += self.alpha * (x - self.value)
+
+        return self.value.copy()
+
+
+class MedianFilter(FrameFilter):
+    """
+    Median of the last k readings of each sensor. Unlike averages, isolated spikes don't leak into the output.
+
+    :param k: number of frames kept
+    """
+
+    def __init__(self, sensors, k=5):
+        self.k = k
+        FrameFilter.__init__(self, sensors)
+
+    def reset(self):
+        FrameFilter.reset(self)
+        # ring buffer of the last k frames
+        self.window = np.zeros((self.k, self.sensors))
+
+    def update(self, frame):
+        x = FrameFilter.update(self, frame)
+        self.window[(self.frames - 1) % self.k] = x
+
+        return np.median(self.window[:min(self.frames, self.k)], axis=0)
+
+
+class KalmanFilter(FrameFilter):
+    """
+    Scalar Kalman filter per sensor, for a reading that stays put apart from a random walk. The gain adapts: the
+    output settles fast after a reset, then filters more as the estimate gets more certain.
+
+    :param process_noise: variance (cm^2) of the change of a reading from one frame to the next
+    :param measurement_noise: variance (cm^2) of the sensor noise
+    """
+
+    def __init__(self, sensors, process_noise=0.0025, measurement_noise=0.04):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        FrameFilter.__init__(self, sensors)
+
+    def reset(self):
+        FrameFilter.reset(self)
+        self.value = np.zeros(self.sensors)
+        self.variance = np.zeros(self.sensors)
+
+    def update(self, frame):
+        x = FrameFilter.update(self, frame)
+
+        if self.frames == 1:
+            self.value[:] = x
+            self.variance[:] = self.measurement_noise
+        else:
+            # predict, then correct
+            self.variance += self.process_noise
+            gain = self.variance / (self.variance + self.measurement_noise)
+            self.value += gain * (x - self.value)
+            self.variance *= 1.0 - gain
+
+        return self.value.copy()
+
+
+# Filters by name, their order in menus, and their names for the GUI
+FILTER_NAMES = ("none", "ema", "median", "kalman")
+
+FILTERS = {
+    "none": FrameFilter,
+    "ema": EmaFilter,
+    "median": MedianFilter,
+    "kalman": KalmanFilter,
+}
+
+FILTER_LABELS = {
+    "none": "None",
+    "ema": "Moving average",
+    "median": "Median of 5 frames",
+    "kalman": "Kalman",
+}
+
+
+def create_filter(name, sensors, **params):
+    """
+    :param name: one of FILTERS
+    :param params: parameters of the filter, defaults otherwise
+    """
+    if name not in FILTERS:
+        raise ValueError("Unknown filter: %s" % name)
+
+    return FILTERS[name](sensors, **params)
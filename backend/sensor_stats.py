@@ -0,0 +1,138 @@
+import numpy as np
+
+# Scale factor that turns a median absolute deviation into a standard deviation, for normally distributed data
+MAD_TO_STDEV = 1.4826
+
+# Number of readings used to seed the median and MAD of each sensor
+WARM_UP = 5
+
+
+class StreamingSensorStats(object):
+    """
+    Online statistics for every sensor of the ring, updated one frame (a reading per sensor) at a time with
+    vectorized operations. No samples are buffered, and every estimate can be read at any moment in O(1).
+
+    * mean and variance: Welford's algorithm.
+    * median and MAD: seeded with the first WARM_UP readings, then updated by stochastic approximation; each new
+      reading nudges the estimates towards it.
+    * clean reading: running mean of the readings that were within clip standard deviations of the clean mean
+      when they arrived. It replaces the 2-sigma clipping that used to be done on buffered samples, and keeps its
+      threshold: the standard deviation is estimated from the MAD, so the outliers themselves don't widen the gate,
+      but on normally distributed readings the same ~95% pass.
+
+    :param sensors: number of readings per frame
+    :param clip: readings further than clip standard deviations from the clean mean are outliers
+    :param resolution: smallest step the sensors can report; keeps the outlier gate open on quantized readings
+    """
+
+    def __init__(self, sensors, clip=2.0, resolution=0.01):
+        self.sensors = sensors
+        self.clip = clip
+        self.resolution = resolution
+        self.reset()
+
+    def reset(self):
+        self.count = np.zeros(self.sensors, dtype=int)
+        self.mean = np.zeros(self.sensors)
+        self.m2 = np.zeros(self.sensors)
+
+        self.median = np.zeros(self.sensors)
+        self.mad = np.zeros(self.sensors)
+
+        self.clean_count = np.zeros(self.sensors, dtype=int)
+        self.clean_mean = np.zeros(self.sensors)
+        self.clean_m2 = np.zeros(self.sensors)
+
+        # first readings of each sensor, until the median can be seeded
+        self.warm_up = np.zeros((WARM_UP, self.sensors))
+
+    def update(self, frame, mask=None):
+        """
+        Add a frame to the statistics.
+
+        :param frame: a reading for each sensor
+        :param mask: optional boolean array; only the sensors where it is True are updated
+        """
+        x = np.asarray(frame, dtype=float)
+        active = np.ones(self.sensors, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+
+        warming_up = active & (self.count < WARM_UP)
+        running = active & ~warming_up
+
+        # readings that pass the outlier gate; decided before the estimates move towards this frame
+        accepted = running & (np.abs(x - self.clean_mean) <= self.gate())
+
+        # Welford
+        self.count += active
+        n = np.maximum(self.count, 1)
+        delta = np.where(active, x - self.mean, 0.0)
+        self.mean += delta / n
+        self.m2 += delta * np.where(active, x - self.mean, 0.0)
+
+        # Stochastic approximation of median and MAD, with a gain proportional to the spread of the data
+        gain = np.where(running, 2.5 * self.robust_stdev() / n, 0.0)
+        self.median += gain * np.sign(x - self.median)
+        self.mad += gain * np.sign(np.abs(x - self.median) - self.mad)
+        np.maximum(self.mad, 0.0, out=self.mad)
+
+        self.add_clean(x, accepted)
+
+        # keep the first readings
+        slot = np.minimum(self.count - 1, WARM_UP - 1)
+        columns = np.nonzero(warming_up)[0]
+        self.warm_up[slot[columns], columns] = x[columns]
+
+        # warm up is over: exact median and MAD of the first readings, which also seed the clean mean
+        ready = warming_up & (self.count == WARM_UP)
+        if ready.any():
+            readings = self.warm_up[:, ready]
+            self.median[ready] = np.median(readings, axis=0)
+            self.mad[ready] = np.median(np.abs(readings - self.median[ready]), axis=0)
+
+            gate = self.clip * np.maximum(MAD_TO_STDEV * self.mad[ready], self.resolution)
+            passed = np.zeros((WARM_UP, self.sensors), dtype=bool)
+            passed[:, ready] = np.abs(readings - self.median[ready]) <= gate
+            for row in range(WARM_UP):
+                self.add_clean(self.warm_up[row], passed[row])
+
+    def add_clean(self, x, accepted):
+        # Welford on the accepted readings
+        self.clean_count += accepted
+        delta = np.where(accepted, x - self.clean_mean, 0.0)
+        self.clean_mean += delta / np.maximum(self.clean_count, 1)
+        self.clean_m2 += delta * np.where(accepted, x - self.clean_mean, 0.0)
+
+    def robust_stdev(self):
+        # the MAD of a few readings underestimates the spread; the accepted readings' stdev backs it up
+        return np.maximum(np.maximum(MAD_TO_STDEV * self.mad, self.clean_stdev()), self.resolution)
+
+    def gate(self):
+        return self.clip * self.robust_stdev()
+
+    def samples(self):
+        """
+        :return: the least number of readings received by any sensor
+        """
+        return int(self.count.min()) if self.sensors else 0
+
+    def variance(self):
+        return np.where(self.count > 1, self.m2 / np.maximum(self.count - 1, 1), 0.0)
+
+    def stdev(self):
+        return np.sqrt(self.variance())
+
+    def clean_stdev(self):
+        return np.sqrt(np.where(self.clean_count > 1, self.clean_m2 / np.maximum(self.clean_count - 1, 1), 0.0))
+
+    def clean_standard_error(self):
+        """
+        :return: standard error of each sensor's clean reading; infinite until it has 2 accepted readings
+        """
+        return np.where(self.clean_count > 1, self.clean_stdev() / np.sqrt(np.maximum(self.clean_count, 1)), np.inf)
+
+    def clean(self):
+        """
+        :return: the outlier-free reading of each sensor, rounded to 2 decimals. Sensors that are still warming up
+        report their mean.
+        """
+        return np.round(np.where(self.clean_count > 0, self.clean_mean, self.mean), 2)
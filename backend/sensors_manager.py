@@ -1,370 +1,701 @@
+import collections
+import logging
 import math
-import statistics
+import threading
 import time
-import warnings
 
+import numpy as np
 import serial
 import serial.tools.list_ports
+from serial import SerialException
 
-sensorArray = []
+from backend import calibration_profiles, instrumentation, sensor_filters
+from backend.sensor_bank import SensorBank
+from backend.sensor_stats import StreamingSensorStats
+
+logger = logging.getLogger(__name__)
+
+# Geometry and calibration of the IR sensors and the ultrasonic; updated in place, other modules import it
+sensorBank = SensorBank()
 
 numberOfSamples = 10
-cacheStructuredSensorData = []
-usingCache = False
+
+# Adaptive capture, off by default: each sensor is sampled until the standard error (cm) of its clean reading falls
+# below adaptiveTolerance, or until maxNumberOfSamples run out. Every capture gives up after captureTimeBudget seconds.
+adaptiveCapture = False
+adaptiveTolerance = 0.05
+minNumberOfSamples = 5
+maxNumberOfSamples = 50
+captureTimeBudget = 3.0
+# Number of samples each sensor needed in the last capture
+lastCaptureSampleCounts = []
+
+# Temporal filter applied to the frames of the live feed (see sensor_filters.py)
+frameFilterName = "none"
+frameFilterParams = {}
+frameFilter = None
 
 arduinoSerial = serial.Serial()
 isPortOpen = False
+# Ports of the open Arduinos
+openPorts = []
 
+# Serial backend. When serialFactory is None, Arduino ports are discovered with list_ports and opened with
+# serial.Serial. Otherwise serialFactory(port) is used to open the ports in serialPorts (see arduino_simulator.py)
+serialFactory = None
+serialPorts = []
+# Seconds to wait after opening a port; the Arduino resets when the port is opened
+portResetDelay = 3
 
-# Returns usingCache value. Determines if system looks for new data or uses
-# data stored in cacheStructuredSensorData
-def isUsingCache():
-    global usingCache
-    return usingCache
 
+# Replaces the serial backend. factory(port) must return an object with the write(), readline() and close()
+# methods of serial.Serial.
+def setSerialBackend(factory, ports, resetDelay=0):
+    global serialFactory, serialPorts, portResetDelay
 
-# Clears cache, both usingCache and cacheStructuredSensorDara
-def clearCache():
-    global usingCache, cacheStructuredSensorData
+    serialFactory = factory
+    serialPorts = list(ports)
+    portResetDelay = resetDelay
 
-    usingCache = False
-    cacheStructuredSensorData.clear()
-    print("Cache Cleared")
 
+# Goes back to real hardware
+def resetSerialBackend():
+    global serialFactory, serialPorts, portResetDelay
 
-# Returns a line of raw data from Arduino. closeArduinoSerial() must be invoked
-# after this function.
-def getInstantRawSensorData():
-    global arduinoSerial, isPortOpen
+    serialFactory = None
+    serialPorts = []
+    portResetDelay = 3
 
-    if isPortOpen:
-        readLine = arduinoSerial.readline()
-        lineFromPort = str(readLine)[2:len(readLine)]
 
-        splittedArray = lineFromPort.split(";")
+# Identifies the connected sensor ring: the USB serial numbers of its Arduinos (their hardware ids, or port names,
+# when there are none). Calibration profiles are tied to it.
+def getDeviceId():
+    if serialFactory is not None:
+        return "+".join(openPorts)
 
-        return splittedArray
+    identities = {p.device: p.serial_number or p.hwid for p in serial.tools.list_ports.comports()}
 
-    else:
-        openArduinoSerial()
-        return getInstantRawSensorData()
+    return "+".join(identities.get(port) or port for port in openPorts)
+
+
+# Returns the number of samples each sensor needed in the last capture
+def getLastCaptureSampleCounts():
+    return lastCaptureSampleCounts
+
+
+# Switches between fixed (numberOfSamples) and adaptive captures.
+def setAdaptiveCapture(enabled):
+    global adaptiveCapture
 
+    adaptiveCapture = bool(enabled)
 
-# Gets data from Arduino and stores it in an array containing strings of the
-# raw data from USB bus. Returns array with strings.
-def getRawSensorData():
+
+# Converts a line from the Arduino into an array of floats, one per sensor. Raises ValueError if the line is
+# incomplete or garbled.
+def parseSensorLine(lineFromPortByteArray):
+    lineFromPort = lineFromPortByteArray.decode("ascii", errors="replace").strip()
+
+    return np.array(lineFromPort.split(";"), dtype=float)
+
+
+# Reads lines from the Arduino until a complete frame arrives. Returns an array of floats, one per sensor.
+def readSensorFrame():
     ser = openArduinoSerial()
 
-    resultsFromPort = []
+    while True:
+        try:
+            return parseSensorLine(ser.readline())
+        except ValueError:
+            # Partial line, usually the first one after opening the port
+            instrumentation.count("sensors.garbled_lines")
+            continue
 
-    # Determines number of samples to be taken from USB bus
-    for i in range(numberOfSamples):
-        lineFromPortByteArray = ser.readline()
-        # Convert bytes from USB to string. Strips first two characters
-        lineFromPort = str(lineFromPortByteArray)[2:len(lineFromPortByteArray)]
-        resultsFromPort.append(lineFromPort)
 
-    return resultsFromPort
+# Selects the temporal filter of the frames: a name from sensor_filters.FILTERS, and its parameters.
+def setFrameFilter(name, **params):
+    global frameFilterName, frameFilterParams, frameFilter
 
+    if name not in sensor_filters.FILTERS:
+        raise ValueError("Unknown filter: %s" % name)
 
-# Gets raw sensor data and creates an array of arrays. Each array contains sensor data
-# correlated to its position (index 0 contains an array with S0 data from samples).
-def getStructuredSensorData():
-    # Has to be done in order to reference global variable
-    global usingCache, cacheStructuredSensorData
+    frameFilterName = name
+    frameFilterParams = params
+    # created with the next frame, once the number of sensors is known
+    frameFilter = None
 
-    if (usingCache == True):
-        if (len(cacheStructuredSensorData) <= 0):
-            usingCache = False
-            getStructuredSensorData()
-        else:
-            return cacheStructuredSensorData
 
-    else:
+# Forgets the readings the filter has seen; the next frame starts it over.
+def resetFrameFilter():
+    if frameFilter is not None:
+        frameFilter.reset()
 
-        finalArray = []
-        resultsFromPort = getRawSensorData()
-        # Just to determine number of sensors reported by Arduino
-        firstSplit = resultsFromPort[0].split(";")
-        numberOfSensors = len(firstSplit)
 
-        # Creates an array per sensor
-        for i in range(numberOfSensors):
-            finalArray.append([])
+# Passes a frame through the temporal filter. Filtered frames are only displayed; see captureSensorStats().
+def filterFrame(frame):
+    global frameFilter
 
-        # Iterates through samples and save each sensor data to its respective array
-        for i in range(0, len(resultsFromPort)):
+    if frameFilter is None or frameFilter.sensors != len(frame):
+        frameFilter = sensor_filters.create_filter(frameFilterName, len(frame), **frameFilterParams)
 
-            splittedLine = resultsFromPort[i].split(";")
-            # print(splittedLine)
+    return frameFilter.update(frame)
 
-            for j in range(numberOfSensors):
-                finalArray[j].append(float(splittedLine[j]))
 
-        # Cache data is now the data just collected
-        # cacheStructuredSensorData = finalArray
-        # Forces to use cache unless cache is cleared by invoking clearCache()
-        # usingCache = True
+# Reads the next complete frame and passes it through the temporal filter.
+def readFilteredFrame():
+    return filterFrame(readSensorFrame())
 
-        return finalArray
 
+# Feeds raw frames from the Arduino to a StreamingSensorStats until the capture is complete. A fixed capture takes
+# numberOfSamples readings from every sensor. An adaptive capture stops sampling each sensor as soon as its clean
+# reading is precise enough. Either gives up after captureTimeBudget seconds, with the samples it has.
+# The frames aren't filtered: the standard error of the clean readings assumes independent samples, and filtered
+# readings would make a capture stop early with a precision it doesn't have.
+def captureSensorStats(adaptive):
+    stats = None
+    pending = None
+    start = time.perf_counter()
 
-# Gets the Mean from each sensor data. Returns an array of floats.
-def getMeanSensorData():
-    try:
-        data = getStructuredSensorData()
-        resultArray = []
+    # Frames narrower than this lost some readings on the way. The calibrated ring says how wide they must be;
+    # otherwise the widest frame seen so far does.
+    width = len(sensorBank) + 1 if len(sensorBank) else 0
 
-        for i in range(0, len(data)):
-            resultArray.append(round(statistics.mean(data[i]), 2))
+    while True:
+        frame = readSensorFrame()
+        out_of_time = time.perf_counter() - start >= captureTimeBudget
 
-        return resultArray
+        # a wider frame than the previous ones: those were truncated, start over
+        if len(frame) >= width and (stats is None or len(frame) > stats.sensors):
+            width = len(frame)
+            stats = StreamingSensorStats(width)
+            pending = np.ones(width, dtype=bool)
 
-    except statistics.StatisticsError as e:
-        print("There was an error with the statistics module")
-        print(e)
-        return []
+        if stats is None:
+            if out_of_time:
+                raise SerialException("No complete frame within %s s" % captureTimeBudget)
+            continue
 
+        # skip frames that lost some readings on the way
+        if len(frame) == stats.sensors:
+            stats.update(frame, mask=pending)
 
-# Gets the Standard Deviation from each sensor data. Returns an array of floats.
-def getStdevSensorData():
-    try:
-        data = getStructuredSensorData()
-        resultArray = []
+        if adaptive:
+            # stop sampling the sensors that are done
+            converged = (stats.count >= minNumberOfSamples) & (stats.clean_standard_error() <= adaptiveTolerance)
+            pending &= ~converged
 
-        for i in range(0, len(data)):
-            resultArray.append(round(statistics.stdev(data[i]), 2))
+            if not pending.any() or stats.count.max() >= maxNumberOfSamples:
+                return stats
 
-        return resultArray
+        elif stats.samples() >= numberOfSamples:
+            return stats
 
-    except statistics.StatisticsError as e:
-        print("There was an error with the statistics module")
-        print(e)
-        return []
+        if out_of_time:
+            logger.warning("Capture ran out of time with %s to %s samples per sensor", stats.count.min(),
+                           stats.count.max())
+            return stats
 
 
-# Removes outliers using mean and stdev for each sensor data. After removing ouliers,
-# returns the average of the remaining data.
+# Removes outliers from each sensor's readings, and returns the average of the remaining data.
+# Frames are fed to an online estimator as they arrive, so samples are neither buffered nor re-scanned.
+@instrumentation.timed("sensors.getCleanSensorData")
 def getCleanSensorData():
-    finalArray = []
-    structuredData = getStructuredSensorData()
-    meanData = getMeanSensorData()
-    stdevData = getStdevSensorData()
+    global lastCaptureSampleCounts
 
-    # print(structuredData)
-    # print(meanData)
-    # print(stdevData)
+    stats = captureSensorStats(adaptiveCapture)
+    lastCaptureSampleCounts = stats.count.tolist()
 
-    for i in range(0, len(structuredData)):
-        s = structuredData[i]
-        mean = meanData[i]
-        stdev = stdevData[i]
-        temp_list = [x for x in s if (x > mean - 2 * stdev)]
-        temp_list = [x for x in temp_list if (x < mean + 2 * stdev)]
+    return stats.clean().tolist()
 
-        if (len(temp_list) > 0):
-            finalArray.append(round(statistics.mean(temp_list), 2))
 
-        else:
-            finalArray.append(0.0)
+# Same as getCleanSensorData(), for frames that were already read (a 2D array, a row per frame).
+def cleanSensorFrames(frames):
+    global lastCaptureSampleCounts
 
-    return finalArray
+    frames = np.asarray(frames, dtype=float)
+    stats = StreamingSensorStats(frames.shape[1])
+    for frame in frames:
+        stats.update(frame)
 
+    lastCaptureSampleCounts = stats.count.tolist()
 
-# Looks for Arduino port and opens it.
-def openArduinoSerial():
-    global arduinoSerial, isPortOpen
+    return stats.clean().tolist()
 
-    if not isPortOpen:
-        print("Searching for Arduino Port...")
 
-        arduino_ports = [  # List of ports containing the word Arduino in their description
-            p.device
-            for p in serial.tools.list_ports.comports()
-            if 'Arduino' in p.description
-        ]
-        if not arduino_ports:
-            raise IOError("No Arduino found")
-        if len(arduino_ports) > 1:
-            warnings.warn('Multiple Arduinos found - using the first')
+# Returns the ports of the connected Arduinos, or the ports of the plugged-in serial backend.
+def findArduinoPorts():
+    if serialFactory is not None:
+        return list(serialPorts)
 
-        arduinoSerial = serial.Serial(arduino_ports[0])
-        print("Arduino Port found at %s" % (arduino_ports[0]))
+    return [  # List of ports containing the word Arduino in their description
+        p.device
+        for p in serial.tools.list_ports.comports()
+        if 'Arduino' in p.description
+    ]
 
-        time.sleep(3)
 
-        print("NOTICE: START signal send to Arduino")
+# Opens an Arduino port and waits for the START handshake.
+def openSerialDevice(port):
+    if serialFactory is not None:
+        device = serialFactory(port)
+    else:
+        device = serial.Serial(port)
+    logger.info("Arduino port found at %s", port)
 
-        # Send START signal to Arduino. Has to be encoded from string to bytes.
-        arduinoSerial.write("START".encode())
-        readLine = arduinoSerial.readline()
+    time.sleep(portResetDelay)
 
-        # Checks for handshake STARTREC
-        while ("STARTREC" not in str(readLine)[2:len(readLine)]):
-            print("WARNING: START not received, trying again...")
-            print(readLine)
-            time.sleep(1)
-            # Send START signal again
-            arduinoSerial.write("START".encode())
-            readline = arduinoSerial.readline()
+    logger.info("START signal sent to Arduino")
 
-        print("NOTICE: Arduino Handshake Received")
+    # Send START signal to Arduino. Has to be encoded from string to bytes.
+    device.write("START".encode())
+    readLine = device.readline()
 
-        isPortOpen = True
+    # Checks for handshake STARTREC
+    while ("STARTREC" not in str(readLine)[2:len(readLine)]):
+        logger.warning("START not received, trying again... (got %r)", readLine)
+        time.sleep(1)
+        # Send START signal again
+        device.write("START".encode())
+        readLine = device.readline()
 
-    return arduinoSerial
+    logger.info("Arduino handshake received")
 
+    return device
 
-def closeArduinoSerial():
-    global arduinoSerial, isPortOpen
 
-    arduinoSerial.write("STOP".encode())
-    readLine = arduinoSerial.readline()
+# Sends the STOP signal to an Arduino, waits for the handshake, and closes its port.
+def closeSerialDevice(device):
+    device.write("STOP".encode())
+    readLine = device.readline()
 
     # Checks for handshake STOPREC
     while ("STOPREC" not in str(readLine)[2:len(readLine)]):
-        print("WARNING: STOP not received, trying again...")
+        logger.warning("STOP not received, trying again...")
         time.sleep(1)
         # Send STOP signal again
-        arduinoSerial.write("STOP".encode())
-        readLine = arduinoSerial.readline()
+        device.write("STOP".encode())
+        readLine = device.readline()
+
+    logger.info("Arduino handshake received")
+
+    device.close()
+
+
+# Looks for Arduino ports and opens them. When several Arduinos are connected, their readings are merged into a
+# single frame (see MultiArduinoSerial).
+@instrumentation.timed("sensors.openArduinoSerial")
+def openArduinoSerial():
+    global arduinoSerial, isPortOpen, openPorts
+
+    if not isPortOpen:
+        logger.info("Searching for Arduino port...")
+
+        arduino_ports = findArduinoPorts()
+        if not arduino_ports:
+            raise IOError("No Arduino found")
+
+        if len(arduino_ports) > 1:
+            logger.info("%s Arduinos found, merging their readings", len(arduino_ports))
+            arduinoSerial = MultiArduinoSerial(arduino_ports)
+        else:
+            arduinoSerial = openSerialDevice(arduino_ports[0])
+
+        openPorts = arduino_ports
+        isPortOpen = True
+
+    return arduinoSerial
+
+
+def closeArduinoSerial():
+    global arduinoSerial, isPortOpen
+
+    if isinstance(arduinoSerial, MultiArduinoSerial):
+        arduinoSerial.close()
+    else:
+        closeSerialDevice(arduinoSerial)
+
+    isPortOpen = False
+
+
+# Discards the frames waiting in the serial buffer.
+def resetInputBuffer():
+    if isPortOpen:
+        arduinoSerial.reset_input_buffer()
+
+    # the filter state is as stale as the frames
+    resetFrameFilter()
 
-    print("NOTICE: Arduino Handshake Received")
 
-    arduinoSerial.close()
+# Closes the port of an Arduino that was disconnected, without the STOP handshake.
+def abandonArduinoSerial():
+    global isPortOpen
+
+    try:
+        arduinoSerial.close()
+    except (SerialException, OSError):
+        pass
+
     isPortOpen = False
 
 
 ###########################################################
-## CALIBRATION
+## MULTIPLE ARDUINOS
 ###########################################################
 
-def twoPointDistance(p1, p2):
-    return math.sqrt(pow(p1[0] - p2[0], 2) + pow(p1[1] - p2[1], 2))
+class SerialReader(threading.Thread):
+    """
+    Reads frames from one Arduino as fast as they arrive, and keeps the most recent ones along with the time they
+    were received.
+    """
+
+    def __init__(self, port, condition, history=64):
+        threading.Thread.__init__(self, daemon=True)
+        self.port = port
+        self.condition = condition
+
+        self.device = None
+        # (timestamp, frame) tuples, oldest first
+        self.frames = collections.deque(maxlen=history)
+        self.error = None
+        self.stopping = threading.Event()
+
+    def run(self):
+        try:
+            self.device = openSerialDevice(self.port)
+
+            with self.condition:
+                self.condition.notify_all()
+
+            while True:
+                readLine = self.device.readline()
+
+                # close() sent the STOP signal
+                if self.stopping.is_set():
+                    if "STOPREC" in str(readLine)[2:len(readLine)]:
+                        break
+                    continue
+
+                try:
+                    frame = parseSensorLine(readLine)
+                except ValueError:
+                    continue
+
+                with self.condition:
+                    self.frames.append((time.perf_counter(), frame))
+                    self.condition.notify_all()
+
+        except Exception as e:
+            # reported to the consumer by MultiArduinoSerial.readline(); any error, so nobody waits for a dead reader
+            with self.condition:
+                self.error = e
+
+        finally:
+            with self.condition:
+                self.condition.notify_all()
+
+
+class MultiArduinoSerial(object):
+    """
+    Acquires frames from several Arduinos in parallel, one SerialReader thread per port, and aligns them by arrival
+    time. It behaves like a single port whose lines hold the IR readings of every board, in port order, followed by
+    the average Z reading of the boards that have an ultrasonic sensor.
+
+    :param ports: the ports of the Arduinos; the first one paces the combined frames
+    :param zBoards: indices of the boards whose last reading is an ultrasonic Z sensor; None means all of them
+    :param maxSkew: maximum time difference (s) between frames merged together
+    :param openTimeout: time (s) allowed for every port to open and answer the handshake
+    """
+
+    def __init__(self, ports, zBoards=None, maxSkew=0.05, openTimeout=None):
+        self.ports = list(ports)
+        self.zBoards = range(len(self.ports)) if zBoards is None else zBoards
+        self.maxSkew = maxSkew
+
+        self.condition = threading.Condition()
+        self.readers = [SerialReader(port, self.condition) for port in self.ports]
+
+        # timestamp of the last frame of the first board that was merged
+        self.lastTimestamp = 0.0
+
+        # open every port at the same time; each Arduino resets when its port is opened
+        for reader in self.readers:
+            reader.start()
+
+        if openTimeout is None:
+            openTimeout = portResetDelay + 10
+
+        with self.condition:
+            opened = self.condition.wait_for(
+                lambda: all(reader.device is not None or reader.error is not None for reader in self.readers),
+                timeout=openTimeout)
+
+        if not opened:
+            self.close()
+            late = [reader.port for reader in self.readers if reader.device is None and reader.error is None]
+            raise SerialException("Arduino at %s did not answer within %s s" % (", ".join(late), openTimeout))
+
+        try:
+            self.checkErrors()
+        except SerialException:
+            self.close()
+            raise
+
+    def checkErrors(self):
+        for reader in self.readers:
+            if reader.error is not None:
+                raise SerialException("Arduino at %s: %s" % (reader.port, reader.error))
+
+    def nearestFrame(self, reader, timestamp):
+        # frame of a reader closest in time to timestamp, if within maxSkew
+        best = None
+        for (frameTimestamp, frame) in reader.frames:
+            skew = abs(frameTimestamp - timestamp)
+            if skew <= self.maxSkew and (best is None or skew < best[0]):
+                best = (skew, frame)
+
+        return best[1] if best is not None else None
+
+    def merge(self, frames):
+        irReadings = []
+        zReadings = []
+
+        for i, frame in enumerate(frames):
+            if i in self.zBoards:
+                irReadings.append(frame[:-1])
+                zReadings.append(frame[-1])
+            else:
+                irReadings.append(frame)
+
+        return np.append(np.concatenate(irReadings), np.mean(zReadings))
+
+    def readline(self):
+        """
+        Waits for the next frame of the first board, and the frames of the other boards that arrived at about the
+        same time. Frames of the first board that can't be matched are dropped.
+
+        :return: the combined frame, formatted like a line from a single Arduino
+        """
+        primary = self.readers[0]
+
+        with self.condition:
+            while True:
+                self.checkErrors()
+
+                # next frame of the first board
+                pending = [entry for entry in primary.frames if entry[0] > self.lastTimestamp]
+                if not pending:
+                    self.condition.wait()
+                    continue
+
+                (timestamp, frame) = pending[0]
+
+                # wait until the other boards catch up, or until it's too late to match this frame
+                deadline = timestamp + self.maxSkew
+                while True:
+                    self.checkErrors()
+
+                    caught_up = all(reader.frames and reader.frames[-1][0] >= timestamp
+                                    for reader in self.readers[1:])
+                    remaining = deadline - time.perf_counter()
+                    if caught_up or remaining <= 0:
+                        break
+
+                    self.condition.wait(remaining)
+
+                self.lastTimestamp = timestamp
+
+                frames = [frame] + [self.nearestFrame(reader, timestamp) for reader in self.readers[1:]]
+                if all(f is not None for f in frames):
+                    break
+
+        line = ";".join("%.2f" % value for value in self.merge(frames))
+        return (line + "\r\n").encode()
+
+    def write(self, data):
+        # START and STOP handshakes are handled for each port by openSerialDevice() and close()
+        pass
+
+    def reset_input_buffer(self):
+        with self.condition:
+            for reader in self.readers:
+                reader.frames.clear()
+            self.lastTimestamp = time.perf_counter()
+
+    def close(self):
+        # readers stop at the STOPREC handshake
+        for reader in self.readers:
+            reader.stopping.set()
+            if reader.device is not None:
+                reader.device.write("STOP".encode())
+
+        # a reader still waiting for its handshake can't be stopped; it's a daemon thread
+        for reader in self.readers:
+            if reader.device is not None:
+                reader.join(timeout=5)
+                reader.device.close()
 
 
-def threePointAngle(vertexp1, p2, p3):
-    p12 = twoPointDistance(vertexp1, p2)
-    p13 = twoPointDistance(vertexp1, p3)
-    p23 = twoPointDistance(p2, p3)
+###########################################################
+## CALIBRATION
+###########################################################
 
-    result = math.acos((pow(p12, 2.0) + pow(p13, 2.0) - pow(p23, 2)) / (2.0 * p12 * p13)) * (180.0 / math.pi)
-    # print(result)
-    return result
+def initSensors(structureRadius=16.0):
+    # one IR sensor per reading, but the last one: it's the ultrasonic
+    numberOfSensors = len(readSensorFrame())
 
+    sensorBank.place_on_ring(structureRadius, numberOfSensors - 1)
 
-class IRSensor(object):
-    # The class "constructor" - It's actually an initializer
-    def __init__(self, xi, yi):
-        self.xi = xi
-        self.yi = yi
-        self.xf = 0.0
-        self.yf = 0.0
-        self.r = 0.0  # CAMABIAR A 0
-        self.isCalibrated = False
-        self.repeatMeasurement = False
-        self.devAngle = 0
 
+@instrumentation.timed("sensors.calibrateAllSensors")
+def calibrateAllSensors(testRadius=1.58, testDistance=10, measuredDistances=None):
+    if len(sensorBank) == 0:
+        initSensors()
 
-class UltSensor(object):
-    # The class "constructor" - It's actually an initializer
-    def __init__(self):
-        self.factor = 1
+    # a reading already taken with the calibration object in place can be reused
+    if measuredDistances is None:
+        measuredDistances = getCleanSensorData()
 
+    sensorBank.calibrate(measuredDistances, testRadius, testDistance)
 
-def PointsInCircum(r, n):
-    return [(math.cos(2 * math.pi / n * x) * r, math.sin(2 * math.pi / n * x) * r) for x in range(0, n + 1)]
 
+###############################################################
+def isCalibrated(numberOfSensors=None):
+    """
+    :param numberOfSensors: number of IR sensors in the frames to convert, if known
+    :return: True if the sensors have been calibrated, and their number matches
+    """
+    if not sensorBank.is_calibrated():
+        return False
+
+    return numberOfSensors is None or numberOfSensors == len(sensorBank)
+
+
+def frameToPoints(readings, structureRadius=16.0):
+    """
+    Convert IR readings to points on the surface of the pole, with the ring's center at (0, 0). The calibrated
+    sensorBank is used when there is one for this number of sensors; otherwise the ideal geometry is assumed: sensors
+    evenly spread on the ring, pointing at its center.
+
+    :param readings: one reading per IR sensor (no ultrasonic); or a 2D array, a row per frame
+    :param structureRadius: radius of the ring the sensors are mounted on
+    :return: numpy arrays x, y, and a boolean array of the readings that saw something inside the ring, all shaped
+    like readings
+    """
+    distances = np.asarray(readings, dtype=float)
+    n = distances.shape[-1]
+
+    if isCalibrated(n):
+        points = sensorBank.to_points(distances)
+        x, y = points[..., 0], points[..., 1]
+    else:
+        angles = 2.0 * np.pi * np.arange(n) / max(n, 1)
+        x = np.cos(angles) * (structureRadius - distances)
+        y = np.sin(angles) * (structureRadius - distances)
 
-def initSensors(structureRadius):
-    global sensorArray
+    valid = (distances > 0) & (distances < structureRadius)
 
-    numberOfSensors = len(getStructuredSensorData())
-    # numberOfSensors = 12 #TEMPORAL TWEAK
-    # print(numberOfSensors)
+    return x, y, valid
 
-    points = PointsInCircum(structureRadius, numberOfSensors - 1)
-    # print(points)
 
-    for i in range(0, numberOfSensors - 1):
-        point = points[i]
-        sensorArray.append(IRSensor(point[0], point[1]))
+def fitCircle(x, y):
+    """
+    Least-squares circle through the points (algebraic fit).
 
-    sensorArray.append(UltSensor())
+    :return: (centerX, centerY, radius), or None if there are less than 3 points
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) < 3:
+        return None
 
+    # x^2 + y^2 = 2*cx*x + 2*cy*y + c, with c = r^2 - cx^2 - cy^2
+    a = np.column_stack((2.0 * x, 2.0 * y, np.ones(len(x))))
+    b = x * x + y * y
+    (cx, cy, c), _, rank, _ = np.linalg.lstsq(a, b, rcond=-1)
+    if rank < 3:
+        return None
 
-def calibrateSingleIRSensor(s, distanceMeasured, testRadius):
-    closestDiff = 999999
-    closestPoint = (0, 0)
-    r = 0.0
+    return cx, cy, math.sqrt(max(c + cx * cx + cy * cy, 0.0))
 
-    testPoints = PointsInCircum(testRadius, 10000)
 
-    for p in testPoints:
-        tempDistance = math.sqrt(pow((p[0] - s.xi), 2) + pow((p[1] - s.yi), 2))
-        tempDiff = math.fabs(tempDistance - distanceMeasured)
+def distToPointAllIRSensors():
+    if len(sensorBank) == 0:
+        initSensors()
 
-        if (tempDiff < closestDiff):
-            closestDiff = tempDiff
-            closestPoint = p
-            r = tempDistance
+    measurements = getCleanSensorData()
 
-    # print(closestPoint)
-    s.xf = closestPoint[0]
-    s.yf = closestPoint[1]
-    print(closestPoint)
-    s.r = r
+    return [tuple(point) for point in sensorBank.to_points(measurements[:len(sensorBank)]).tolist()]
 
-    deviation = threePointAngle((s.xi, s.yi), closestPoint, (0, 0))  # HACER TEST
 
-    # print(deviation)
+###############################################################
+## CALIBRATION PROFILES
+###############################################################
 
-    return s
+# Drift allowed before a calibration profile must be redone: distance (cm) of an IR reading from the surface of the
+# calibration object, and relative error of the ultrasonic reading
+irDriftTolerance = 0.3
+ultrasonicDriftTolerance = 0.05
 
 
-def calibrateSingleUltSensor(s, distanceMeasured, testDistance):
-    s.factor = testDistance / distanceMeasured
+# Returns the calibration of sensorBank, in the layout of calibration profiles
+def getCalibrationProfile():
+    return sensorBank.to_profile()
 
-    return s
 
+# Calibrates sensorBank from a calibration profile
+def applyCalibrationProfile(profile):
+    sensorBank.load_profile(profile)
 
-def calibrateAllSensors(testRadius=1.58, testDistance=10):
-    global sensorArray
 
-    if (len(sensorArray) == 0):
-        initSensors()
+def loadCalibrationProfile(ringDiameter):
+    """
+    Calibrate the sensors with the saved profile of this ring and device, if there is one. Otherwise the sensors are
+    left uncalibrated, so a calibration made for another ring is never used.
 
-    measuredDistances = getCleanSensorData()
-    arraySize = len(sensorArray)
+    :return: the profile, or None
+    """
+    profile = calibration_profiles.load_profile(ringDiameter, getDeviceId())
 
-    for i in range(0, arraySize - 1):
-        sensorArray[i] = calibrateSingleIRSensor(sensorArray[i], measuredDistances[i], testRadius)
+    if profile is None:
+        sensorBank.reset()
+        return None
 
-    sensorArray[arraySize - 1] = calibrateSingleUltSensor(sensorArray[arraySize - 1], measuredDistances[arraySize - 1],
-                                                          testDistance)
+    applyCalibrationProfile(profile)
+    logger.info("Calibration profile loaded (revision %s, %s)", profile["revision"], profile["created"])
 
+    return profile
 
-###############################################################
-def distToPointSingleIRSensor(s, distanceMeasured):
-    t = distanceMeasured / s.r
 
-    if (t < 0 or distanceMeasured > 16):  # 16cm is the radius of the structure
-        s.repeatReading = True
+def saveCalibrationProfile(ringDiameter, testRadius, testDistance):
+    """
+    Save the calibration of sensorBank as a new revision of the profile of this ring and device.
 
-    newCoordinate = (round(((1.0 - t) * s.xi) + (t * s.xf), 3), round(((1.0 - t) * s.yi) + (t * s.yf), 3))
-    return newCoordinate
+    :return: the saved profile, or None if it couldn't be written
+    """
+    settings = {"calibration_obj_radius": testRadius, "rail_z_distance": testDistance}
 
+    return calibration_profiles.save_profile(ringDiameter, getDeviceId(), getCalibrationProfile(), settings)
 
-def distToPointAllIRSensors():
-    global sensorArray
-    resultCoordinates = []
 
-    if (len(sensorArray) == 0):
-        initSensors()
+def validateCalibration(measuredDistances, testRadius, testDistance):
+    """
+    Check the calibration of sensorBank against a reading of the calibration object: every IR reading should land
+    on its surface, and the ultrasonic reading should match the distance to the end of the rail.
 
-    measurements = getCleanSensorData()
+    :param measuredDistances: clean readings of every sensor, as given by getCleanSensorData()
+    :return: dict with the error of each IR sensor (cm), the largest one, the relative ultrasonic error, and whether
+    the sensors drifted beyond the tolerances
+    """
+    if not isCalibrated(len(measuredDistances) - 1):
+        return {"ir_errors": [], "max_ir_error": None, "z_error": None, "drift": True}
 
-    for i in range(0, len(sensorArray) - 1):
-        resultCoordinates.append(distToPointSingleIRSensor(sensorArray[i], measurements[i]))
+    readings = np.asarray(measuredDistances, dtype=float)
+    points = sensorBank.to_points(readings[:-1])
+    irErrors = np.abs(np.hypot(points[:, 0], points[:, 1]) - testRadius)
+    zError = abs(sensorBank.z(readings[-1]) - testDistance) / testDistance
 
-    return resultCoordinates
+    return {
+        "ir_errors": irErrors.round(3).tolist(),
+        "max_ir_error": round(float(irErrors.max()), 3),
+        "z_error": round(float(zError), 4),
+        "drift": bool(irErrors.max() > irDriftTolerance or zError > ultrasonicDriftTolerance),
+    }
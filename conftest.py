@@ -0,0 +1 @@
+# Lets the tests import the backend package from the root of the repository, the way main.py does
@@ -1,6 +1,7 @@
 from tkinter import *
 
-from backend.bpc import set_sampleDescription, set_calibration_settings
+from backend.bpc import set_sampleDescription, set_calibration_settings, set_filter_settings, set_capture_settings
+from backend.sensor_filters import FILTER_LABELS, FILTER_NAMES
 from gui.widgets.custom import ScrollableTextArea, YellowButton, EntryWithPlaceholder
 from gui.widgets.helpers import make_columns_responsive, make_rows_responsive
 
@@ -68,6 +69,26 @@ class ConfigBPC(Frame):
                                                      validatecommand=validate_cmd, textvariable=self.distance_z_var)
         self.distance_z_entry.grid(row=3, column=0, sticky=NW, padx=20, pady=20)
 
+        # Temporal filter of the sensor readings
+        self.filter_label = Label(self.calibration_settings, text="Noise filter", anchor=SW,
+                                  font=self.controller.bold_font)
+        self.filter_label.grid(row=2, column=1, sticky=SW, padx=20)
+
+        self.filter_var = StringVar(value=FILTER_LABELS["none"])
+        self.filter_menu = OptionMenu(self.calibration_settings, self.filter_var,
+                                      *[FILTER_LABELS[name] for name in FILTER_NAMES])
+        self.filter_menu.grid(row=3, column=1, sticky=NW, padx=20, pady=20)
+
+        # Number of samples of each capture
+        self.sampling_label = Label(self.calibration_settings, text="Sampling", anchor=SW,
+                                    font=self.controller.bold_font)
+        self.sampling_label.grid(row=4, column=0, sticky=SW, padx=20)
+
+        self.adaptive_var = BooleanVar(value=False)
+        self.adaptive_check = Checkbutton(self.calibration_settings, text="Adaptive: stop when the readings are steady",
+                                          variable=self.adaptive_var, anchor=W)
+        self.adaptive_check.grid(row=5, column=0, columnspan=2, sticky=NW, padx=20, pady=20)
+
         # Invalid dimension message
         self.invalid_dimension = Label(self.calibration_settings, text="Dimension must be between 1 and 28 centimeters",
                                        fg="red", anchor=W)
@@ -152,6 +173,13 @@ class ConfigBPC(Frame):
         distance_z = float(self.distance_z_var.get())
         set_calibration_settings(ringDiameter=ring_diameter, obj_radius=calibration_obj, distance_z=distance_z)
 
+        # save filter
+        labels = {label: name for (name, label) in FILTER_LABELS.items()}
+        set_filter_settings(labels[self.filter_var.get()])
+
+        # save sampling mode
+        set_capture_settings(self.adaptive_var.get())
+
         # Show sensors live feed
         self.controller.show_frame("MeasureBPC")
 
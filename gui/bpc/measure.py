@@ -1,15 +1,31 @@
+import math
 import queue
+import time
 from tkinter import *
 from tkinter import messagebox
 
-from backend.bpc import saved_measurement
+import numpy as np
+
+from backend.bpc import saved_measurement, get_calibration_settings
 from backend.bpc_threading import *
-from gui.widgets.custom import HorizontalTable, YellowButton, GreenButton, VerticalTable
+from gui.widgets.custom import HorizontalTable, YellowButton, GreenButton, RedButton, VerticalTable, CrossSectionView
 from gui.widgets.helpers import make_rows_responsive, make_columns_responsive
 
 
 class MeasureBPC(Frame):
 
+    # Maximum number of repaints per second
+    max_fps = 30
+
+    # Readings further than this (cm) from the circle fitted to the others are shown as misreadings
+    misreading_tolerance = 0.5
+
+    # Radius (cm) of the sensor ring when no calibration settings were given
+    default_structure_radius = 16.0
+
+    # Distance (cm) along Z between the captures of a continuous scan
+    default_scan_step = 1.0
+
     def __init__(self, parent, controller):
         Frame.__init__(self, parent)
         self.controller = controller
@@ -18,11 +34,52 @@ class MeasureBPC(Frame):
         self.bind("<<ShowFrame>>", self.on_show_frame)
         self.bind("<<LeaveFrame>>", self.on_leave_frame)
 
-        # Queue where live feed thread writes data
-        self.queue = queue.LifoQueue()
+        # Where the live feed thread leaves the latest sensor readings
+        self.mailbox = LatestValueMailbox()
+
+        # The live feed thread wakes the GUI up when there is something new; nothing runs while there isn't
+        self.notifier = CoalescedNotifier(self.generate_live_data_event)
+        self.bind("<<LiveData>>", self.on_live_data)
+        self.last_repaint = 0.0
+        self.scheduled_repaint = None
+
+    def put_live_frame(self, data):
+        self.mailbox.put(data)
+        self.notifier.notify()
+
+    def wake(self):
+        # called from the live feed thread
+        self.notifier.notify()
+
+    def generate_live_data_event(self):
+        # Tk queues virtual events from other threads into the main loop
+        try:
+            self.event_generate("<<LiveData>>", when="tail")
+        except (TclError, RuntimeError):
+            # the window is gone
+            pass
+
+    def on_live_data(self, event=None):
+        # new data after this point needs a new wakeup
+        self.notifier.acknowledge()
+
+        # a repaint is already on its way
+        if not self.do_update or self.scheduled_repaint is not None:
+            return
+
+        # Respect the frame-rate cap
+        wait = self.last_repaint + 1.0 / self.max_fps - time.perf_counter()
+        if wait > 0:
+            self.scheduled_repaint = self.after(int(wait * 1000) + 1, self.repaint)
+        else:
+            self.repaint()
+
+    def repaint(self):
+        self.scheduled_repaint = None
+        self.last_repaint = time.perf_counter()
 
-    def add_to_queue(self, data):
-        self.queue.put(data)
+        if self.do_update:
+            self.update_live_gui()
 
     def initialize_widgets(self):
         # Watchers
@@ -49,18 +106,47 @@ class MeasureBPC(Frame):
         self.deviation_column = 2
 
         # Sensor Data: current readings, last captured, and deviation info
-        sensor_headers = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11", "12", "Sensor Z"]
-        self.table = HorizontalTable(self, rows=len(sensor_headers), columns=3, header_values=sensor_headers)
-        self.table.grid(row=2, column=0, rowspan=2, sticky=N)
+        self.create_table(sensor_count=13)
+
+        # Live cross-section of the pole
+        self.cross_section = CrossSectionView(self, structure_radius=self.default_structure_radius)
+        self.cross_section.grid(row=1, column=2, rowspan=3, padx=20)
 
         # calibrate button
         self.calibrate_button = GreenButton(self, text="Calibrate Sensors", command=self.calibrate)
         self.calibrate_button.grid(row=0, column=1, pady=20)
 
+        # where the calibration comes from
+        self.calibration_str = StringVar()
+        self.calibration_label = Label(self, textvariable=self.calibration_str, fg="#333333", justify=CENTER)
+        self.calibration_label.grid(row=1, column=1, sticky=N)
+
+        # continuous scan: captures whenever the carriage stops at a new Z
+        self.scan_controls = Frame(self)
+        self.scan_controls.grid(row=2, column=1, sticky=N)
+
+        self.scan_step_label = Label(self.scan_controls, text="Scan step (cm)")
+        self.scan_step_label.grid(row=0, column=0, padx=5)
+
+        self.scan_step_var = StringVar(value=str(self.default_scan_step))
+        self.scan_step_spinbox = Spinbox(self.scan_controls, from_=0.1, to=50.0, increment=0.5, width=5,
+                                         textvariable=self.scan_step_var)
+        self.scan_step_spinbox.grid(row=0, column=1, padx=5)
+
+        self.scan_button = GreenButton(self.scan_controls, text="Start Scan", command=self.start_scan)
+        self.scan_button.grid(row=1, column=0, columnspan=2, pady=10)
+
+        self.stop_scan_button = RedButton(self.scan_controls, text="Stop Scan", command=self.stop_scan)
+
         # captured count
         self.captured_count = Label(self, textvariable=self.count_str, font=self.controller.bold_font)
         self.captured_count.grid(row=2, column=1, sticky=S, pady=10)
 
+        # samples taken in the last capture
+        self.samples_str = StringVar()
+        self.samples_label = Label(self, textvariable=self.samples_str, fg="#333333")
+        self.samples_label.grid(row=3, column=1, sticky=S)
+
         # capture button
         self.capture_button = YellowButton(self, text="Capture Measurements", command=self.capture)
         self.capture_button.grid(row=3, column=1, sticky=N)
@@ -73,12 +159,34 @@ class MeasureBPC(Frame):
         make_rows_responsive(self)
         make_columns_responsive(self)
 
+    def create_table(self, sensor_count):
+        # IR sensors, then the ultrasonic
+        sensor_headers = [str(i) for i in range(1, sensor_count)] + ["Sensor Z"]
+        self.table = HorizontalTable(self, rows=len(sensor_headers), columns=3, header_values=sensor_headers,
+                                     number_format="%.2f")
+        self.table.grid(row=2, column=0, rowspan=2, sticky=N)
+
+    def resize_table(self, sensor_count):
+        # More sensors are connected than the table has rows for
+        if sensor_count != self.table.rows:
+            self.table.destroy()
+            self.create_table(sensor_count)
+
     def on_show_frame(self, event=None):
         # TODO get count from function
         self.count_number.set(len(saved_measurement))
 
         # clear live readings from table
         self.table.clear_column(self.live_column)
+        self.mailbox.clear()
+        self.live_cells_updated = 0
+        self.cross_section.clear()
+        self.calibration_str.set("Not calibrated")
+
+        # size of the ring, for the cross-section
+        ring_diameter = get_calibration_settings()[0]
+        self.structure_radius = ring_diameter * 0.5 if ring_diameter > 0 else self.default_structure_radius
+        self.cross_section.set_structure_radius(self.structure_radius)
 
         # Controls update callback
         self.do_update = True
@@ -88,11 +196,17 @@ class MeasureBPC(Frame):
         # Open port and start reading
         self.run_live_thread()
 
-        # start live GUI
+        # show the connecting message; from now on the live feed thread triggers the updates
         self.update_live_gui()
 
     def run_live_thread(self):
-        self.live_thread = LiveFeedThread(widget=self)
+        # waiting for a capture or calibration
+        self.busy = False
+
+        # a new thread isn't scanning
+        self.show_scan_stopped()
+
+        self.live_thread = LiveFeedThread(widget=self, live_rate=self.max_fps)
         self.live_thread.start()
 
     def update_live_gui(self):
@@ -126,114 +240,116 @@ class MeasureBPC(Frame):
                 self.controller.show_frame("ConfigBPC")
                 return
 
-        # Capturing data
-        if self.live_thread.capture_now.is_set():
-            # only set message once
-            if not self.busy_message_set:
-                # Show status message
-                self.status_var.set("Capturing data...")
+        # Results handed over by the worker thread
+        try:
+            while True:
+                (result, data) = self.live_thread.results.get_nowait()
 
-                # Disable buttons
-                self.disable_buttons()
+                if result == CAPTURED:
+                    self.show_captured(data)
+                elif result == CALIBRATED:
+                    self.show_calibration()
+                    self.show_calibration_report(data)
+                elif result == PROFILE_LOADED:
+                    self.show_calibration()
+                    self.calibration_str.set("Calibration profile loaded\n(revision %(revision)s, %(created)s)" % data)
 
-                # message has been set
-                self.busy_message_set = True
+                # no longer busy
+                self.busy = False
 
-            # when data has been captured
-            if self.live_thread.capture_done.is_set():
-                last_captured = saved_measurement[len(saved_measurement) - 1]
+        except queue.Empty:
+            pass
 
-                # update table with new data
-                self.table.update_column(self.captured_column, last_captured)
+        # Update live feed
+        if self.live_thread.reading_sensors.is_set() and not self.busy:
+            # only the newest readings are shown
+            sensor_readings = self.mailbox.take()
 
-                # clear flags
-                self.live_thread.capture_now.clear()
-                self.live_thread.capture_done.clear()
+            if sensor_readings is not None:
+                # Match the number of connected sensors
+                self.resize_table(len(sensor_readings))
 
-                # update captured count label
-                self.count_number.set(self.count_number.get() + 1)
+                # Update table with new sensor data; only the readings that changed are redrawn
+                self.live_cells_updated += self.table.update_column(self.live_column, sensor_readings)
 
-                self.update_idletasks()
+                # Draw the estimated cross-section
+                self.update_cross_section(sensor_readings)
 
-        # Calibrating sensors
-        elif self.live_thread.calibrate_now.is_set():
             # only set message once
-            if not self.busy_message_set:
-                # Show status message
-                self.status_var.set("Calibrating sensors...")
-
-                # Disable buttons
-                self.disable_buttons()
-
-                # message has been set
-                self.busy_message_set = True
-
-            # when calibration is done
-            if self.live_thread.calibration_done.is_set():
-                deviations = []
+            if self.busy_message_set:
+                # Ready to capture or calibrate
+                self.status_var.set("Ready!")
 
-                # exclude the last one; it's the ultrasonic
-                for i in range(len(sensorArray) - 1):
-                    # IR sensor deviation angle
-                    deviations.append(sensorArray[i].devAngle)
+                # Restore buttons
+                self.restore_buttons()
 
-                # ultrasonic sensor
-                ultrasonic = sensorArray[len(sensorArray) - 1]
-                deviations.append(ultrasonic.factor)
+                # no longer busy
+                self.busy_message_set = False
 
-                # update table with new data
-                self.table.update_column(self.deviation_column, deviations)
-
-                # clear flags
-                self.live_thread.calibrate_now.clear()
-                self.live_thread.calibration_done.clear()
-
-                self.update_idletasks()
+        # Sensors are still initializing
+        elif not self.live_thread.reading_sensors.is_set() and self.do_update and not self.busy_message_set:
+            self.set_busy_message("Connecting to sensors...")
+
+    def update_cross_section(self, sensor_readings):
+        # IR readings only; the last one is Z
+        readings = np.array(sensor_readings[:-1], dtype=float)
+        x, y, valid = frameToPoints(readings, structureRadius=self.structure_radius)
+
+        # readings that don't fit the circle through the rest
+        misreading = ~valid
+        circle = fitCircle(x[valid], y[valid])
+        if circle is not None:
+            (cx, cy, r) = circle
+            misreading |= np.abs(np.hypot(x - cx, y - cy) - r) > self.misreading_tolerance
+            caption = "Center offset: %.2f cm\nDiameter: %.2f cm" % (math.hypot(cx, cy), 2.0 * r)
+        else:
+            caption = ""
 
-        # Update live feed
-        elif self.live_thread.reading_sensors.is_set() and not self.live_thread.capture_now.is_set()\
-                and not self.live_thread.calibrate_now.is_set():
-            try:
-                while True:
-                    sensor_readings = self.queue.get_nowait()
+        if not isCalibrated(len(readings)):
+            caption += "\n(not calibrated)"
 
-                    # Update table with new sensor data
-                    self.table.update_column(self.live_column, sensor_readings)
+        self.cross_section.show(x, y, misreading, circle, caption)
 
-                    # only set message once
-                    if self.busy_message_set:
-                        # Ready to capture or calibrate
-                        self.status_var.set("Ready!")
+    def show_captured(self, last_captured):
+        # update table with new data
+        self.table.update_column(self.captured_column, last_captured)
 
-                        # Restore buttons
-                        self.restore_buttons()
+        # how many samples the sensors needed
+        sample_counts = getLastCaptureSampleCounts()
+        self.samples_str.set("Last capture: %s to %s samples per sensor" % (min(sample_counts), max(sample_counts)))
 
-                        # no longer busy
-                        self.busy_message_set = False
+        # update captured count label
+        self.count_number.set(self.count_number.get() + 1)
 
-                    self.update_idletasks()
+    def show_calibration(self):
+        # IR sensor deviation angles, then the ultrasonic factor
+        deviations = sensorBank.deviations()
 
-            except queue.Empty:
-                pass
+        # update table with new data
+        self.table.update_column(self.deviation_column, deviations)
 
-        # Sensors are still initializing
-        elif not self.live_thread.reading_sensors.is_set() and self.do_update and not self.busy_message_set:
-            # Show loading message
-            self.status_var.set("Connecting to sensors...")
+    def show_calibration_report(self, report):
+        if not report["recalibrated"]:
+            self.calibration_str.set("Calibration profile still valid\n(largest error %.2f cm)" % report["max_ir_error"])
+        elif report.get("revision") is not None:
+            self.calibration_str.set("Sensors recalibrated\n(profile revision %s saved)" % report["revision"])
+        else:
+            self.calibration_str.set("Sensors recalibrated\n(profile could not be saved)")
 
-            # Disable buttons
-            self.disable_buttons()
+    def set_busy_message(self, message):
+        # Show status message
+        self.status_var.set(message)
 
-            # message has been set
-            self.busy_message_set = True
+        # Disable buttons
+        self.disable_buttons()
 
-        # Keep updating until we leave this frame
-        if self.do_update:
-            self.after(100, self.update_live_gui)
+        # message has been set
+        self.busy_message_set = True
 
     def restore_buttons(self):
         self.calibrate_button.configure(state=NORMAL, cursor="hand2")
         self.capture_button.configure(state=NORMAL, cursor="hand2")
+        self.scan_button.configure(state=NORMAL, cursor="hand2")
 
         # only enable view results if there are any
         if self.count_number.get():
@@ -247,30 +363,94 @@ class MeasureBPC(Frame):
         self.calibrate_button.configure(state=DISABLED, cursor="wait")
         self.capture_button.configure(state=DISABLED, cursor="wait")
         self.results_button.configure(state=DISABLED, cursor="wait")
+        self.scan_button.configure(state=DISABLED, cursor="wait")
 
     def on_leave_frame(self, event=None):
         # kill thread and close serial port
-        self.live_thread.kill_thread.set()
+        self.live_thread.close()
 
         self.do_update = False
 
+    def get_live_feed_stats(self):
+        """
+        Diagnostics of the live feed.
+
+        :return: dict with the number of frames published by the worker thread, shown, and dropped unseen, and the
+        number of live reading cells whose text changed
+        """
+        stats = self.mailbox.get_stats()
+        stats["cells_updated"] = self.live_cells_updated
+
+        return stats
+
     def calibrate(self):
         # only one at a time
-        if not self.live_thread.calibrate_now.is_set():
+        if not self.busy:
             # clear old values from table
             self.table.clear_column(self.deviation_column)
 
+            self.busy = True
+            self.set_busy_message("Calibrating sensors...")
+
             # Let the worker thread handle it
-            self.live_thread.calibrate_now.set()
+            self.live_thread.calibrate()
 
     def capture(self):
         # only one at a time
-        if not self.live_thread.capture_now.is_set():
+        if not self.busy:
             # clear old values from table
             self.table.clear_column(self.captured_column)
 
+            self.busy = True
+            self.set_busy_message("Capturing data...")
+
             # Let the worker thread handle it
-            self.live_thread.capture_now.set()
+            self.live_thread.capture()
+
+    def start_scan(self):
+        # only when nothing else is going on
+        if self.busy or self.scanning:
+            return
+
+        try:
+            step = float(self.scan_step_var.get())
+        except ValueError:
+            step = 0.0
+
+        if step <= 0:
+            self.bell()
+            self.scan_step_var.set(str(self.default_scan_step))
+            return
+
+        self.scanning = True
+        self.status_var.set("Scanning: move the carriage, and hold it still at each step")
+
+        # the live feed goes on; captures arrive as the carriage stops
+        self.calibrate_button.configure(state=DISABLED, cursor="arrow")
+        self.capture_button.configure(state=DISABLED, cursor="arrow")
+        self.results_button.configure(state=DISABLED, cursor="arrow")
+        self.scan_step_spinbox.configure(state=DISABLED)
+        self.scan_button.grid_forget()
+        self.stop_scan_button.grid(row=1, column=0, columnspan=2, pady=10)
+
+        self.live_thread.start_scan(step)
+
+    def stop_scan(self):
+        if not self.scanning:
+            return
+
+        self.live_thread.stop_scan()
+        self.show_scan_stopped()
+
+        self.status_var.set("Ready!")
+        self.restore_buttons()
+
+    def show_scan_stopped(self):
+        self.scanning = False
+
+        self.scan_step_spinbox.configure(state=NORMAL)
+        self.stop_scan_button.grid_forget()
+        self.scan_button.grid(row=1, column=0, columnspan=2, pady=10)
 
     def update_count_label(self, *args):
         self.count_str.set(str(self.count_number.get()) + " measurements captured")
@@ -284,3 +464,5 @@ class MeasureBPC(Frame):
 
         # clear table
         self.table.clear_cells()
+
+        self.samples_str.set("")
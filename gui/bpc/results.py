@@ -1,22 +1,21 @@
-import copy
 from datetime import datetime
 from tkinter import *
 from tkinter import filedialog, messagebox
 
-from backend.bpc import generate_textfile, saved_measurement, delete_measurement, sort_ByZeta
-from gui.widgets.custom import HorizontalTable, YellowButton, RedButton
+from backend.bpc import generate_textfile, saved_measurement, delete_measurement, discard_journal, \
+    get_calibration_settings
+from gui.widgets.custom import VirtualTable, YellowButton, RedButton
 from gui.widgets.helpers import make_columns_responsive, make_rows_responsive
 
 
 class ResultsBPC(Frame):
+    # Radius (cm) of the sensor ring when no calibration settings were given
+    default_structure_radius = 16.0
 
     def __init__(self, parent, controller):
         Frame.__init__(self, parent)
         self.controller = controller
         self.title="Review Your Measurements"
-        self.captured_data = []
-        # TODO Generate headers ?
-        self.sensor_headers = ["Z (cm)", "S1", "S2", "S3", "S4", "S5", "S6", "S7", "S8", "S9", "S10", "S11", "S12"]
         self.initialize_widgets()
         self.bind("<<ShowFrame>>", self.on_show_frame)
         self.bind("<<LeaveFrame>>", self.on_leave_frame)
@@ -26,11 +25,18 @@ class ResultsBPC(Frame):
         self.empty_message = Label(self, text="Nothing to see here. Go capture some measurements!",
                                    font=self.controller.header_font)
 
+        # Captured measurements table, one row per capture; only the visible rows are drawn
+        self.table = VirtualTable(self, can_select_rows=True, button_command=self.delete_z)
+
         # Save button
         self.save_button = YellowButton(self, text="Save coordinates", command=self.save, image=self.controller.save_icon,
                                         compound=LEFT)
         self.save_button.grid(row=1, column=0, sticky=SE, padx=10, pady=20)
 
+        # Export 3D model button
+        self.export_button = YellowButton(self, text="Export 3D model", command=self.export_model)
+        self.export_button.grid(row=1, column=0, sticky=SW, padx=10, pady=20)
+
         # Discard button
         self.discard_button = RedButton(self, text="DISCARD", command=self.discard)
         self.discard_button.grid(row=1, column=1, sticky=SW, padx=10, pady=20)
@@ -39,73 +45,60 @@ class ResultsBPC(Frame):
         make_columns_responsive(self)
 
     def on_show_frame(self, event=None):
-        # Enable save button
+        # Enable save and export buttons
         self.save_button.configure(state=NORMAL, cursor="hand2")
-
-        print("original", saved_measurement)
-
-        # sort captured measurements by Z value
-        sort_ByZeta(saved_measurement)
-
-        print("sorted", saved_measurement)
+        self.export_button.configure(state=NORMAL, cursor="hand2")
 
         # Generate captured measurements table
         self.create_table()
 
     def create_table(self):
-        # Create table if there are any captured measurements
+        # Fill table if there are any captured measurements
         if saved_measurement:
-            # Make a copy of the captured measurements
-            self.captured_data = copy.deepcopy(saved_measurement)
-
-            # Place Z as first element
-            for column in self.captured_data:
-                column.insert(0, column.pop())
+            # captured measurements, already sorted by Z; a snapshot, later captures do not change it
+            captured_data = saved_measurement.rows()
 
-            self.table = HorizontalTable(self, rows=len(self.captured_data[0]), columns=len(self.captured_data),
-                                         header_values=self.sensor_headers, can_select_columns=True,
-                                         button_command=self.delete_z)
-            # Set background of top row
-            for column in range(len(self.captured_data)):
-                self.table.cells[0][column].configure(bg="#5E5E5E", fg="#FFFFFF", font=self.controller.bold_font)
-            self.table.headers[0].configure(bg="#5E5E5E", fg="#FFFFFF")
-            self.table.grid(row=0, column=0, columnspan=2)
+            # Z, then one header per IR sensor
+            sensor_headers = ["Z (cm)"] + ["S" + str(i) for i in range(1, saved_measurement.width())]
+            if sensor_headers != self.table.headers:
+                self.table.set_headers(sensor_headers)
 
-            # load cells with captured measurements
-            self.table.update_cells(self.captured_data)
+            # load rows with captured measurements, Z first
+            self.table.set_rows(("%.2f" % row[-1],) + tuple("%.2f" % value for value in row[:-1])
+                                for row in captured_data)
+            self.table.grid(row=0, column=0, columnspan=2, sticky=NSEW, padx=20, pady=10)
 
         # No captured measurements
         else:
-            # Show an empty message
-            self.empty_message.grid(row=0, columnspan=2)
+            self.show_empty_message()
 
-            # disable save button
-            self.save_button.configure(state=DISABLED, cursor="arrow")
-
-    def destroy_table(self):
-        # Remove checkboxes and table from grid, and destroy them
+    def show_empty_message(self):
+        # Hide table and show an empty message
         self.table.grid_forget()
-        self.table.destroy()
+        self.empty_message.grid(row=0, columnspan=2)
+
+        # disable save and export buttons
+        self.save_button.configure(state=DISABLED, cursor="arrow")
+        self.export_button.configure(state=DISABLED, cursor="arrow")
 
     def delete_z(self):
         # get indices to be deleted
-        deleted_columns = self.table.get_checked_indices()
+        deleted_rows = self.table.get_selected_indices()
 
         # delete them
-        delete_measurement(deleted_columns)
+        delete_measurement(deleted_rows)
 
-        # Re-create table
-        self.destroy_table()
-        self.create_table()
+        # Remove the rows in place, without rebuilding the table
+        self.table.delete_rows(deleted_rows)
+
+        if not saved_measurement:
+            self.show_empty_message()
 
     def on_leave_frame(self, event=None):
-        # Destroy table if there are any captured measurements
-        if saved_measurement:
-            # Destroy captured measurements table
-            self.destroy_table()
-        # Otherwise hide empty message
-        else:
-            self.empty_message.grid_forget()
+        # Hide and empty the captured measurements table, or the empty message
+        self.table.grid_forget()
+        self.table.clear()
+        self.empty_message.grid_forget()
 
     def save(self):
         date = datetime.now().strftime('%Y-%m-%d_%H%M%S')
@@ -114,6 +107,9 @@ class ResultsBPC(Frame):
         # make sure the user didn't cancel the dialog
         if len(save_path) > 0:
             if generate_textfile(save_path):
+                # the session is saved; it won't need restoring
+                discard_journal()
+
                 # all good
                 messagebox.showinfo("Success!", "File was generated successfully.")
                 # reset BPC
@@ -123,15 +119,50 @@ class ResultsBPC(Frame):
             else:
                 messagebox.showerror("Error generating text file", "Make sure you have access to the selected destination.")
 
+    def export_model(self):
+        # scipy is only needed here
+        from backend.pole_reconstruction import reconstruct_pole, pole_metrics, export_mesh
+
+        # size of the ring, for uncalibrated sensors
+        ring_diameter = get_calibration_settings()[0]
+        structure_radius = ring_diameter * 0.5 if ring_diameter > 0 else self.default_structure_radius
+
+        try:
+            model = reconstruct_pole(saved_measurement.rows(), structure_radius=structure_radius)
+        except ValueError:
+            messagebox.showerror("Not enough measurements",
+                                 "Capture at least 2 measurements at different heights to reconstruct the pole.")
+            return
+
+        date = datetime.now().strftime('%Y-%m-%d_%H%M%S')
+        save_path = filedialog.asksaveasfilename(title="Export 3D model", defaultextension=".stl",
+                                                 filetypes=[("STL mesh", "*.stl"), ("PLY mesh", "*.ply")],
+                                                 initialfile="BPC_" + date)
+
+        # make sure the user didn't cancel the dialog
+        if len(save_path) > 0:
+            if export_mesh(model, save_path):
+                metrics = pole_metrics(model)
+                messagebox.showinfo("Success!", "3D model was exported successfully.\n\n"
+                                                "Length: %(length)s cm\n"
+                                                "Volume: %(volume)s cm3\n"
+                                                "Diameter: %(bottom_diameter)s cm to %(top_diameter)s cm\n"
+                                                "Taper: %(taper)s cm/cm\n"
+                                                "Max. centerline deviation: %(max_centerline_deviation)s cm" % metrics)
+            else:
+                messagebox.showerror("Error exporting 3D model", "Make sure you have access to the selected destination.")
+
     def discard(self):
         result = messagebox.askokcancel("Discard captured measurements?",
                                         "You will lose all the measurements you have captured so far.",
                                         default="cancel", icon="warning")
         if result:
+            # nothing to restore on the next start
+            discard_journal()
             # reset BPC
             self.controller.reset_BPC()
             # go to home screen
             self.controller.show_frame("Home")
 
     def reset(self):
-        self.captured_data.clear()
+        self.table.clear()
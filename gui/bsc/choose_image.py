@@ -82,7 +82,7 @@ class ConfigBSC(Frame):
                 # Not a fresh session
                 if self.visit_counter > 1:
                     # reset the BSC GUI except this frame
-                    self.controller.reset_BSC_GUI(ignored=[type(self)])
+                    self.controller.reset_BSC_GUI(ignored=[type(self).__name__])
 
                     # make this the 1st visit
                     self.visit_counter = 1
@@ -130,11 +130,15 @@ class ConfigBSC(Frame):
                 # make message green
                 self.message.configure(fg="#35AD35")
 
-                # 2 circumferences found
-                if self.circumferences_found == 2:
+                slices = get_number_slices()
+
+                # slices found
+                if slices == 1:
                     self.message_var.set("Bamboo slice detected!\n Step 2 will be skipped.")
+                elif slices > 1:
+                    self.message_var.set(str(slices) + " bamboo slices detected!\n Step 2 will be skipped.")
 
-                # more than 2 where found
+                # the slice has to be picked
                 else:
                     self.message_var.set(str(self.circumferences_found) + " circumferences found")
 
@@ -151,8 +155,8 @@ class ConfigBSC(Frame):
             self.message.grid_remove()
 
     def begin(self):
-        # Go to pick circumferences if found more than 2
-        if get_number_original_circumferences() > 2:
+        # Go to pick circumferences if no slice was found
+        if not were_slices_detected():
             self.controller.show_frame("PickCircumferencesBSC")
 
         # Go to configure scale
@@ -1,4 +1,5 @@
 from tkinter import *
+from tkinter import messagebox
 
 from backend.bsc import *
 from gui.widgets.custom import YellowButton, GreenButton, RedButton, ResponsiveImage
@@ -49,7 +50,7 @@ class PickCircumferencesBSC(Frame):
         # image in row=1, col=0, colspan=3, rowspan=4
 
         # instructions
-        instructions_text = "More than 2 circumferences were found.\n"
+        instructions_text = "No slice could be detected automatically.\n"
         instructions_text += "Select the inner and outer circumference of the bamboo slice."
         self.instructions = Label(self, text=instructions_text, relief=GROOVE, padx=10, pady=10)
         self.instructions.grid(row=1, column=3, padx=40)
@@ -179,7 +180,11 @@ class PickCircumferencesBSC(Frame):
                 selected.append(index)
 
         # Apply in backend
-        set_final_circumferences(selected)
+        try:
+            set_final_circumferences(selected)
+        except ValueError:
+            messagebox.showerror("Select 2 circumferences", "Select the outer and the inner circumference of the slice.")
+            return
 
         # Show results
         self.controller.show_frame("RefObjectBSC")
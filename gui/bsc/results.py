@@ -11,67 +11,201 @@ from matplotlib import style
 style.use("ggplot")
 
 from backend.bsc import *
-from gui.widgets.custom import RedButton, YellowButton, ResponsiveImage
+from gui.widgets.custom import RedButton, YellowButton, GreenButton, ResponsiveImage
 from gui.widgets.helpers import make_columns_responsive, make_rows_responsive
 
 
 class ResultsBSC(Frame):
 
+    # angular resolution of the plotted circumferences; plenty for the size of the plot
+    plot_bins = 720
+
     def __init__(self, parent, controller):
         Frame.__init__(self, parent)
         self.controller = controller
         self.title = "Slice Results"
         self.responsive_image = None
+        # polar data and wall thickness of every slice, and the one on display
+        self.slices_data = []
+        self.thickness_data = []
+        self.current_slice = 0
         self.initialize_widgets()
         self.bind("<<ShowFrame>>", self.on_show_frame)
 
     def initialize_widgets(self):
 
-        # Result image row=0, col=0, columnspan=2
+        # Controls to browse the slices of the image; hidden when there's only one
+        self.slice_navigation = Frame(self)
+
+        self.prev_button = GreenButton(self.slice_navigation, text="Previous", image=self.controller.arrow_left,
+                                       compound=LEFT, command=lambda: self.show_slice_index(self.current_slice - 1))
+        self.prev_button.grid(row=0, column=0, padx=5)
+
+        self.slice_title_var = StringVar()
+        self.slice_title = Label(self.slice_navigation, textvariable=self.slice_title_var,
+                                 font=self.controller.header_font)
+        self.slice_title.grid(row=0, column=1, padx=20)
+
+        self.next_button = GreenButton(self.slice_navigation, text="Next", image=self.controller.arrow_right,
+                                       compound=RIGHT, command=lambda: self.show_slice_index(self.current_slice + 1))
+        self.next_button.grid(row=0, column=2, padx=5)
+
+        # Result image row=1, col=0; this message instead when there's no slice
+        self.empty_message = Label(self, text="No slice to show.\nGo back and pick the circumferences of a slice.",
+                                   font=self.controller.header_font)
+
+        # Polar plot of the circumferences; built once, its lines are updated in place
+        figure = Figure(figsize=(5,5), dpi=100)
+        self.axes = figure.add_subplot(111, projection="polar")
+
+        # Lines are drawn on top of a cached background (blitting) instead of redrawing the whole figure
+        colors = [c["color"] for c in matplotlib.rcParams["axes.prop_cycle"]]
+        self.lines = [self.axes.plot([], [], color=color, animated=True)[0] for color in colors[:2]]
+        self.background = None
+
+        # Create a Tk canvas of the plot
+        self.polar_plot = FigureCanvasTkAgg(figure, self)
+        self.polar_plot.mpl_connect("draw_event", self.on_plot_draw)
+        self.polar_plot.get_tk_widget().grid(row=1, column=1, sticky=NSEW, padx=20)
+
+        # Show some controls for the figure
+        self.toolbar_container = Frame(self)
+        self.plot_toolbar = NavigationToolbar(self.polar_plot, self.toolbar_container)
+        self.plot_toolbar.update()
+        self.toolbar_container.grid(row=0, column=1, sticky=NSEW, padx=20, pady=20)
+
+        # Wall thickness of the slice, and a heatmap of it over the image
+        self.thickness_container = Frame(self)
+
+        self.thickness_var = StringVar()
+        self.thickness_label = Label(self.thickness_container, textvariable=self.thickness_var,
+                                     font=self.controller.bold_font)
+        self.thickness_label.grid(row=0, column=0, sticky=W)
+
+        self.heatmap_var = IntVar()
+        self.heatmap_checkbox = Checkbutton(self.thickness_container, text="Show thickness heatmap",
+                                            variable=self.heatmap_var, command=self.show_slice_image, cursor="hand2")
+        self.heatmap_checkbox.grid(row=0, column=1, sticky=W, padx=20)
+
+        self.thickness_container.grid(row=2, column=0, sticky=W, padx=20)
+
+        # Export image button
+        self.export_button = YellowButton(self, text="Export image", command=self.export_image)
+        self.export_button.grid(row=3, column=0, sticky=W, padx=10, pady=20)
 
         # Save button
         self.save_button = YellowButton(self, text="Save coordinates", command=self.save, image=self.controller.save_icon,
                                         compound=LEFT)
-        self.save_button.grid(row=2, column=0, sticky=E, padx=10, pady=20)
+        self.save_button.grid(row=3, column=0, sticky=E, padx=10, pady=20)
 
         # Discard button
         self.discard_button = RedButton(self, text="DISCARD", command=self.discard)
-        self.discard_button.grid(row=2, column=1, sticky=W, padx=10, pady=20)
+        self.discard_button.grid(row=3, column=1, sticky=W, padx=10, pady=20)
 
         # min size of buttons row
-        self.grid_rowconfigure(2, minsize=80)
+        self.grid_rowconfigure(3, minsize=80)
 
-        make_rows_responsive(self, ignored=[0])
+        make_rows_responsive(self, ignored=[0, 2])
         make_columns_responsive(self)
 
     def on_show_frame(self, event=None):
-        # generate polar coordinates and avg diameter of circumferences
-        data_circumferences = circumferences_to_polar_and_avg_diameter()
+        # generate polar coordinates and avg diameter of the circumferences of every slice
+        self.slices_data = circumferences_to_polar_and_avg_diameter()
+        self.thickness_data = slices_wall_thickness()
 
-        # create plot
-        figure = Figure(figsize=(5,5), dpi=100)
-        ax = figure.add_subplot(111, projection="polar")
-        # ax.set_title("Circumferences' polar coordinates")
+        if len(self.slices_data) > 1:
+            self.slice_navigation.grid(row=0, column=0, pady=20)
+        else:
+            self.slice_navigation.grid_remove()
+
+        # nothing to show
+        if not self.slices_data:
+            self.reset()
+            self.empty_message.grid(row=1, column=0, padx=20, pady=20)
+            self.enable_slice_controls(False)
+            return
+
+        self.empty_message.grid_remove()
+        self.enable_slice_controls(True)
+        self.show_slice_index(min(self.current_slice, len(self.slices_data) - 1))
+
+    def enable_slice_controls(self, enabled):
+        state, cursor = (NORMAL, "hand2") if enabled else (DISABLED, "arrow")
+
+        self.save_button.configure(state=state, cursor=cursor)
+        self.export_button.configure(state=state, cursor=cursor)
+        self.heatmap_checkbox.configure(state=state, cursor=cursor)
+
+    def show_slice_index(self, index):
+        self.current_slice = index
+
+        self.slice_title_var.set("Slice %s of %s" % (index + 1, len(self.slices_data)))
+        self.prev_button.configure(state=NORMAL if index > 0 else DISABLED,
+                                   cursor="hand2" if index > 0 else "arrow")
+        last = index == len(self.slices_data) - 1
+        self.next_button.configure(state=DISABLED if last else NORMAL, cursor="arrow" if last else "hand2")
 
         # plot both circumferences
-        for (r, theta, _) in data_circumferences:
-            ax.plot(theta, r)
+        self.show_slice(self.slices_data[index])
 
-        # Create a Tk canvas of the plot
-        self.polar_plot = FigureCanvasTkAgg(figure, self)
-        self.polar_plot.show()
-        self.polar_plot.get_tk_widget().grid(row=1, column=1, sticky=NSEW, padx=20)
+        self.thickness_var.set("Wall thickness: min %(min)s, mean %(mean)s, max %(max)s" % self.thickness_data[index])
 
-        # Show some controls for the figure
-        self.toolbar_container = Frame(self)
-        self.plot_toolbar = NavigationToolbar(self.polar_plot, self.toolbar_container)
-        self.plot_toolbar.update()
-        self.toolbar_container.grid(row=0, column=1, sticky=NSEW, padx=20, pady=20)
+        self.show_slice_image()
+
+    def show_slice_image(self):
+        # original image with both circumferences outlined, and the thickness heatmap if enabled
+        self.image = get_slice_roi(self.current_slice, heatmap=bool(self.heatmap_var.get()))
+        if self.responsive_image is None:
+            self.responsive_image = ResponsiveImage(self, self.image)
+            self.responsive_image.grid(row=1, column=0, sticky=NSEW, padx=20, pady=20)
+        else:
+            self.responsive_image.change_image(self.image)
+
+    def show_slice(self, data_circumferences):
+        """
+        Plot the circumferences of a slice, replacing the ones on the plot.
+
+        :param data_circumferences: list of (rs, thetas, avg_diameter), as given by
+        circumferences_to_polar_and_avg_diameter()
+        """
+        r_max = 0.0
+        for i, line in enumerate(self.lines):
+            if i < len(data_circumferences):
+                (r, theta, _) = data_circumferences[i]
+                # one point per angular bin is all the plot can show
+                r, theta = decimate_polar(r, theta, bins=self.plot_bins)
+                line.set_data(theta, r)
+                if len(r):
+                    r_max = max(r_max, r.max())
+            else:
+                line.set_data([], [])
 
-        # original image with both circumferences outlined
-        self.image = get_slice_roi()
-        self.responsive_image = ResponsiveImage(self, self.image)
-        self.responsive_image.grid(row=1, column=0, sticky=NSEW, padx=20, pady=20)
+        # the scale changed: redraw everything, the lines are drawn on the new background
+        r_max = round(r_max * 1.05, 2) or 1.0
+        if r_max != self.axes.get_rmax():
+            self.axes.set_rmax(r_max)
+            self.polar_plot.draw_idle()
+        else:
+            self.blit_lines()
+
+    def on_plot_draw(self, event=None):
+        # the figure was fully redrawn (new scale, resize, pan); cache it without the lines
+        self.background = self.polar_plot.copy_from_bbox(self.axes.bbox)
+        self.draw_lines()
+
+    def draw_lines(self):
+        for line in self.lines:
+            self.axes.draw_artist(line)
+
+    def blit_lines(self):
+        # nothing cached yet
+        if self.background is None:
+            self.polar_plot.draw_idle()
+            return
+
+        self.polar_plot.restore_region(self.background)
+        self.draw_lines()
+        self.polar_plot.blit(self.axes.bbox)
 
     def save(self):
         date = datetime.now().strftime('%Y-%m-%d_%H%M%S')
@@ -89,6 +223,19 @@ class ResultsBSC(Frame):
             else:
                 messagebox.showerror("Error generating text file", "Make sure you have access to the selected destination.")
 
+    def export_image(self):
+        date = datetime.now().strftime('%Y-%m-%d_%H%M%S')
+        save_path = filedialog.asksaveasfilename(title="Export image", defaultextension=".png",
+                                                 filetypes=[("PNG image", "*.png"), ("JPEG image", "*.jpg")],
+                                                 initialfile="BSC_%s_slice%s" % (date, self.current_slice + 1))
+
+        # make sure the user didn't cancel the dialog
+        if len(save_path) > 0:
+            if save_slice_image(save_path, self.current_slice, heatmap=bool(self.heatmap_var.get())):
+                messagebox.showinfo("Success!", "Image was exported successfully.")
+            else:
+                messagebox.showerror("Error exporting image", "Make sure you have access to the selected destination.")
+
     def discard(self):
         result = messagebox.askokcancel("Discard results?", "All progress will be lost.", default="cancel", icon="warning")
         if result:
@@ -104,10 +251,35 @@ class ResultsBSC(Frame):
             self.responsive_image = None
             self.image = None
 
-        # destroy the plot
-        self.polar_plot = None
+        self.slices_data = []
+        self.thickness_data = []
+        self.current_slice = 0
+        self.slice_navigation.grid_remove()
+        self.empty_message.grid_remove()
+        self.thickness_var.set("")
+        self.heatmap_var.set(0)
+
+        # empty the plot; the figure is kept for the next slice
+        for line in self.lines:
+            line.set_data([], [])
+        self.blit_lines()
 
 
 class NavigationToolbar(NavigationToolbar2TkAgg):
     # Remove the zoom-to-rectangle button; not for polar plots
     toolitems = [t for t in NavigationToolbar2TkAgg.toolitems if t[0] != "Zoom"]
+
+    def save_figure(self, *args):
+        # the lines are animated, to be blitted, and savefig leaves animated artists out
+        lines = [line for axes in self.canvas.figure.axes for line in axes.lines if line.get_animated()]
+        for line in lines:
+            line.set_animated(False)
+
+        try:
+            NavigationToolbar2TkAgg.save_figure(self, *args)
+        finally:
+            for line in lines:
+                line.set_animated(True)
+
+            # saving may have redrawn the canvas with the lines in the cached background
+            self.canvas.draw_idle()
@@ -1,5 +1,5 @@
 from tkinter import *
-from tkinter import font
+from tkinter import font, ttk
 
 from PIL import ImageTk
 
@@ -48,13 +48,63 @@ class ScrollableTextArea(Frame):
         self.text.delete(1.0, END)
 
 
-class VerticalTable(Frame):
+class DiffingCells(object):
+    """
+    Keeps a copy of the text shown in each cell of a table of StringVars, so updates only call into Tcl for the
+    cells whose text actually changed. Every update returns the number of cells it touched.
+
+    Expects self.rows, self.columns, self.number_format and self.cell_values (one StringVar per cell, row-major).
+    """
+
+    def create_shadow(self):
+        # text currently shown in each cell
+        self.shown = [["" for column in range(self.columns)] for row in range(self.rows)]
+
+    def format_value(self, value):
+        # strings are shown as given; numbers are formatted here, once per update
+        if isinstance(value, str):
+            return value
+        if self.number_format:
+            return self.number_format % value
+        return str(value)
+
+    def set_cell(self, row, column, value):
+        text = self.format_value(value)
+        if self.shown[row][column] == text:
+            return 0
+
+        self.shown[row][column] = text
+        self.cell_values[row][column].set(text)
+        return 1
+
+    def update_batch(self, changes):
+        """
+        Update many cells at once.
+
+        :param changes: iterable of (row, column, value)
+        :return: number of cells whose text changed
+        """
+        updated = 0
+        for row, column, value in changes:
+            updated += self.set_cell(row, column, value)
+        return updated
+
+
+class VerticalTable(Frame, DiffingCells):
+    """
+    A table filled row by row.
+
+    :param rows: number of rows
+    :param columns: number of columns
+    :param number_format: %-format for numeric values, e.g. "%.2f"; str() is used by default
+    """
     def __init__(self, parent, **kwargs):
         Frame.__init__(self, parent)
 
         # read keyword arguments
         self.rows = kwargs.pop("rows", 2)
         self.columns = kwargs.pop("columns", 2)
+        self.number_format = kwargs.pop("number_format", None)
 
         if kwargs:
             raise TypeError('Unexpected **kwargs: %r' % kwargs)
@@ -66,6 +116,7 @@ class VerticalTable(Frame):
             for column in range(self.columns):
                 temp_row.append(StringVar())
             self.cell_values.append(temp_row)
+        self.create_shadow()
 
         # Make the cells of the table
         self.cells = []
@@ -81,11 +132,16 @@ class VerticalTable(Frame):
             self.cells.append(temp_row)
 
     def update_cells(self, new_values):
+        """
+        :return: number of cells whose text changed
+        """
+        updated = 0
+
         # table has only 1 row; accept single array
         if self.rows == 1 and isinstance(new_values[0], str):
             try:
                 for column in range(self.columns):
-                    self.cell_values[0][column].set(new_values[column])
+                    updated += self.set_cell(0, column, new_values[column])
             except IndexError:
                 print("Make sure the array contains a value for each row.")
 
@@ -94,12 +150,14 @@ class VerticalTable(Frame):
             try:
                 for row in range(self.rows):
                     for column in range(self.columns):
-                        self.cell_values[row][column].set(new_values[row][column])
+                        updated += self.set_cell(row, column, new_values[row][column])
             except IndexError:
                 print("Your data does not match the dimensions of the table.")
 
+        return updated
+
 
-class HorizontalTable(Frame):
+class HorizontalTable(Frame, DiffingCells):
     """
     A table with headers on the leftmost column. Data is filled column by column.
 
@@ -108,6 +166,7 @@ class HorizontalTable(Frame):
     :param header_values: the text of the headers
     :param can_select_columns: shows checkboxes on top of table for each column, and an action button
     :param button_command: Action button's command
+    :param number_format: %-format for numeric values, e.g. "%.2f"; str() is used by default
     """
     def __init__(self, parent, **kwargs):
         Frame.__init__(self, parent)
@@ -118,6 +177,7 @@ class HorizontalTable(Frame):
         self.header_values = kwargs.pop("header_values", None)
         self.can_select_columns = kwargs.pop("can_select_columns", False)
         self.button_command = kwargs.pop("button_command", None)
+        self.number_format = kwargs.pop("number_format", None)
 
         if kwargs:
             raise TypeError('Unexpected **kwargs: %r' % kwargs)
@@ -157,6 +217,7 @@ class HorizontalTable(Frame):
             for column in range(self.columns):
                 temp_row.append(StringVar())
             self.cell_values.append(temp_row)
+        self.create_shadow()
 
         # Make header cells
         self.headers = []
@@ -184,11 +245,16 @@ class HorizontalTable(Frame):
             self.cells.append(temp_row)
 
     def update_cells(self, new_values):
+        """
+        :return: number of cells whose text changed
+        """
+        updated = 0
+
         # table has only 1 column; accept single array
         if self.columns == 1 and isinstance(new_values[0], str):
             try:
                 for row in range(self.rows):
-                    self.cell_values[row][0].set(new_values[row])
+                    updated += self.set_cell(row, 0, new_values[row])
             except IndexError:
                 print("Make sure the array contains a value for each row.")
 
@@ -197,25 +263,26 @@ class HorizontalTable(Frame):
             try:
                 for column in range(self.columns):
                     for row in range(self.rows):
-                        self.cell_values[row][column].set(new_values[column][row])
+                        updated += self.set_cell(row, column, new_values[column][row])
             except IndexError:
                 print("Your data does not match the dimensions of the table.")
 
+        return updated
+
     def clear_cells(self):
-        for column in range(self.columns):
-            for row in range(self.rows):
-                self.cell_values[row][column].set("")
+        return self.update_batch((row, column, "") for column in range(self.columns) for row in range(self.rows))
 
     def update_column(self, column, new_values):
-        try:
-            for row in range(self.rows):
-                self.cell_values[row][column].set(new_values[row])
-        except IndexError:
+        """
+        :return: number of cells whose text changed
+        """
+        if len(new_values) < self.rows:
             print("Your data does not match the dimensions of the table.")
 
+        return self.update_batch((row, column, new_values[row]) for row in range(min(self.rows, len(new_values))))
+
     def clear_column(self, column):
-        for row in range(self.rows):
-            self.cell_values[row][column].set("")
+        return self.update_batch((row, column, "") for row in range(self.rows))
 
     def set_headers(self, values):
         for row in range(self.rows):
@@ -252,6 +319,236 @@ class HorizontalTable(Frame):
             return result
 
 
+class VirtualTable(Frame):
+    """
+    A scrollable table backed by a ttk.Treeview. Tk only draws the rows in view, and rows are items rather than
+    widgets, so thousands of them stay responsive. Rows are updated and deleted in place.
+
+    :param headers: the text of the column headers
+    :param can_select_rows: rows can be selected, and an action button is shown
+    :param button_command: Action button's command
+    :param height: number of visible rows
+    """
+    def __init__(self, parent, **kwargs):
+        Frame.__init__(self, parent)
+
+        # read keyword arguments
+        headers = kwargs.pop("headers", [])
+        self.can_select_rows = kwargs.pop("can_select_rows", False)
+        self.button_command = kwargs.pop("button_command", None)
+        height = kwargs.pop("height", 15)
+
+        if kwargs:
+            raise TypeError('Unexpected **kwargs: %r' % kwargs)
+
+        # Same look as the other tables
+        style = ttk.Style(self)
+        style.configure("Virtual.Treeview", font=("Segoe UI Emoji", 12), rowheight=28)
+        style.configure("Virtual.Treeview.Heading", font=("Segoe UI Emoji", 13, "bold"),
+                        background="#5E5E5E", foreground="#FFFFFF")
+
+        self.tree = ttk.Treeview(self, show="headings", height=height, style="Virtual.Treeview",
+                                 selectmode=EXTENDED if self.can_select_rows else NONE)
+        self.tree.grid(row=1, column=0, sticky=NSEW)
+
+        # Scroll bars
+        self.y_scroll = Scrollbar(self, orient=VERTICAL, command=self.tree.yview)
+        self.y_scroll.grid(row=1, column=1, sticky=NS)
+        self.x_scroll = Scrollbar(self, orient=HORIZONTAL, command=self.tree.xview)
+        self.x_scroll.grid(row=2, column=0, sticky=EW)
+        self.tree.configure(yscrollcommand=self.y_scroll.set, xscrollcommand=self.x_scroll.set)
+
+        if self.can_select_rows:
+            # Delete button
+            self.delete_button = Button(self, text="Delete selected", state=DISABLED, relief=GROOVE)
+
+            # save the original background color to restore it later
+            self.disabled_background = self.delete_button.cget("background")
+
+            # optional button callback
+            if self.button_command:
+                self.delete_button.configure(command=self.button_command)
+            self.delete_button.grid(row=0, column=0, sticky=W, pady=5)
+
+            self.tree.bind("<<TreeviewSelect>>", self.update_button)
+
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        self.set_headers(headers)
+
+    def set_headers(self, headers):
+        self.headers = list(headers)
+        self.tree.configure(columns=self.headers)
+
+        for column, header in enumerate(self.headers):
+            self.tree.heading(column, text=header)
+            self.tree.column(column, width=80, minwidth=60, anchor=CENTER, stretch=False)
+
+    def set_rows(self, rows):
+        # replace the content of the table
+        self.clear()
+        for row in rows:
+            self.tree.insert("", END, values=row)
+
+        self.update_button()
+
+    def update_row(self, index, values):
+        self.tree.item(self.tree.get_children()[index], values=values)
+
+    def delete_rows(self, indices):
+        items = self.tree.get_children()
+        self.tree.delete(*[items[index] for index in indices])
+
+        self.update_button()
+
+    def clear(self):
+        self.tree.delete(*self.tree.get_children())
+
+    def row_count(self):
+        return len(self.tree.get_children())
+
+    def update_button(self, *args):
+        if not self.can_select_rows:
+            return
+
+        # enabled while any row is selected
+        if self.tree.selection():
+            self.delete_button.configure(state=NORMAL, bg="#FF3300", fg="#FFFFFF", cursor="hand2")
+        else:
+            self.delete_button.configure(state=DISABLED, bg=self.disabled_background, cursor="arrow")
+
+    def get_selected_indices(self):
+        """
+        Used when user presses delete button to find which are the deleted rows.
+
+        :return: sorted array of indices corresponding to selected rows
+        """
+        return sorted(self.tree.index(item) for item in self.tree.selection())
+
+
+class CrossSectionView(Canvas):
+    """
+    Live cross-section of the pole, drawn on a plain Tk canvas. The items are created once and only moved for each
+    frame, which is cheap enough to keep up with the sensors.
+
+    :param structure_radius: radius of the sensor ring, in the units of the points; sets the scale
+    :param size: width and height of the canvas, in pixels
+    """
+    def __init__(self, parent, structure_radius=16.0, size=260, **kwargs):
+        Canvas.__init__(self, parent, width=size, height=size, bg="#FFFFFF", highlightthickness=0, **kwargs)
+
+        self.structure_radius = structure_radius
+        self.width = size
+        self.height = size
+
+        # last frame shown, to redraw it on resize
+        self.last_frame = None
+
+        # sensor ring, estimated outline, fitted circle and its center
+        self.ring = self.create_oval(0, 0, 0, 0, outline="#C9C9C9", width=2)
+        self.outline = self.create_polygon(0, 0, 0, 0, 0, 0, fill="#DFF0C2", outline="#99CC33", width=2,
+                                           state=HIDDEN)
+        self.circle = self.create_oval(0, 0, 0, 0, outline="#FF9900", dash=(4, 2), state=HIDDEN)
+        self.center = self.create_line(0, 0, 0, 0, fill="#FF9900", width=2, state=HIDDEN)
+        self.origin = self.create_line(0, 0, 0, 0, fill="#C9C9C9")
+
+        # a dot per sensor reading
+        self.dots = []
+
+        self.caption = self.create_text(5, 5, anchor=NW, text="", fill="#333333")
+
+        self.bind("<Configure>", self.on_resize)
+        self.draw_static()
+
+    def on_resize(self, event):
+        self.width = event.width
+        self.height = event.height
+        self.draw_static()
+
+        if self.last_frame is not None:
+            self.show(*self.last_frame)
+
+    def set_structure_radius(self, structure_radius):
+        self.structure_radius = structure_radius
+        self.draw_static()
+
+    def scale(self):
+        # leave some margin around the ring
+        return 0.5 * min(self.width, self.height) / (self.structure_radius * 1.1)
+
+    def to_canvas(self, x, y):
+        scale = self.scale()
+        return self.width / 2.0 + x * scale, self.height / 2.0 - y * scale
+
+    def draw_static(self):
+        (cx, cy) = self.to_canvas(0.0, 0.0)
+        r = self.structure_radius * self.scale()
+
+        self.coords(self.ring, cx - r, cy - r, cx + r, cy + r)
+        self.coords(self.origin, cx - 5, cy, cx + 5, cy)
+
+    def show(self, x, y, misreading, circle=None, caption=""):
+        """
+        Draw a frame.
+
+        :param x: x of each reading's point
+        :param y: y of each reading's point
+        :param misreading: for each reading, True if it doesn't fit the others; drawn in red
+        :param circle: (centerX, centerY, radius) fitted to the points, or None
+        :param caption: text on the top left corner
+        """
+        self.last_frame = (x, y, misreading, circle, caption)
+
+        # one dot per reading
+        while len(self.dots) < len(x):
+            self.dots.append(self.create_oval(0, 0, 0, 0, outline=""))
+        for dot in self.dots[len(x):]:
+            self.itemconfigure(dot, state=HIDDEN)
+
+        limit = self.structure_radius
+        outline = []
+        for (dot, px, py, bad) in zip(self.dots, x, y, misreading):
+            # keep readings that see nothing on the ring
+            distance = (px * px + py * py) ** 0.5
+            if distance > limit:
+                px, py = px * limit / distance, py * limit / distance
+
+            (cx, cy) = self.to_canvas(px, py)
+            self.coords(dot, cx - 4, cy - 4, cx + 4, cy + 4)
+            self.itemconfigure(dot, state=NORMAL, fill="#FF3300" if bad else "#35AD35")
+
+            if not bad:
+                outline.extend((cx, cy))
+
+        # estimated cross-section through the good readings
+        if len(outline) >= 6:
+            self.coords(self.outline, *outline)
+            self.itemconfigure(self.outline, state=NORMAL)
+        else:
+            self.itemconfigure(self.outline, state=HIDDEN)
+
+        if circle is not None:
+            (cx, cy) = self.to_canvas(circle[0], circle[1])
+            r = circle[2] * self.scale()
+            self.coords(self.circle, cx - r, cy - r, cx + r, cy + r)
+            self.coords(self.center, cx, cy - 5, cx, cy + 5)
+            self.itemconfigure(self.circle, state=NORMAL)
+            self.itemconfigure(self.center, state=NORMAL)
+        else:
+            self.itemconfigure(self.circle, state=HIDDEN)
+            self.itemconfigure(self.center, state=HIDDEN)
+
+        self.itemconfigure(self.caption, text=caption)
+        self.tag_raise(self.caption)
+
+    def clear(self):
+        self.last_frame = None
+        for item in [self.outline, self.circle, self.center] + self.dots:
+            self.itemconfigure(item, state=HIDDEN)
+        self.itemconfigure(self.caption, text="")
+
+
 class ResponsiveImage(Frame):
 
     def __init__(self, parent, image, tag="IMG", anchor=N):
@@ -280,8 +577,11 @@ class ResponsiveImage(Frame):
         self.bind("<Configure>", self.resize)
 
     def resize(self, event):
+        self.draw(event.width, event.height)
+
+    def draw(self, width, height):
         # resize while keeping aspect ratio
-        resized = resize_keep_aspect(image=self.original, max_w=event.width, max_h=event.height)
+        resized = resize_keep_aspect(image=self.original, max_w=width, max_h=height)
 
         # the new resized image, in TkImage format
         self.image = ImageTk.PhotoImage(resized)
@@ -289,16 +589,18 @@ class ResponsiveImage(Frame):
 
         # place image top-centered in the canvas
         if self.anchor == N:
-            self.canvas.create_image(event.width/2, 0, image=self.image, anchor=N, tags=self.tag)
+            self.canvas.create_image(width/2, 0, image=self.image, anchor=N, tags=self.tag)
         # only NW for now
         else:
             self.canvas.create_image(0, 0, image=self.image, anchor=NW, tags=self.tag)
 
-    # def change_image(self, image):
-    #     self.original = image
-    #     self.image = ImageTk.PhotoImage(self.original)
-    #     self.canvas.delete("IMG")
-    #     self.canvas.create_image(0, 0, image=self.image, anchor=NW, tags="IMG")
+    def change_image(self, image):
+        # reuse this widget for another image
+        self.original = image
+
+        # not laid out yet; the first resize will draw it
+        if self.winfo_width() > 1 and self.winfo_height() > 1:
+            self.draw(self.winfo_width(), self.winfo_height())
 
 
 class EntryWithPlaceholder(Entry):
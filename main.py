@@ -1,22 +1,32 @@
+import time
+
+# Taken before anything else is imported, to measure the time to the home screen
+START_TIME = time.perf_counter()
+
+import importlib
+import sys
 from tkinter import *
-from tkinter import font, messagebox
+from tkinter import filedialog, font, messagebox
 
 from PIL import ImageTk, Image
 
-from backend.bpc import reset_bpc_backend
-from backend.bpc_threading import main_quit
-from backend.bsc import reset_bsc_backend, get_number_original_circumferences
-from gui.bpc.configuration import ConfigBPC
-from gui.bpc.measure import MeasureBPC
-from gui.bpc.results import ResultsBPC
-from gui.bsc.choose_image import ConfigBSC
-from gui.bsc.choose_ref_object import RefObjectBSC
-from gui.bsc.pick_circumferences import PickCircumferencesBSC
-from gui.bsc.results import ResultsBSC
-from gui.home import Home
+from backend import instrumentation, logs
 from gui.widgets.custom import ResponsiveImage
 from gui.widgets.helpers import make_rows_responsive, make_columns_responsive, resize_keep_aspect
 
+# Module of each page. Pages, and the heavy libraries their tools need (OpenCV, SciPy, matplotlib, pyserial), are
+# only imported when the page is first shown.
+PAGE_MODULES = {
+    "Home": "gui.home",
+    "ConfigBSC": "gui.bsc.choose_image",
+    "PickCircumferencesBSC": "gui.bsc.pick_circumferences",
+    "RefObjectBSC": "gui.bsc.choose_ref_object",
+    "ResultsBSC": "gui.bsc.results",
+    "ConfigBPC": "gui.bpc.configuration",
+    "MeasureBPC": "gui.bpc.measure",
+    "ResultsBPC": "gui.bpc.results",
+}
+
 
 class BambooScanner(Tk):
 
@@ -92,19 +102,12 @@ class BambooScanner(Tk):
         self.bamboo = ResponsiveImage(self.container, bamboo_image, tag="bamboo", anchor=NW)
         self.bamboo.grid(row=1, column=0, sticky=NSEW)
 
-        # The class names for both BSC and BPC
-        self.bsc_pages = (ConfigBSC, PickCircumferencesBSC, RefObjectBSC, ResultsBSC)
-        self.bpc_pages = (ConfigBPC, MeasureBPC, ResultsBPC)
+        # The page names for both BSC and BPC
+        self.bsc_pages = ("ConfigBSC", "PickCircumferencesBSC", "RefObjectBSC", "ResultsBSC")
+        self.bpc_pages = ("ConfigBPC", "MeasureBPC", "ResultsBPC")
 
-        # Initialize all pages and keep their references accessible
+        # Pages built so far; the rest are built the first time they are shown
         self.frames = {}
-        for F in (() + (Home,) + self.bsc_pages + self.bpc_pages):
-            page_name = F.__name__
-            frame = F(parent=self.container, controller=self)
-            self.frames[page_name] = frame
-
-            # Add all frames to the container, on top of each other
-            frame.grid(row=1, column=1, sticky=NSEW)
 
         # make the window responsive, except the navbar row
         make_rows_responsive(self.container, ignored=[0])
@@ -112,39 +115,37 @@ class BambooScanner(Tk):
 
         # Start on the home page
         self.active_frame = None
+        self.active_page = None
         self.show_frame("Home")
 
     def go_back(self, event=None):
         # Check if active frame is from BPC
-        for i, page in enumerate(self.bpc_pages):
-            # find the active page
-            if type(self.active_frame) == page:
-                # first page goes back to Home
-                if i == 0:
-                    self.go_home()
-                else:
-                    # name of previous frame
-                    page_name = self.bpc_pages[i-1].__name__
-                    self.show_frame(page_name)
-                return
+        if self.active_page in self.bpc_pages:
+            i = self.bpc_pages.index(self.active_page)
+            # first page goes back to Home
+            if i == 0:
+                self.go_home()
+            else:
+                # name of previous frame
+                self.show_frame(self.bpc_pages[i-1])
 
         # Must be in BSC then
-        for i, page in enumerate(self.bsc_pages):
-            # find the active page
-            if type(self.active_frame) == page:
-                # first page goes back to Home
-                if i == 0:
-                    self.go_home()
-                else:
-                    # name of previous frame
-                    page_name = self.bsc_pages[i-1].__name__
+        elif self.active_page in self.bsc_pages:
+            i = self.bsc_pages.index(self.active_page)
+            # first page goes back to Home
+            if i == 0:
+                self.go_home()
+            else:
+                # name of previous frame
+                page_name = self.bsc_pages[i-1]
 
-                    # Don't go back to pick circumferences if only 2 where detected
-                    if page_name == "PickCircumferencesBSC" and get_number_original_circumferences() <= 2:
-                        self.show_frame("ConfigBSC")
-                    else:
-                        self.show_frame(page_name)
-                return
+                from backend.bsc import were_slices_detected
+
+                # Don't go back to pick circumferences if the slices were detected
+                if page_name == "PickCircumferencesBSC" and were_slices_detected():
+                    self.show_frame("ConfigBSC")
+                else:
+                    self.show_frame(page_name)
 
     def go_home(self, event=None):
         result = messagebox.askokcancel("Go Home?", "If you leave now, all unsaved progress will be lost.",
@@ -152,11 +153,13 @@ class BambooScanner(Tk):
 
         if result:
             # Reset the tool we were using
-            # came from BPC
-            if type(self.active_frame) in self.bpc_pages:
+            # came from BPC; the user gave up the session, it won't be offered for restore
+            if self.active_page in self.bpc_pages:
+                from backend.bpc import discard_journal
+                discard_journal()
                 self.reset_BPC()
             # came from BSC
-            else:
+            elif self.active_page in self.bsc_pages:
                 self.reset_BSC()
 
             # go home
@@ -174,29 +177,40 @@ class BambooScanner(Tk):
 
         :param page_name: class name of destination frame
         """
+        with instrumentation.span("gui.show_frame." + page_name):
+            # If there is an active frame, signal its exit
+            if self.active_frame is not None:
+                with instrumentation.span("gui.leave_frame." + self.active_page):
+                    self.active_frame.event_generate("<<LeaveFrame>>")
 
-        # If there is an active frame, signal its exit
-        if self.active_frame is not None:
-            self.active_frame.event_generate("<<LeaveFrame>>")
+            # Switch to new active frame
+            self.active_frame = self.get_frame(page_name)
+            self.active_page = page_name
 
-        # Switch to new active frame
-        self.active_frame = self.frames[page_name]
+            # update page title and step, except for Home page
+            if page_name != "Home":
+                self.update_page_title(self.active_frame.title)
+                self.update_page_step()
 
-        # update page title and step, except for Home page
-        if type(self.active_frame) != Home:
-            self.update_page_title(self.active_frame.title)
-            self.update_page_step()
-
-        self.active_frame.update()
-        self.active_frame.event_generate("<<ShowFrame>>")
-        self.active_frame.tkraise()
+            self.active_frame.update()
+            self.active_frame.event_generate("<<ShowFrame>>")
+            self.active_frame.tkraise()
 
     def get_frame(self, page_name):
         """
-        Get the instance of a page
+        Get the instance of a page, building it the first time.
 
         :return: The frame of the specified page
         """
+        if page_name not in self.frames:
+            with instrumentation.span("gui.build_page." + page_name):
+                page = getattr(importlib.import_module(PAGE_MODULES[page_name]), page_name)
+                frame = page(parent=self.container, controller=self)
+            self.frames[page_name] = frame
+
+            # Add all frames to the container, on top of each other
+            frame.grid(row=1, column=1, sticky=NSEW)
+
         return self.frames[page_name]
 
     def update_page_title(self, title):
@@ -204,20 +218,84 @@ class BambooScanner(Tk):
 
     def update_page_step(self):
         # Check if active frame is from BPC
-        for i, page in enumerate(self.bpc_pages, start=1):
-            # find the active page
-            if type(self.active_frame) == page:
-                message = "Pole Characterization\n step " + str(i) + " of " + str(len(self.bpc_pages))
-                self.step.set(message)
-                return
+        if self.active_page in self.bpc_pages:
+            i = self.bpc_pages.index(self.active_page) + 1
+            message = "Pole Characterization\n step " + str(i) + " of " + str(len(self.bpc_pages))
+            self.step.set(message)
 
         # Active frame is from BSC
-        for i, page in enumerate(self.bsc_pages, start=1):
-            # find the active page
-            if type(self.active_frame) == page:
-                message = "Slice Characterization\n step " + str(i) + " of " + str(len(self.bsc_pages))
-                self.step.set(message)
-                return
+        elif self.active_page in self.bsc_pages:
+            i = self.bsc_pages.index(self.active_page) + 1
+            message = "Slice Characterization\n step " + str(i) + " of " + str(len(self.bsc_pages))
+            self.step.set(message)
+
+    def create_debug_menu(self):
+        """
+        Menu to record timings of the slow parts of the program, and export them as JSON.
+        """
+        self.record_timings = BooleanVar(value=instrumentation.is_enabled())
+
+        menu_bar = Menu(self)
+        debug_menu = Menu(menu_bar, tearoff=0)
+        debug_menu.add_checkbutton(label="Record timings", variable=self.record_timings,
+                                   command=self.toggle_instrumentation)
+        debug_menu.add_command(label="Export timings as JSON...", command=self.export_timings)
+        debug_menu.add_command(label="Reset timings", command=instrumentation.reset)
+        debug_menu.add_separator()
+        debug_menu.add_command(label="Live feed stats", command=self.show_live_feed_stats)
+        menu_bar.add_cascade(label="Debug", menu=debug_menu)
+
+        self.configure(menu=menu_bar)
+
+    def toggle_instrumentation(self):
+        if self.record_timings.get():
+            instrumentation.enable()
+        else:
+            instrumentation.disable()
+
+    def export_timings(self):
+        date = time.strftime('%Y-%m-%d_%H%M%S')
+        save_path = filedialog.asksaveasfilename(title="Save as", defaultextension=".json",
+                                                 initialfile="timings_" + date)
+
+        # make sure the user didn't cancel the dialog
+        if len(save_path) > 0:
+            if instrumentation.export_json(save_path):
+                messagebox.showinfo("Success!", "File was generated successfully.")
+            else:
+                messagebox.showerror("Error generating file", "Make sure you have access to the selected destination.")
+
+    def show_live_feed_stats(self):
+        # the page is only built when first shown
+        if "MeasureBPC" not in self.frames:
+            messagebox.showinfo("Live feed stats", "The live readings page hasn't been shown yet.")
+            return
+
+        messagebox.showinfo("Live feed stats", "%(published)s frames published\n%(delivered)s shown\n"
+                                               "%(dropped)s dropped\n%(cells_updated)s cells updated"
+                            % self.frames["MeasureBPC"].get_live_feed_stats())
+
+    def offer_session_restore(self):
+        """
+        Offer to restore a Pole Characterization session that was not saved, e.g. after a crash.
+        """
+        from backend.bpc import find_unsaved_session, restore_session, discard_journal
+
+        captures = find_unsaved_session()
+        if not captures:
+            return
+
+        if messagebox.askyesno("Restore unsaved session?",
+                               "A Pole Characterization session with %s captured measurements was not "
+                               "saved. Do you want to restore it?" % captures, icon="warning"):
+            restore_session()
+
+            # review the restored measurements
+            self.restore_navbar()
+            self.show_frame("ResultsBPC")
+        else:
+            # don't ask again on the next start
+            discard_journal()
 
     def hide_navbar(self):
         self.navbar.grid_remove()
@@ -230,15 +308,17 @@ class BambooScanner(Tk):
         if kwargs:
             raise TypeError('Unexpected **kwargs: %r' % kwargs)
 
-        for page in self.bpc_pages:
-            if page not in ignored:
-                name = page.__name__
+        # pages that were never built have nothing to reset
+        for name in self.bpc_pages:
+            if name not in ignored and name in self.frames:
                 self.frames[name].reset()
 
     def reset_BPC(self):
         """
         Reset all the BPC GUI frames and its backend module
         """
+        from backend.bpc import reset_bpc_backend
+
         # reset GUI
         self.reset_BPC_GUI()
 
@@ -250,15 +330,17 @@ class BambooScanner(Tk):
         if kwargs:
             raise TypeError('Unexpected **kwargs: %r' % kwargs)
 
-        for page in self.bsc_pages:
-            if page not in ignored:
-                name = page.__name__
+        # pages that were never built have nothing to reset
+        for name in self.bsc_pages:
+            if name not in ignored and name in self.frames:
                 self.frames[name].reset()
 
     def reset_BSC(self):
         """
         Reset all the BSC GUI frames and its backend module
         """
+        from backend.bsc import reset_bsc_backend
+
         # reset GUI
         self.reset_BSC_GUI()
 
@@ -269,18 +351,47 @@ class BambooScanner(Tk):
 if __name__ == "__main__":
     def exit_handler():
         # Exit directly on home screen, otherwise ask for confirmation
-        if type(app.active_frame) == Home or messagebox.askokcancel("Exit Program",
+        if app.active_page == "Home" or messagebox.askokcancel("Exit Program",
                                                                     "Are you sure you want to exit Bamboo Scanner?",
                                                                     default="cancel", icon="warning"):
-            # Close port before quitting
-            main_quit.set()
+            # Close port before quitting; the live feed only exists if the BPC tool was opened
+            if "backend.bpc_threading" in sys.modules:
+                sys.modules["backend.bpc_threading"].main_quit.set()
             # Exit
             app.destroy()
 
+    # run BPC without the sensor ring
+    if "--virtual-arduino" in sys.argv:
+        from backend.arduino_simulator import install
+        install()
+
+    # record timings from the start, show the debug menu, and log everything
+    debug = "--debug" in sys.argv
+    if debug:
+        instrumentation.enable()
+
+    # backend logs; see backend/logs.py for the environment variables that tune them
+    logs.configure_from_env(level="DEBUG" if debug else None)
+
     # start GUI
     app = BambooScanner()
+    if debug:
+        app.create_debug_menu()
     # window title
     app.title("Bamboo Scanner")
     # Program exit handler
     app.protocol("WM_DELETE_WINDOW", exit_handler)
+
+    # draw the home screen, and report how long it took to get there
+    app.update()
+    startup_time = time.perf_counter() - START_TIME
+    instrumentation.record("gui.startup", startup_time)
+    if "--startup-time" in sys.argv:
+        print("home screen shown %.2f s after start" % startup_time)
+        app.destroy()
+        sys.exit()
+
+    # bring back captures that were not saved
+    app.after_idle(app.offer_session_restore)
+
     app.mainloop()
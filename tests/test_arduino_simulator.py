@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from backend import arduino_simulator, sensors_manager
+from backend.arduino_simulator import VirtualArduino
+
+
+@pytest.fixture
+def serial_backend():
+    yield
+    if sensors_manager.isPortOpen:
+        sensors_manager.closeArduinoSerial()
+    sensors_manager.resetSerialBackend()
+
+
+def test_readings_of_a_centered_pole():
+    device = VirtualArduino(sensors=8, ring_diameter=32.0, pole_radius=5.0)
+
+    np.testing.assert_allclose(device.expected_readings(), 11.0)
+
+
+def test_readings_of_an_offset_pole():
+    device = VirtualArduino(sensors=4, ring_diameter=32.0, pole_radius=5.0, pole_center=(2.0, 0.0))
+
+    # sensors at 0, 90, 180 and 270 degrees
+    expected = [9.0, 16.0 - np.sqrt(21.0), 13.0, 16.0 - np.sqrt(21.0)]
+    np.testing.assert_allclose(device.expected_readings(), expected)
+
+
+def test_sensors_that_miss_report_max_range():
+    device = VirtualArduino(sensors=4, pole_radius=1.0, pole_center=(0.0, 10.0), max_range=30.0)
+
+    assert device.expected_readings()[0] == 30.0
+
+
+def test_handshake_and_frames():
+    device = VirtualArduino(sensors=6, rate=None, noise=0.0, z=12.5).open()
+
+    assert device.readline() == b""
+    device.write(b"START")
+    assert device.readline() == b"STARTREC\r\n"
+
+    frame = sensors_manager.parseSensorLine(device.readline())
+    assert len(frame) == 7
+    assert frame[-1] == 12.5
+
+    device.write(b"STOP")
+    assert device.readline() == b"STOPREC\r\n"
+    assert device.readline() == b""
+
+
+def test_installed_simulator_replaces_the_arduino(serial_backend):
+    arduino_simulator.install(sensors=12, rate=None, noise=0.0)
+
+    frame = sensors_manager.readSensorFrame()
+
+    assert sensors_manager.getDeviceId() == "VIRTUAL0"
+    np.testing.assert_allclose(frame[:-1], 11.0)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from backend.bpc import slices_geometry, round_geometry
+
+
+def test_geometry_of_every_slice_at_once():
+    # a circle of radius 4 around the ring's center, and one shifted by 1 along x, seen by 4 sensors
+    rows = [[4.0, 4.0, 4.0, 4.0, 10.0],
+            [5.0, 4.0, 3.0, 4.0, 20.0]]
+
+    geometry = slices_geometry(rows)
+
+    np.testing.assert_array_equal(geometry["z"], [10.0, 20.0])
+    np.testing.assert_allclose(geometry["xy"][0], [[4, 0], [0, 4], [-4, 0], [0, -4]], atol=1e-12)
+    np.testing.assert_allclose(geometry["centroids"], [[0, 0], [0.5, 0]], atol=1e-12)
+    np.testing.assert_allclose(geometry["average_diameters"], [8.0, 8.0])
+    # polar coordinates around each slice's own centroid
+    np.testing.assert_allclose(geometry["polar"][0], [[4, 0], [4, 90], [4, 180], [4, -90]], atol=1e-12)
+    np.testing.assert_allclose(geometry["polar"][1][0], [4.5, 0.0], atol=1e-12)
+
+
+def test_round_geometry():
+    rounded = round_geometry(slices_geometry([[1.0, 1.0, 1.0, 0.0]]))
+
+    assert rounded["xy"][0].tolist() == [[1.0, 0.0], [-0.5, 0.87], [-0.5, -0.87]]
+
+
+def test_one_row_per_slice_is_required():
+    with pytest.raises(ValueError):
+        slices_geometry([1.0, 2.0, 3.0])
+    with pytest.raises(ValueError):
+        slices_geometry([[1.0]])
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+from backend import bpc_threading, sensors_manager
+from backend.bpc_threading import IDLE, LIVE, CAPTURING, CALIBRATING, SCANNING, LiveFeedThread, ZStepTrigger, \
+    LatestValueMailbox, CoalescedNotifier
+
+
+class Widget(object):
+    def put_live_frame(self, frame):
+        pass
+
+    def wake(self):
+        pass
+
+
+@pytest.fixture
+def flushes(monkeypatch):
+    calls = []
+    monkeypatch.setattr(bpc_threading, "resetInputBuffer", lambda: calls.append(True))
+    return calls
+
+
+@pytest.mark.parametrize("start, target", [
+    (IDLE, LIVE), (IDLE, CAPTURING), (IDLE, CALIBRATING), (LIVE, CAPTURING), (LIVE, CALIBRATING), (LIVE, SCANNING),
+])
+def test_input_buffer_is_flushed_before_reading_for_a_new_state(flushes, start, target):
+    feed = LiveFeedThread(Widget())
+    feed.state = start
+
+    feed.set_state(target)
+    if feed.scan_worker is not None:
+        feed.scan_worker.stop()
+
+    assert feed.state == target
+    assert len(flushes) == 1
+
+
+@pytest.mark.parametrize("start", [CAPTURING, CALIBRATING, SCANNING])
+def test_going_back_to_live_keeps_the_buffer(flushes, start):
+    feed = LiveFeedThread(Widget())
+    feed.state = start
+
+    feed.set_state(LIVE)
+
+    assert feed.state == LIVE
+    assert not flushes
+
+
+def test_invalid_transitions_are_ignored(flushes):
+    feed = LiveFeedThread(Widget())
+    feed.state = CAPTURING
+
+    feed.set_state(SCANNING)
+
+    assert feed.state == CAPTURING
+    assert not flushes
+
+
+def test_mailbox_keeps_only_the_newest_value():
+    mailbox = LatestValueMailbox()
+    assert mailbox.take() is None
+
+    for frame in range(3):
+        mailbox.put(frame)
+
+    assert mailbox.take() == 2
+    assert mailbox.take() is None
+    assert mailbox.get_stats() == {"published": 3, "delivered": 1, "dropped": 2}
+
+
+def test_mailbox_clear_drops_the_waiting_value():
+    mailbox = LatestValueMailbox()
+    mailbox.put("frame")
+    mailbox.clear()
+
+    assert mailbox.take() is None
+    assert mailbox.get_stats()["delivered"] == 0
+
+
+def test_notifier_wakes_once_until_acknowledged():
+    wakes = []
+    notifier = CoalescedNotifier(lambda: wakes.append(True))
+
+    for i in range(5):
+        notifier.notify()
+    assert len(wakes) == 1
+
+    notifier.acknowledge()
+    notifier.notify()
+    assert len(wakes) == 2
+
+
+def stops(trigger, raw_zs, frames_per_stop=8):
+    # the carriage holds still at each raw Z; returns the raw Z of every capture
+    captures = []
+    for z in raw_zs:
+        for i in range(frames_per_stop):
+            frames = trigger.update([11.0, 11.0, z])
+            if frames is not None:
+                assert frames.shape == (trigger.window, 3)
+                captures.append(frames[0, -1])
+
+    return captures
+
+
+def test_trigger_captures_once_per_stop_a_step_apart():
+    trigger = ZStepTrigger(step=1.0, window=4, calibrate_z=lambda z: z)
+
+    assert stops(trigger, [0.0, 0.5, 1.0, 1.0, 3.0, 2.5]) == [0.0, 1.0, 3.0]
+
+
+def test_trigger_waits_for_the_carriage_to_stop():
+    trigger = ZStepTrigger(step=1.0, tolerance=0.2, window=4, calibrate_z=lambda z: z)
+
+    # moving 0.1 per frame: never 4 frames within 0.2
+    assert stops(trigger, np.arange(0.0, 5.0, 0.1), frames_per_stop=1) == []
+
+
+def test_trigger_compares_calibrated_z():
+    sensors_manager.sensorBank.z_factor = 2.0
+    try:
+        trigger = ZStepTrigger(step=1.0, tolerance=0.2, window=4)
+
+        # 0.5 of raw reading is 1 cm; and 0.15 of jitter is 0.3 cm, so the carriage isn't still
+        assert stops(trigger, [0.0, 0.5, 0.75, 1.0]) == [0.0, 0.5, 1.0]
+        assert stops(ZStepTrigger(window=2), [5.0, 5.15] * 4, frames_per_stop=1) == []
+    finally:
+        sensors_manager.sensorBank.reset()
@@ -0,0 +1,154 @@
+import cv2
+import numpy as np
+import pytest
+
+from backend import bsc
+
+
+def circle(cx, cy, r):
+    contour = cv2.ellipse2Poly((cx, cy), (r, r), 0, 0, 360, 1).reshape(-1, 1, 2).astype(np.int32)
+    return contour, (cx, cy)
+
+
+@pytest.fixture
+def backend():
+    bsc.reset_bsc_backend()
+    yield vars(bsc)
+    bsc.reset_bsc_backend()
+
+
+def test_nested_circumferences_are_paired_into_slices():
+    circumferences = [
+        circle(700, 200, 60),   # coin, no inner circumference
+        circle(200, 220, 150),  # first slice, outer
+        circle(210, 220, 100),  # first slice, inner
+        circle(200, 220, 148),  # other side of the outer edge: too big to be the inner one
+        circle(500, 200, 40),   # second slice, inner
+        circle(500, 200, 90),   # second slice, outer
+        circle(350, 600, 120),  # third slice, on the next row
+        circle(350, 600, 70),
+    ]
+    indices = list(range(len(circumferences)))
+
+    slices = bsc.find_slices(circumferences, indices, parents=[-1] * len(circumferences))
+
+    assert [[c[1] for c in sl] for sl in slices] == [[(200, 220), (210, 220)], [(500, 200), (500, 200)],
+                                                      [(350, 600), (350, 600)]]
+    # the biggest inner candidate clearly smaller than the outer one
+    assert slices[0][1][0] is circumferences[2][0]
+    assert cv2.contourArea(slices[1][0][0]) > cv2.contourArea(slices[1][1][0])
+
+
+def test_holes_are_paired_through_the_hierarchy():
+    # contour 7 is a hole of contour 4
+    circumferences = [circle(300, 300, 200), circle(300, 300, 50)]
+
+    slices = bsc.find_slices(circumferences, indices=[4, 7], parents=[-1, -1, -1, -1, -1, -1, -1, 4])
+
+    assert len(slices) == 1
+    assert slices[0][0] is circumferences[0]
+
+
+def test_no_slices():
+    assert bsc.find_slices([], [], []) == []
+    assert bsc.find_slices([circle(100, 100, 50)], [0], [-1]) == []
+
+
+def test_picked_circumferences_make_a_slice(backend):
+    backend["__original_circumferences"] = [circle(100, 100, 30), circle(300, 300, 60), circle(300, 300, 120)]
+
+    bsc.set_final_circumferences([1, 2])
+
+    assert bsc.get_number_slices() == 1
+    assert not bsc.were_slices_detected()
+
+
+@pytest.mark.parametrize("selected", [[], [1], [0, 1, 2], [1, 1], [2, 5]])
+def test_a_slice_needs_exactly_2_circumferences(backend, selected):
+    backend["__original_circumferences"] = [circle(100, 100, 30), circle(300, 300, 60), circle(300, 300, 120)]
+
+    with pytest.raises(ValueError):
+        bsc.set_final_circumferences(selected)
+
+    assert bsc.get_number_slices() == 0
+
+
+def eccentric_ring():
+    # outer radius 200 px, inner radius 150 px shifted 30 px to the right: 20 px of wall at 0 degrees, 80 px at 180
+    return [circle(300, 300, 200), circle(330, 300, 150)]
+
+
+def test_wall_thickness_profile(backend):
+    bsc.set_pixels_per_metric(10.0)
+
+    thickness = bsc.wall_thickness(eccentric_ring(), bins=36)
+
+    assert thickness["min"] == pytest.approx(2.0, abs=0.05)
+    assert thickness["max"] == pytest.approx(8.0, abs=0.05)
+    assert 2.0 < thickness["mean"] < 8.0
+    assert len(thickness["thetas"]) == len(thickness["thickness"]) == 36
+    profile = dict(zip(thickness["thetas"], thickness["thickness"]))
+    assert profile[-175.0] > profile[-5.0]
+
+
+def test_decimated_angles_near_180_degrees(backend):
+    bsc.set_pixels_per_metric(10.0)
+    # points on the centroid's row to its left are at exactly 180 degrees, in the same bin as those near -180
+    (rs, thetas, _) = bsc.contour_to_polar(*circle(100, 100, 50))
+    assert 180.0 in thetas
+
+    (binned_rs, binned_thetas) = bsc.decimate_polar(rs, thetas, bins=36)
+
+    # the first bin is -180 to -170 degrees
+    assert np.degrees(np.angle(np.exp(1j * (binned_thetas[0] + np.radians(175.0))))) == pytest.approx(0.0, abs=1.0)
+    assert binned_thetas[-1] == binned_thetas[0]
+    assert binned_rs == pytest.approx(5.0, abs=0.05)
+    # consecutive points are a bin apart, the curve doesn't jump across the plot
+    steps = np.angle(np.exp(1j * np.diff(binned_thetas[:-1])))
+    assert steps == pytest.approx(2.0 * np.pi / 36, abs=0.05)
+
+
+def test_thickness_heatmap_of_an_eccentric_ring(backend):
+    bsc.set_pixels_per_metric(10.0)
+    outer, inner = eccentric_ring()
+    x, y, w, h = cv2.boundingRect(outer[0])
+
+    thickness, mask = bsc.thickness_heatmap([outer, inner], (x, y), (h, w))
+
+    # wall pixels at 0 and 180 degrees
+    assert mask[300 - y, 490 - x] and mask[300 - y, 140 - x]
+    assert thickness[300 - y, 490 - x] == pytest.approx(2.0, abs=0.1)
+    assert thickness[300 - y, 140 - x] == pytest.approx(8.0, abs=0.1)
+    # nothing outside the wall
+    assert not mask[300 - y, 400 - x] and thickness[300 - y, 400 - x] == 0.0
+    assert thickness[0, 0] == 0.0
+
+
+@pytest.mark.parametrize("circumferences, size, unchanged", [
+    ([circle(300, 300, 100), circle(300, 300, 100)], 600, True),  # no wall at all
+    ([circle(300, 300, 100), circle(300, 300, 80)], 600, False),  # even wall
+    ([circle(30, 30, 25), circle(30, 30, 12)], 60, False),        # too small for the color scale
+])
+def test_heatmap_of_unusual_slices(backend, circumferences, size, unchanged):
+    backend["__original_image"] = np.full((size, size, 3), 255, dtype=np.uint8)
+    backend["__slices"] = [circumferences]
+    bsc.set_pixels_per_metric(10.0)
+
+    plain = np.asarray(bsc.get_slice_roi(0))
+    with_heatmap = np.asarray(bsc.get_slice_roi(0, heatmap=True))
+
+    assert plain.shape == with_heatmap.shape
+    assert np.array_equal(plain, with_heatmap) == unchanged
+
+
+def test_export_slice_image(backend, tmp_path):
+    backend["__original_image"] = np.full((600, 600, 3), 255, dtype=np.uint8)
+    backend["__slices"] = [eccentric_ring()]
+    bsc.set_pixels_per_metric(10.0)
+
+    path = str(tmp_path / "slice.png")
+    assert bsc.save_slice_image(path, heatmap=True)
+    assert cv2.imread(path).shape == (401, 401, 3)
+
+    assert not bsc.save_slice_image(str(tmp_path / "missing" / "slice.png"))
+    assert not bsc.save_slice_image(str(tmp_path / "slice.unknown"))
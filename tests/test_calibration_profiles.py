@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+
+from backend import calibration_profiles
+from backend.calibration_profiles import HISTORY_LENGTH, load_profile, profile_path, save_profile
+
+
+SENSORS = {
+    "ir_sensors": [{"xi": 16.0, "yi": 0.0, "xf": 1.58, "yf": 0.0, "r": 14.42, "devAngle": 0.0}],
+    "ultrasonic": {"factor": 1.02},
+}
+
+
+def test_path_is_safe_for_any_device_id(tmp_path):
+    path = profile_path(32.0, "COM3/ttyACM0 + 75833", str(tmp_path))
+
+    assert os.path.dirname(path) == str(tmp_path)
+    assert os.path.basename(path) == "ring_32.00_COM3_ttyACM0_75833.json"
+
+
+def test_round_trip(tmp_path):
+    directory = str(tmp_path / "calibration")
+    saved = save_profile(32.0, "A1", SENSORS, {"calibration_obj_radius": 1.58}, directory=directory)
+
+    loaded = load_profile(32.0, "A1", directory=directory)
+
+    assert loaded == saved
+    assert loaded["revision"] == 1
+    assert loaded["ir_sensors"] == SENSORS["ir_sensors"]
+    assert loaded["settings"] == {"calibration_obj_radius": 1.58}
+    assert loaded["history"] == []
+    # no temporary file left behind
+    assert os.listdir(directory) == [os.path.basename(profile_path(32.0, "A1"))]
+
+
+def test_revisions_keep_a_bounded_history(tmp_path):
+    directory = str(tmp_path)
+    for i in range(HISTORY_LENGTH + 3):
+        save_profile(32.0, "A1", dict(SENSORS, ultrasonic={"factor": float(i)}), directory=directory)
+
+    profile = load_profile(32.0, "A1", directory=directory)
+
+    assert profile["revision"] == HISTORY_LENGTH + 3
+    assert len(profile["history"]) == HISTORY_LENGTH
+    # newest first, without nested histories
+    assert [p["revision"] for p in profile["history"][:2]] == [HISTORY_LENGTH + 2, HISTORY_LENGTH + 1]
+    assert "history" not in profile["history"][0]
+
+
+def test_profiles_are_per_ring_and_device(tmp_path):
+    directory = str(tmp_path)
+    save_profile(32.0, "A1", SENSORS, directory=directory)
+
+    assert load_profile(30.0, "A1", directory=directory) is None
+    assert load_profile(32.0, "B2", directory=directory) is None
+
+
+@pytest.mark.parametrize("content", ["{not json", json.dumps({"format": 99})])
+def test_unusable_files_are_ignored(tmp_path, content):
+    directory = str(tmp_path)
+    with open(profile_path(32.0, "A1", directory), "w") as f:
+        f.write(content)
+
+    assert load_profile(32.0, "A1", directory=directory) is None
+
+
+def test_unwritable_directory(tmp_path):
+    blocker = tmp_path / "calibration"
+    blocker.write_text("a file, not a directory")
+
+    assert save_profile(32.0, "A1", SENSORS, directory=str(blocker)) is None
@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+from serial import SerialException
+
+from backend import arduino_simulator, sensors_manager
+
+
+@pytest.fixture
+def simulator():
+    def install(**kwargs):
+        kwargs.setdefault("rate", None)
+        return arduino_simulator.install(seed=0, **kwargs)
+
+    yield install
+
+    if sensors_manager.isPortOpen:
+        sensors_manager.closeArduinoSerial()
+    sensors_manager.resetSerialBackend()
+    sensors_manager.setFrameFilter("none")
+
+
+@pytest.fixture
+def frames(monkeypatch):
+    # replaces the Arduino with a list of frames; the last one repeats forever
+    def feed(*sequence):
+        remaining = [np.array(frame, dtype=float) for frame in sequence]
+        monkeypatch.setattr(sensors_manager, "readSensorFrame",
+                            lambda: remaining.pop(0) if len(remaining) > 1 else remaining[0])
+
+    monkeypatch.setattr(sensors_manager, "captureTimeBudget", 0.2)
+    yield feed
+
+    sensors_manager.setFrameFilter("none")
+    sensors_manager.sensorBank.reset()
+
+
+@pytest.fixture
+def adaptive(monkeypatch):
+    monkeypatch.setattr(sensors_manager, "adaptiveCapture", True)
+
+
+def test_fixed_capture_is_the_default():
+    assert not sensors_manager.adaptiveCapture
+
+
+def test_fixed_capture_takes_the_configured_samples(simulator, monkeypatch):
+    monkeypatch.setattr(sensors_manager, "numberOfSamples", 7)
+    simulator(sensors=6, noise=0.05)
+
+    data = sensors_manager.getCleanSensorData()
+
+    assert sensors_manager.getLastCaptureSampleCounts() == [7] * 7
+    np.testing.assert_allclose(data[:-1], 11.0, atol=0.1)
+
+
+def test_adaptive_capture_stops_early_on_steady_readings(simulator, adaptive):
+    simulator(sensors=6, noise=0.01)
+
+    sensors_manager.getCleanSensorData()
+
+    counts = sensors_manager.getLastCaptureSampleCounts()
+    assert min(counts) >= sensors_manager.minNumberOfSamples
+    assert max(counts) < sensors_manager.maxNumberOfSamples
+
+
+def test_adaptive_capture_samples_noisy_sensors_longer(simulator, adaptive):
+    simulator(sensors=6, noise=0.3)
+
+    data = sensors_manager.getCleanSensorData()
+
+    assert max(sensors_manager.getLastCaptureSampleCounts()) > 10
+    np.testing.assert_allclose(data[:-1], 11.0, atol=0.3)
+
+
+def test_adaptive_capture_ignores_spikes(simulator, adaptive):
+    simulator(sensors=6, noise=0.05, spike_rate=0.05, spike_size=8.0)
+
+    data = sensors_manager.getCleanSensorData()
+
+    np.testing.assert_allclose(data[:-1], 11.0, atol=0.15)
+
+
+@pytest.mark.parametrize("adaptive_capture", [False, True])
+def test_truncated_first_frame_is_skipped(frames, monkeypatch, adaptive_capture):
+    monkeypatch.setattr(sensors_manager, "adaptiveCapture", adaptive_capture)
+    # the tail of a line cut by the buffer flush still parses
+    frames([3.0, 11.0, 11.0, 20.1], [11.0] * 12 + [20.1])
+
+    data = sensors_manager.getCleanSensorData()
+
+    assert data == [11.0] * 12 + [20.1]
+    assert min(sensors_manager.getLastCaptureSampleCounts()) >= sensors_manager.minNumberOfSamples
+
+
+def test_short_frames_are_skipped_when_the_ring_is_known(frames, monkeypatch):
+    monkeypatch.setattr(sensors_manager, "numberOfSamples", 3)
+    sensors_manager.sensorBank.place_on_ring(16.0, 12)
+    frames([3.0, 11.0, 20.1], [11.0] * 12 + [20.1], [3.0, 11.0, 20.1], [11.0] * 12 + [20.1])
+
+    assert sensors_manager.getCleanSensorData() == [11.0] * 12 + [20.1]
+    assert sensors_manager.getLastCaptureSampleCounts() == [3] * 13
+
+
+@pytest.mark.parametrize("adaptive_capture", [False, True])
+def test_capture_gives_up_when_out_of_time(frames, monkeypatch, adaptive_capture):
+    monkeypatch.setattr(sensors_manager, "adaptiveCapture", adaptive_capture)
+    # one complete frame, then only truncated ones
+    frames([11.0] * 12 + [20.1], [11.0, 20.1])
+
+    assert sensors_manager.getCleanSensorData() == [11.0] * 12 + [20.1]
+    assert sensors_manager.getLastCaptureSampleCounts() == [1] * 13
+
+
+def test_capture_fails_without_a_complete_frame(frames):
+    sensors_manager.sensorBank.place_on_ring(16.0, 12)
+    frames([11.0, 20.1])
+
+    with pytest.raises(SerialException):
+        sensors_manager.getCleanSensorData()
+
+
+def test_captures_ignore_the_display_filter(simulator, adaptive, monkeypatch):
+    monkeypatch.setattr(sensors_manager, "adaptiveTolerance", 0.02)
+    counts = {}
+    for name in ("none", "ema", "kalman"):
+        # same seed, same frames
+        simulator(sensors=6, noise=0.1)
+        sensors_manager.setFrameFilter(name)
+        sensors_manager.getCleanSensorData()
+        counts[name] = sensors_manager.getLastCaptureSampleCounts()
+        sensors_manager.closeArduinoSerial()
+
+    # filtered readings are correlated; they would make the capture stop early
+    assert counts["ema"] == counts["kalman"] == counts["none"]
@@ -0,0 +1,134 @@
+import os
+import warnings
+
+import numpy as np
+import pytest
+
+from backend import bpc
+from backend.capture_journal import CaptureJournal, journal_summary, read_journal, replay_journal
+from backend.measurement_store import MeasurementStore
+
+
+def capture(z):
+    return [z + 0.1, z + 0.2, z]
+
+
+def write_session(path):
+    # 4 captures left: 1, 2, 4, 5
+    journal = CaptureJournal.create(path, 3, {"sample_description": "test"})
+    for z in (3.0, 1.0, 2.0, 6.0):
+        journal.append_add(capture(z))
+    journal.append_delete([3, 2])
+    for z in (5.0, 4.0):
+        journal.append_add(capture(z))
+    journal.close()
+
+
+def replay(path):
+    store = MeasurementStore()
+    metadata = replay_journal(path, store)
+    return metadata, store
+
+
+def test_replay_rebuilds_the_session(tmp_path):
+    path = str(tmp_path / "session.journal")
+    write_session(path)
+
+    metadata, store = replay(path)
+
+    assert metadata == {"sample_description": "test"}
+    np.testing.assert_array_equal(store.rows(), [capture(z) for z in (1.0, 2.0, 4.0, 5.0)])
+    assert journal_summary(path) == (metadata, 4)
+
+
+def test_a_torn_record_at_the_end_is_ignored(tmp_path):
+    path = str(tmp_path / "session.journal")
+    write_session(path)
+    size = os.path.getsize(path)
+
+    with open(path, "r+b") as f:
+        f.truncate(size - 5)
+
+    metadata, store = replay(path)
+    # the last add was torn
+    assert store.z().tolist() == [1.0, 2.0, 5.0]
+
+    # nothing read past a complete record
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert journal_summary(path)[1] == 3
+
+
+def test_replay_stops_at_a_corrupted_record(tmp_path):
+    path = str(tmp_path / "session.journal")
+    write_session(path)
+    (_, _, records, end) = read_journal(path)
+    record_size = records.dtype.itemsize
+
+    # flip a byte of the values of the 5th record, the first deletion
+    with open(path, "r+b") as f:
+        f.seek(end - 4 * record_size + 10)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xff]))
+
+    metadata, store = replay(path)
+    assert store.z().tolist() == [1.0, 2.0, 3.0, 6.0]
+
+
+def test_resume_cuts_off_the_torn_tail_and_keeps_appending(tmp_path):
+    path = str(tmp_path / "session.journal")
+    write_session(path)
+    with open(path, "ab") as f:
+        f.write(b"\x01\x00\x00")
+
+    journal = CaptureJournal.resume(path)
+    journal.append_add(capture(0.5))
+    journal.close()
+
+    metadata, store = replay(path)
+    assert store.z().tolist() == [0.5, 1.0, 2.0, 4.0, 5.0]
+
+
+def test_not_a_journal(tmp_path):
+    path = str(tmp_path / "session.journal")
+    with open(path, "wb") as f:
+        f.write(b"something else entirely")
+
+    with pytest.raises(ValueError):
+        read_journal(path)
+    with pytest.raises(ValueError):
+        journal_summary(path)
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setattr(bpc, "JOURNAL_PATH", str(tmp_path / "sessions" / "bpc_session.journal"))
+    bpc.reset_bpc_backend()
+    yield bpc.JOURNAL_PATH
+    bpc.reset_bpc_backend()
+
+
+def test_unsaved_session_is_restored(session):
+    bpc.set_sampleDescription("pole 7")
+    for z in (2.0, 1.0, 3.0):
+        bpc.save_measurements(capture(z))
+    bpc.delete_measurement([0])
+
+    # left unsaved, e.g. a crash
+    bpc.reset_bpc_backend()
+    assert bpc.find_unsaved_session() == 2
+
+    assert bpc.restore_session() == 2
+    assert bpc.sample_description == "pole 7"
+    assert bpc.saved_measurement.z().tolist() == [2.0, 3.0]
+
+
+def test_discarded_session_is_not_offered_again(session):
+    bpc.save_measurements(capture(1.0))
+
+    bpc.discard_journal()
+    bpc.reset_bpc_backend()
+
+    assert not os.path.exists(session)
+    assert bpc.find_unsaved_session() == 0
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from backend import instrumentation
+from backend.instrumentation import Histogram
+
+
+@pytest.fixture
+def recording():
+    instrumentation.reset()
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def test_histogram_is_exact_for_count_total_min_and_max():
+    histogram = Histogram()
+    for ms in (1, 2, 3, 4, 100):
+        histogram.add(ms / 1000.0)
+
+    snapshot = histogram.snapshot()
+
+    assert snapshot["count"] == 5
+    assert snapshot["total_ms"] == pytest.approx(110.0)
+    assert snapshot["min_ms"] == pytest.approx(1.0)
+    assert snapshot["max_ms"] == pytest.approx(100.0)
+    # percentiles are bucket bounds, within a factor of 2
+    assert 3.0 <= snapshot["p50_ms"] <= 6.0
+    assert snapshot["p99_ms"] == pytest.approx(100.0)
+
+
+def test_nothing_is_recorded_while_disabled():
+    instrumentation.reset()
+
+    @instrumentation.timed("test.disabled")
+    def work():
+        return 42
+
+    assert work() == 42
+    instrumentation.count("test.disabled")
+    with instrumentation.span("test.disabled"):
+        pass
+
+    snapshot = instrumentation.snapshot()
+    assert snapshot["timers"] == {} and snapshot["counters"] == {}
+
+
+def test_timers_counters_and_export(recording, tmp_path):
+    @instrumentation.timed()
+    def work():
+        raise ValueError
+
+    for i in range(3):
+        with pytest.raises(ValueError):
+            work()
+    with instrumentation.span("test.span"):
+        pass
+    instrumentation.count("test.counter", 5)
+    instrumentation.count("test.counter")
+
+    path = str(tmp_path / "timings.json")
+    assert instrumentation.export_json(path)
+    with open(path) as f:
+        exported = json.load(f)
+
+    assert exported["timers"]["%s.work" % __name__]["count"] == 3
+    assert exported["timers"]["test.span"]["count"] == 1
+    assert exported["counters"] == {"test.counter": 6}
@@ -0,0 +1,55 @@
+import logging
+
+import pytest
+
+from backend import logs
+
+
+@pytest.fixture
+def backend_logger():
+    yield logging.getLogger(logs.ROOT_LOGGER)
+
+    # leave the loggers as the other tests expect them
+    for name in (logs.ROOT_LOGGER, "backend.bsc"):
+        logger = logging.getLogger(name)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        logger.setLevel(logging.NOTSET)
+        logger.propagate = True
+
+
+def test_parse_levels():
+    assert logs.parse_levels(" backend.bsc = debug ,backend.bpc=info,junk,") == \
+        {"backend.bsc": "DEBUG", "backend.bpc": "INFO"}
+    assert logs.parse_levels("") == {}
+
+
+def test_configure_sets_levels_and_replaces_handlers(backend_logger, tmp_path):
+    log_file = str(tmp_path / "nested" / "scanner.log")
+
+    logs.configure(level="INFO", levels={"backend.bsc": "DEBUG"}, log_file=log_file)
+    logs.configure(level="INFO", levels={"backend.bsc": "DEBUG"}, log_file=log_file)
+
+    assert backend_logger.level == logging.INFO
+    assert logging.getLogger("backend.bsc").level == logging.DEBUG
+    assert not backend_logger.propagate
+    assert len(backend_logger.handlers) == 2
+
+    logging.getLogger("backend.bsc").debug("slice %d", 3)
+    for handler in backend_logger.handlers:
+        handler.flush()
+
+    with open(log_file) as f:
+        assert "backend.bsc: slice 3" in f.read()
+
+
+def test_configure_from_env_can_disable_the_file(backend_logger, monkeypatch):
+    monkeypatch.setenv("BAMBOO_LOG_LEVEL", "debug")
+    monkeypatch.setenv("BAMBOO_LOG_FILE", "")
+    monkeypatch.delenv("BAMBOO_LOG_LEVELS", raising=False)
+
+    logs.configure_from_env()
+
+    assert backend_logger.level == logging.DEBUG
+    assert len(backend_logger.handlers) == 1
@@ -0,0 +1,95 @@
+import threading
+
+import numpy as np
+
+from backend.measurement_store import MeasurementStore
+
+
+def capture(z, sensors=3):
+    # readings that tell the captures apart
+    return [z * 10 + i for i in range(sensors)] + [z]
+
+
+def test_rows_stay_sorted_by_z_after_interleaved_add_and_delete():
+    store = MeasurementStore(capacity=2)
+
+    for z in (5.0, 1.0, 3.0):
+        store.add(capture(z))
+    # rows: 1, 3, 5
+    store.delete([1])
+    for z in (4.0, 0.5, 6.0):
+        store.add(capture(z))
+    # rows: 0.5, 1, 4, 5, 6
+    store.delete([0, 3])
+    store.add(capture(2.0))
+
+    assert store.z().tolist() == [1.0, 2.0, 4.0, 6.0]
+    np.testing.assert_array_equal(store.rows(), [capture(z) for z in (1.0, 2.0, 4.0, 6.0)])
+    assert len(store) == 4
+
+
+def test_captures_with_the_same_z_keep_their_order():
+    store = MeasurementStore()
+
+    store.add([1.0, 2.0])
+    store.add([0.0, 1.0])
+    store.add([3.0, 2.0])
+    store.extend([[4.0, 2.0], [5.0, 1.0]])
+
+    assert store.readings()[:, 0].tolist() == [0.0, 5.0, 1.0, 3.0, 4.0]
+
+
+def test_extend_matches_adding_one_by_one():
+    rng = np.random.RandomState(0)
+    rows = rng.randint(0, 20, size=(100, 4)).astype(float)
+
+    one_by_one = MeasurementStore(capacity=4)
+    for row in rows:
+        one_by_one.add(row)
+
+    at_once = MeasurementStore(capacity=4)
+    at_once.extend(rows[:30])
+    at_once.extend(rows[30:])
+
+    np.testing.assert_array_equal(one_by_one.rows(), at_once.rows())
+
+
+def test_find_and_range_z():
+    store = MeasurementStore()
+    store.extend([capture(z) for z in (1.0, 2.0, 4.0)])
+
+    assert store.find_z(2.9) == 1
+    assert store.find_z(3.1) == 2
+    assert store.find_z(-10.0) == 0
+    assert store.range_z(1.5, 4.0)[:, -1].tolist() == [2.0, 4.0]
+    assert MeasurementStore().find_z(1.0) is None
+    assert MeasurementStore().range_z(0.0, 1.0).size == 0
+
+
+def test_snapshots_do_not_change_with_the_store():
+    store = MeasurementStore()
+    store.extend([capture(z) for z in (2.0, 3.0)])
+
+    rows = store.rows()
+    store.add(capture(1.0))
+    store.delete([2])
+
+    assert rows[:, -1].tolist() == [2.0, 3.0]
+
+
+def test_concurrent_adds_are_all_kept():
+    store = MeasurementStore(capacity=1)
+
+    def add_many(offset):
+        for i in range(200):
+            store.add(capture(offset + i * 0.01))
+
+    threads = [threading.Thread(target=add_many, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    zs = store.z()
+    assert len(zs) == 800
+    assert np.all(np.diff(zs) >= 0)
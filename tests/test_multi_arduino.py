@@ -0,0 +1,65 @@
+import time
+
+import pytest
+from serial import SerialException
+
+from backend import arduino_simulator, sensors_manager
+
+
+@pytest.fixture(autouse=True)
+def serial_backend():
+    yield
+    sensors_manager.resetSerialBackend()
+
+
+class SilentDevice(object):
+    # never answers the START handshake
+    def write(self, data):
+        return len(data)
+
+    def readline(self):
+        time.sleep(0.01)
+        return b""
+
+    def close(self):
+        pass
+
+
+def test_frames_of_every_board_are_merged():
+    devices = arduino_simulator.install_many(3, sensors=12, rate=100.0, noise=0.0, z=20.0)
+
+    ser = sensors_manager.MultiArduinoSerial(sensors_manager.findArduinoPorts(), maxSkew=0.2)
+    try:
+        frame = sensors_manager.parseSensorLine(ser.readline())
+    finally:
+        ser.close()
+
+    assert len(frame) == 13
+    assert frame[-1] == 20.0
+    assert all(not device.is_open for device in devices)
+
+
+def test_any_error_while_opening_is_reported():
+    device = arduino_simulator.VirtualArduino(rate=100.0)
+
+    def factory(port):
+        if port == "BROKEN":
+            raise ValueError("garbled settings")
+        return device.open()
+
+    sensors_manager.setSerialBackend(factory, ports=["VIRTUAL0", "BROKEN"])
+
+    with pytest.raises(SerialException, match="BROKEN"):
+        sensors_manager.MultiArduinoSerial(["VIRTUAL0", "BROKEN"], openTimeout=5)
+
+
+def test_opening_gives_up_on_a_board_that_does_not_answer():
+    device = arduino_simulator.VirtualArduino(rate=100.0)
+    sensors_manager.setSerialBackend(lambda port: device.open() if port == "VIRTUAL0" else SilentDevice(),
+                                     ports=["VIRTUAL0", "SILENT"])
+
+    start = time.perf_counter()
+    with pytest.raises(SerialException, match="SILENT"):
+        sensors_manager.MultiArduinoSerial(["VIRTUAL0", "SILENT"], openTimeout=0.5)
+
+    assert time.perf_counter() - start < 3
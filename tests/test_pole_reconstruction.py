@@ -0,0 +1,121 @@
+import struct
+
+import numpy as np
+import pytest
+
+from backend import sensors_manager
+from backend.arduino_simulator import VirtualArduino
+from backend.pole_reconstruction import reconstruct_pole, pole_metrics, export_mesh, fit_slice_contours
+
+
+def pole(radius=5.0, center=(0.0, 0.0), zs=np.linspace(10.0, 55.0, 10), sensors=12):
+    # noise-free readings of the simulated ring: the distance from each sensor to the surface of the pole
+    arduino = VirtualArduino(sensors=sensors, pole_radius=radius, pole_center=center, noise=0.0)
+
+    return np.column_stack((np.tile(arduino.expected_readings(), (len(zs), 1)), zs))
+
+
+@pytest.fixture(autouse=True)
+def uncalibrated():
+    sensors_manager.sensorBank.reset()
+    yield
+    sensors_manager.sensorBank.reset()
+
+
+def test_centered_pole():
+    model = reconstruct_pole(pole(), z_factor=1.0)
+    metrics = pole_metrics(model)
+
+    assert metrics["length"] == 45.0
+    assert metrics["mean_diameter"] == pytest.approx(10.0, rel=0.01)
+    assert metrics["volume"] == pytest.approx(np.pi * 25.0 * 45.0, rel=0.01)
+    assert metrics["taper"] == pytest.approx(0.0, abs=1e-6)
+    assert metrics["max_centerline_deviation"] == 0.0
+    assert np.all(np.isfinite(model["vertices"]))
+
+
+def test_off_center_and_tilted_poles_are_not_mirrored():
+    model = reconstruct_pole(pole(center=(2.0, 1.0)), z_factor=1.0)
+    assert model["centers"] == pytest.approx(np.tile([2.0, 1.0], (len(model["z"]), 1)), abs=0.01)
+    assert pole_metrics(model)["mean_diameter"] == pytest.approx(10.0, rel=0.01)
+
+    # leaning towards +x by 0.02 cm per cm
+    zs = np.linspace(10.0, 55.0, 10)
+    rows = np.concatenate([pole(center=(0.02 * (z - 10.0), 0.0), zs=[z]) for z in zs])
+    model = reconstruct_pole(rows, z_factor=1.0)
+
+    assert model["centers"][[0, -1]] == pytest.approx(np.array([[0.0, 0.0], [0.9, 0.0]]), abs=0.01)
+    assert pole_metrics(model)["max_centerline_deviation"] == 0.0
+
+
+def test_calibrated_sensors():
+    bank = sensors_manager.sensorBank
+    bank.place_on_ring(16.0, 12)
+    calibration = VirtualArduino(pole_radius=1.58, noise=0.0)
+    bank.calibrate(np.append(calibration.expected_readings(), 10.0), 1.58, 10.0)
+
+    assert pole_metrics(reconstruct_pole(pole()))["mean_diameter"] == pytest.approx(10.0, rel=0.01)
+
+
+def test_structure_radius_of_uncalibrated_sensors():
+    arduino = VirtualArduino(ring_diameter=40.0, pole_radius=5.0, noise=0.0)
+    rows = np.column_stack((np.tile(arduino.expected_readings(), (2, 1)), [0.0, 10.0]))
+
+    metrics = pole_metrics(reconstruct_pole(rows, structure_radius=20.0))
+    assert metrics["mean_diameter"] == pytest.approx(10.0, rel=0.01)
+
+
+def test_z_is_calibrated():
+    sensors_manager.sensorBank.z_factor = 2.0
+    assert pole_metrics(reconstruct_pole(pole()))["length"] == 90.0
+
+    assert pole_metrics(reconstruct_pole(pole(), z_factor=0.5))["length"] == 22.5
+
+
+def test_incomplete_and_degenerate_slices_are_skipped():
+    rows = pole()
+    # nothing seen at all, and only the sensors at 0 and 180 degrees seeing something
+    rows[1, :-1] = 0.0
+    rows[3, :-1] = 30.0
+    rows[3, [0, 6]] = 11.0
+
+    model = reconstruct_pole(rows, z_factor=1.0)
+
+    assert np.all(np.isfinite(model["vertices"]))
+    assert np.all(np.isfinite(model["centers"]))
+    assert pole_metrics(model)["length"] == 45.0
+    assert pole_metrics(model)["mean_diameter"] == pytest.approx(10.0, rel=0.01)
+
+
+def test_not_enough_slices_or_readings():
+    rows = pole()
+    rows[1:, :-1] = 0.0
+    with pytest.raises(ValueError):
+        reconstruct_pole(rows)
+
+    with pytest.raises(ValueError):
+        reconstruct_pole(pole(sensors=2))
+    with pytest.raises(ValueError):
+        fit_slice_contours(np.zeros((4, 2, 2)))
+
+
+@pytest.mark.parametrize("extension", [".stl", ".ply"])
+def test_export(tmp_path, extension):
+    model = reconstruct_pole(pole())
+    path = str(tmp_path / ("pole" + extension))
+
+    assert export_mesh(model, path)
+
+    with open(path, "rb") as f:
+        data = f.read()
+    if extension == ".stl":
+        (triangles,) = struct.unpack_from("<I", data, 80)
+        assert triangles == len(model["faces"])
+        assert len(data) == 84 + 50 * triangles
+    else:
+        assert data.startswith(b"ply\n")
+        assert b"element vertex %d\n" % len(model["vertices"]) in data
+
+
+def test_export_to_a_missing_directory(tmp_path):
+    assert not export_mesh(reconstruct_pole(pole()), str(tmp_path / "missing" / "pole.stl"))
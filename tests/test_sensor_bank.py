@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from backend import sensors_manager
+from backend.arduino_simulator import VirtualArduino
+from backend.sensor_bank import SensorBank
+
+RING_RADIUS = 16.0
+TEST_RADIUS = 1.58
+TEST_DISTANCE = 10.0
+
+
+def calibration_reading(sensors=12, center=(0.0, 0.0), z=8.0):
+    device = VirtualArduino(sensors=sensors, ring_diameter=2 * RING_RADIUS, pole_radius=TEST_RADIUS,
+                            pole_center=center, noise=0.0)
+    return np.append(device.expected_readings(), z)
+
+
+@pytest.fixture
+def bank():
+    bank = SensorBank()
+    bank.place_on_ring(RING_RADIUS, 12)
+    bank.calibrate(calibration_reading(), TEST_RADIUS, TEST_DISTANCE)
+    return bank
+
+
+def test_sensors_are_placed_evenly_on_the_ring():
+    bank = SensorBank()
+    bank.place_on_ring(RING_RADIUS, 4)
+
+    assert len(bank) == 4
+    assert not bank.is_calibrated()
+    np.testing.assert_allclose(bank.start, [[16, 0], [0, 16], [-16, 0], [0, -16]], atol=1e-12)
+
+
+def test_calibration_against_a_centered_object(bank):
+    assert bank.is_calibrated()
+    # aimed at the center of the ring, within the resolution of the test points
+    np.testing.assert_allclose(bank.dev_angle, 0.0, atol=0.1)
+    np.testing.assert_allclose(bank.r, RING_RADIUS - TEST_RADIUS, atol=1e-3)
+    assert bank.z_factor == TEST_DISTANCE / 8.0
+    assert bank.z([8.0, 4.0]).tolist() == [10.0, 5.0]
+
+
+def test_points_land_on_the_surface(bank):
+    device = VirtualArduino(sensors=12, ring_diameter=2 * RING_RADIUS, pole_radius=5.0, noise=0.0)
+    readings = device.expected_readings()
+
+    points = bank.to_points(readings)
+    np.testing.assert_allclose(np.hypot(points[:, 0], points[:, 1]), 5.0, atol=0.01)
+
+    # a batch of frames gives the same points, frame by frame
+    batch = bank.to_points(np.stack((readings, readings + 1.0)))
+    assert batch.shape == (2, 12, 2)
+    np.testing.assert_array_equal(batch[0], points)
+    np.testing.assert_array_equal(batch[1], bank.to_points(readings + 1.0))
+
+
+def test_profile_round_trip(bank):
+    loaded = SensorBank()
+    loaded.load_profile(bank.to_profile())
+
+    for name in ("start", "end", "r", "dev_angle"):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(bank, name))
+    assert loaded.z_factor == bank.z_factor
+    assert loaded.deviations() == bank.deviations()
+
+
+def test_reset_forgets_the_calibration(bank):
+    bank.reset()
+
+    assert len(bank) == 0
+    assert not bank.is_calibrated()
+
+
+@pytest.fixture
+def ring(bank):
+    sensors_manager.sensorBank.load_profile(bank.to_profile())
+    yield sensors_manager.sensorBank
+    sensors_manager.sensorBank.reset()
+
+
+def test_validation_passes_for_the_same_setup(ring):
+    report = sensors_manager.validateCalibration(calibration_reading().tolist(), TEST_RADIUS, TEST_DISTANCE)
+
+    assert not report["drift"]
+    assert report["max_ir_error"] < 0.01
+    assert report["z_error"] == 0.0
+
+
+@pytest.mark.parametrize("center, z", [((1.0, 0.0), 8.0), ((0.0, 0.0), 9.0)])
+def test_validation_detects_drift(ring, center, z):
+    report = sensors_manager.validateCalibration(calibration_reading(center=center, z=z).tolist(), TEST_RADIUS,
+                                                 TEST_DISTANCE)
+
+    assert report["drift"]
+
+
+def test_validation_of_an_uncalibrated_ring():
+    sensors_manager.sensorBank.reset()
+
+    assert sensors_manager.validateCalibration(calibration_reading().tolist(), TEST_RADIUS, TEST_DISTANCE)["drift"]
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from backend.sensor_filters import FILTER_NAMES, FILTERS, FILTER_LABELS, create_filter
+
+
+def noisy_frames(frames=300, sensors=4, value=10.0, noise=0.2, seed=0):
+    rng = np.random.RandomState(seed)
+    return value + rng.normal(0.0, noise, size=(frames, sensors))
+
+
+def run(frame_filter, frames):
+    return np.array([frame_filter.update(frame) for frame in frames])
+
+
+def test_every_filter_is_named_and_labelled():
+    assert set(FILTER_NAMES) == set(FILTERS) == set(FILTER_LABELS)
+
+    with pytest.raises(ValueError):
+        create_filter("lowpass", 4)
+
+
+def test_none_passes_frames_through():
+    frames = noisy_frames(10)
+
+    np.testing.assert_array_equal(run(create_filter("none", 4), frames), frames)
+
+
+@pytest.mark.parametrize("name", ["ema", "median", "kalman"])
+def test_filters_reduce_noise(name):
+    frames = noisy_frames()
+
+    filtered = run(create_filter(name, 4), frames)[50:]
+
+    assert filtered.std(axis=0).max() < 0.6 * frames[50:].std(axis=0).min()
+    np.testing.assert_allclose(filtered.mean(axis=0), 10.0, atol=0.05)
+
+
+@pytest.mark.parametrize("name", ["ema", "median", "kalman"])
+def test_first_frame_seeds_the_filter_and_reset_starts_over(name):
+    frame_filter = create_filter(name, 2)
+    run(frame_filter, [[1.0, 2.0]] * 5)
+
+    frame_filter.reset()
+
+    np.testing.assert_array_equal(frame_filter.update([7.0, 8.0]), [7.0, 8.0])
+
+
+def test_median_ignores_isolated_spikes():
+    frames = np.full((20, 2), 5.0)
+    frames[[5, 12], 0] = 50.0
+
+    filtered = run(create_filter("median", 2, k=5), frames)
+
+    assert filtered.max() == 5.0
+
+
+def test_kalman_gain_settles():
+    frame_filter = create_filter("kalman", 1)
+    run(frame_filter, noisy_frames(200, sensors=1))
+
+    # steady-state variance of a random walk seen through the measurement noise
+    q, r = frame_filter.process_noise, frame_filter.measurement_noise
+    steady = (-q + np.sqrt(q * q + 4.0 * q * r)) / 2.0
+    assert frame_filter.variance[0] == pytest.approx(steady, rel=1e-3)
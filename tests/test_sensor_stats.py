@@ -0,0 +1,70 @@
+import numpy as np
+
+from backend.sensor_stats import StreamingSensorStats, WARM_UP
+
+
+def feed(stats, frames, mask=None):
+    for frame in frames:
+        stats.update(frame, mask=mask)
+
+
+def test_mean_and_stdev_match_numpy():
+    rng = np.random.RandomState(0)
+    frames = rng.normal(10.0, 0.5, size=(200, 4))
+
+    stats = StreamingSensorStats(4)
+    feed(stats, frames)
+
+    np.testing.assert_allclose(stats.mean, frames.mean(axis=0))
+    np.testing.assert_allclose(stats.stdev(), frames.std(axis=0, ddof=1))
+    assert stats.samples() == 200
+
+
+def test_clean_reading_ignores_outliers():
+    rng = np.random.RandomState(1)
+    frames = rng.normal(8.0, 0.05, size=(100, 3))
+    # spikes, once the median is seeded
+    frames[[10, 40, 70], 1] = 30.0
+
+    stats = StreamingSensorStats(3)
+    feed(stats, frames)
+
+    np.testing.assert_allclose(stats.clean(), 8.0, atol=0.05)
+    assert stats.mean[1] > 8.5
+    assert stats.clean_count[1] <= 97
+
+
+def test_mask_only_updates_selected_sensors():
+    stats = StreamingSensorStats(3)
+    feed(stats, np.full((10, 3), 5.0))
+    feed(stats, np.full((10, 3), 7.0), mask=[True, False, True])
+
+    assert stats.count.tolist() == [20, 10, 20]
+    assert stats.samples() == 10
+    assert stats.mean[1] == 5.0
+
+
+def test_standard_error_is_infinite_until_two_clean_readings():
+    stats = StreamingSensorStats(2)
+    assert np.all(np.isinf(stats.clean_standard_error()))
+
+    # warming up sensors report their mean
+    stats.update([1.0, 2.0])
+    assert stats.clean().tolist() == [1.0, 2.0]
+
+    feed(stats, [[1.0, 2.0]] * WARM_UP)
+    assert np.all(np.isfinite(stats.clean_standard_error()))
+
+
+def test_outlier_gate_is_2_sigma():
+    rng = np.random.RandomState(2)
+    stats = StreamingSensorStats(3)
+    feed(stats, rng.normal(10.0, 0.1, size=(5000, 3)))
+
+    # like the 2-sigma clipping of buffered samples: ~95.4% of normal readings pass
+    np.testing.assert_allclose(stats.clean_count / stats.count, 0.954, atol=0.01)
+    np.testing.assert_allclose(stats.gate(), 0.2, rtol=0.05)
+
+    count = stats.clean_count.copy()
+    stats.update(stats.clean_mean + [0.15, 0.25, -0.25])
+    assert (stats.clean_count - count).tolist() == [1, 0, 0]